@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 """
 聚合多个 LLM 评分结果
+
+评分结果来自 llm_grade.py --llm-replay 时，统计回放未命中（llm_replay_miss）的题目数，
+未命中的题目为 0 分，汇总结果不能当作完整的回归对比
 """
 import json
 import argparse
@@ -26,6 +29,7 @@ def aggregate_grades(input_files, output_file, summary_file):
     total_score = 0
     max_score = 0
     need_review_count = 0
+    replay_miss_count = 0
     
     for input_file in input_files:
         grade = load_grade(input_file)
@@ -39,6 +43,8 @@ def aggregate_grades(input_files, output_file, summary_file):
             # 检查是否需要审核
             if 'need_review' in grade.get('flags', []) or grade.get('need_review', False):
                 need_review_count += 1
+            if 'llm_replay_miss' in grade.get('flags', []):
+                replay_miss_count += 1
     
     # 计算总分
     final_score = total_score if max_score > 0 else 0
@@ -50,6 +56,7 @@ def aggregate_grades(input_files, output_file, summary_file):
         'max_score': final_max_score,
         'questions': len(grades),
         'need_review': need_review_count > 0,
+        'replay_misses': replay_miss_count,
         'details': grades
     }
     
@@ -64,6 +71,10 @@ def aggregate_grades(input_files, output_file, summary_file):
         f'**总分**: {final_score:.1f} / {final_max_score:.1f}',
         f'**题目数**: {len(grades)}',
         f'**需要人工审核**: {"是" if result["need_review"] else "否"}',
+    ]
+    if replay_miss_count:
+        summary_lines.append(f'**回放未命中**: {replay_miss_count} 题（按 0 分计）')
+    summary_lines += [
         '',
         '## 各题详情',
         ''
@@ -83,6 +94,8 @@ def aggregate_grades(input_files, output_file, summary_file):
         summary_lines.append(f'- **置信度**: {confidence:.2f}')
         if need_review:
             summary_lines.append('- ⚠️ **需要人工审核**')
+        if 'llm_replay_miss' in grade.get('flags', []):
+            summary_lines.append('- ⚠️ **回放目录中没有该题的录制**')
         
         # 显示分项评分
         if 'criteria' in grade:
@@ -100,6 +113,8 @@ def aggregate_grades(input_files, output_file, summary_file):
     
     print(f"✅ Aggregated {len(grades)} grades")
     print(f"   Total: {final_score:.1f} / {final_max_score:.1f}")
+    if replay_miss_count:
+        print(f"   Replay misses: {replay_miss_count}")
     print(f"   Output: {output_file}")
 
 
@@ -15,6 +15,8 @@ import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
+from junit_cache import JUnitCache, cache_key, default_cache_dir
+
 # 加载环境变量（支持从 .env 文件或环境变量读取）
 load_dotenv()
 
@@ -31,10 +33,16 @@ def commit_ts():
         return int(time.time())
 
 
-def parse_junit(junit_path):
+# 解析结果缓存的命名空间，解析逻辑变化时需更新
+CACHE_NAMESPACE = "grade:parse_junit:v1"
+
+
+def parse_junit(junit_path, cache=None):
     """
     解析 JUnit XML 报告
     
+    传入 cache（JUnitCache）时，以 XML 内容哈希查缓存，命中则跳过解析
+    
     Returns
     -------
     passed : int
@@ -47,6 +55,14 @@ def parse_junit(junit_path):
     if not os.path.exists(junit_path):
         return (0, 0, [])
     
+    key = None
+    if cache is not None:
+        key = cache_key(CACHE_NAMESPACE, [junit_path])
+        cached = cache.get(key)
+        if cached is not None:
+            print(f"♻️ 命中解析缓存 ({key[:12]})")
+            return (cached["passed"], cached["total"], cached["fails"])
+    
     try:
         root = ET.parse(junit_path).getroot()
         total = 0
@@ -65,6 +81,8 @@ def parse_junit(junit_path):
                 else:
                     passed += 1
         
+        if key is not None:
+            cache.put(key, {"passed": passed, "total": total, "fails": fails})
         return (passed, total, fails)
     except Exception as e:
         print(f"Error parsing JUnit XML: {e}", file=sys.stderr)
@@ -125,10 +143,16 @@ def main():
     parser.add_argument("--out", default="grade.json", help="Output JSON file")
     parser.add_argument("--summary", default="summary.md", help="Output summary markdown file")
     parser.add_argument("--bonus", default=None, help="Optional bonus file (e.g., lintr.rds)")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Parsed-result cache directory; caching is off unless this or $AUTOGRADE_CACHE_DIR is set")
+    parser.add_argument("--cache-max-mb", type=float, default=64, help="Cache size cap in MB (LRU eviction)")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-parse JUnit XML")
     args = parser.parse_args()
     
     # 解析 JUnit XML
-    passed, total, fails = parse_junit(args.junit)
+    cache = None
+    if args.cache_dir and not args.no_cache:
+        cache = JUnitCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+    passed, total, fails = parse_junit(args.junit, cache=cache)
     
     # 计算基础分数
     if total > 0:
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+按 token 预算打包 prompt 中的学生材料
+
+llm_evaluate.py 的每个维度有一个 prompt 总预算（token），扣除固定部分（评分说明、
+量表）后，剩余预算按优先级分配给各段材料（文档、源代码文件、命令输出、生成文件）：
+- 每段先保底 min_tokens（材料本身更短时按实际长度），保证每个文件都能看到开头
+- 剩余预算从高优先级（priority 数值小）到低优先级逐级分配，同一级内按 max-min 公平分配，
+  短的材料完整保留，长的材料平分剩下的预算，避免一个大文件挤掉其他文件
+- 超出分配的材料按 keep 截断：head 保留开头，tail 保留结尾（stderr 的 Traceback 在末尾），
+  head_tail 保留开头和结尾，截断处插入标记
+
+token 数为估计值：CJK 字符（汉字、假名、谚文、全角标点）约 1 token/字，其余约 4 字符/token。
+estimate_tokens 是评分脚本共用的唯一估计函数（chunked_grading、llm_grade、llm_evaluate 都从这里导入）。
+"""
+
+import re
+
+DEFAULT_MIN_TOKENS = 200
+
+_CJK_RANGES = (
+    ("\u3000", "\u303f"),  # CJK 标点
+    ("\u3040", "\u30ff"),  # 平假名、片假名
+    ("\u3400", "\u4dbf"),  # 扩展 A
+    ("\u4e00", "\u9fff"),  # 基本汉字
+    ("\uac00", "\ud7af"),  # 谚文
+    ("\uf900", "\ufaff"),  # 兼容汉字
+    ("\uff00", "\uffef"),  # 全角字符
+)
+_CJK_RE = re.compile("[" + "".join(f"{lo}-{hi}" for lo, hi in _CJK_RANGES) + "]")
+
+
+def _char_cost(ch):
+    if ch < "\u3000":
+        return 0.25
+    for lo, hi in _CJK_RANGES:
+        if lo <= ch <= hi:
+            return 1.0
+    return 0.25
+
+
+def estimate_tokens(text):
+    """估计 token 数（见模块说明），空文本为 0"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return int(cjk + (len(text) - cjk) * 0.25) + 1
+
+
+def _head(text, tokens):
+    """开头不超过 tokens 的部分"""
+    cost = 0.0
+    for i, ch in enumerate(text):
+        cost += _char_cost(ch)
+        if cost > tokens:
+            return text[:i]
+    return text
+
+
+def _tail(text, tokens):
+    """结尾不超过 tokens 的部分"""
+    cost = 0.0
+    for i in range(len(text) - 1, -1, -1):
+        cost += _char_cost(text[i])
+        if cost > tokens:
+            return text[i + 1:]
+    return text
+
+
+def truncate_to_tokens(text, tokens, keep="head"):
+    """把 text 截断到约 tokens 个 token，截断处插入标记；未超出时原样返回"""
+    total = estimate_tokens(text)
+    if total <= tokens:
+        return text
+    marker = f"\n...（已截断，原文约 {total} tokens）...\n"
+    tokens = max(tokens - estimate_tokens(marker), 0)
+    if keep == "tail":
+        return marker.lstrip("\n") + _tail(text, tokens)
+    if keep == "head_tail":
+        head_tokens = tokens * 2 // 3
+        return _head(text, head_tokens) + marker + _tail(text, tokens - head_tokens)
+    return _head(text, tokens) + marker.rstrip("\n")
+
+
+def fair_allocate(sizes, budget):
+    """max-min 公平分配：不超过 size 的前提下尽量平均，返回与 sizes 对应的分配"""
+    alloc = [0] * len(sizes)
+    pending = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    remaining = max(budget, 0)
+    while pending:
+        share = remaining // len(pending)
+        i = pending[0]
+        if sizes[i] <= share:
+            alloc[i] = sizes[i]
+            remaining -= sizes[i]
+            pending.pop(0)
+            continue
+        for i in pending:
+            alloc[i] = share
+        break
+    return alloc
+
+
+class PromptBudget:
+    """
+    一个 prompt 中各段材料的预算分配
+
+    用法：add() 登记各段材料，pack() 返回 {name: 截断后的文本}，trimmed 为被截断的段
+    """
+
+    def __init__(self, budget, min_tokens=DEFAULT_MIN_TOKENS):
+        self.budget = budget
+        self.min_tokens = min_tokens
+        self.sections = []
+        self.trimmed = []
+
+    def add(self, name, text, priority=0, keep="head"):
+        self.sections.append({"name": name, "text": text or "", "priority": priority, "keep": keep})
+
+    def pack(self):
+        sizes = [estimate_tokens(s["text"]) for s in self.sections]
+        floors = [min(size, self.min_tokens) for size in sizes]
+        if sum(floors) > self.budget:
+            # 预算连保底都不够时所有段公平分配
+            floors = fair_allocate(sizes, self.budget)
+        alloc = list(floors)
+        remaining = self.budget - sum(floors)
+        for priority in sorted({s["priority"] for s in self.sections}):
+            tier = [i for i, s in enumerate(self.sections) if s["priority"] == priority]
+            extra = fair_allocate([sizes[i] - floors[i] for i in tier], remaining)
+            for i, amount in zip(tier, extra):
+                alloc[i] += amount
+            remaining -= sum(extra)
+
+        packed = {}
+        self.trimmed = []
+        for section, size, tokens in zip(self.sections, sizes, alloc):
+            packed[section["name"]] = truncate_to_tokens(section["text"], tokens, section["keep"])
+            if tokens < size:
+                self.trimmed.append({"section": section["name"], "tokens": size, "kept_tokens": tokens})
+        return packed
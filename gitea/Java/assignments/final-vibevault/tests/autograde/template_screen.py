@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+提交文档与作业模板的相似度预筛
+
+很多提交的 REPORT.md / CHANGELOG.md 与模板完全相同或只改了几个字，调用 LLM 的结果
+必然是 0 分。评分前先把文档与模板（tests/llm/templates/ 下的副本）做比较：
+空白归一化后取字符 k-gram（shingle），计算 Jaccard 相似度。字符级 shingle 对中文同样
+有效，不依赖分词。相似度不低于阈值时直接在本地给出 0 分 + need_review，不调用 LLM。
+"""
+
+import os
+import re
+import sys
+
+DEFAULT_THRESHOLD = 0.9
+SHINGLE_SIZE = 5
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """合并连续空白并转小写，忽略排版差异"""
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """归一化文本的字符 k-gram 集合"""
+    text = normalize_text(text)
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def template_similarity(text, template_text, k=SHINGLE_SIZE):
+    """文档与模板的 shingle Jaccard 相似度（0-1）"""
+    return jaccard(shingles(text, k), shingles(template_text, k))
+
+
+def load_template(path):
+    """读取模板文件，不存在或读取失败返回 None（跳过预筛）"""
+    if not path:
+        return None
+    if not os.path.exists(path):
+        print(f"Warning: template {path} not found, skipping template pre-screen", file=sys.stderr)
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def screen(text, template_text, threshold=DEFAULT_THRESHOLD):
+    """
+    预筛一份文档，未提供模板时返回 None
+
+    返回 {"path": "template_match" | "llm", "similarity": float, "threshold": float}，
+    path 为 template_match 表示应在本地判 0 分而不调用 LLM
+    """
+    if template_text is None:
+        return None
+    similarity = template_similarity(text, template_text)
+    return {
+        "path": "template_match" if similarity >= threshold else "llm",
+        "similarity": round(similarity, 3),
+        "threshold": threshold,
+    }
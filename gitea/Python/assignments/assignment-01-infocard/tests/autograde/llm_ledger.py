@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+LLM 调用台账（token 与耗时）
+
+评分流程中每次 LLM 调用（含本地缓存命中和失败）向运行级台账追加一行 JSON：
+model、dimension、student_id、耗时、尝试次数、prompt/completion/上下文缓存命中 token。
+同一次 CI 运行中的多个评分步骤写入同一个文件（默认 .autograde/llm_ledger.jsonl，
+可用 $LLM_LEDGER_PATH 覆盖），create_minimal_metadata.py 把它放进 metadata.json。
+台账会预热熔断器和对冲等待时间，并作为审计数据上传，不能放在学生仓库可以提交的位置：
+workflow 每次重建 .autograde 并导出 LLM_LEDGER_PATH。
+
+汇总（按作业统计 p50/p95 耗时和 token 总量）：
+    python llm_ledger.py rollup course-metadata/ [--json]
+参数可以是 metadata.json、台账 .jsonl 文件或包含它们的目录
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+
+def default_ledger_path():
+    """$LLM_LEDGER_PATH 或 .autograde/llm_ledger.jsonl（本次运行的评分脚本目录）；调用时读取环境变量"""
+    return os.getenv("LLM_LEDGER_PATH") or os.path.join(".autograde", "llm_ledger.jsonl")
+
+
+class LLMLedger:
+    """追加写入的 JSONL 台账，可被多个评分线程共享"""
+
+    def __init__(self, path=None, context=None):
+        self.path = path or default_ledger_path()
+        self.context = {k: v for k, v in (context or {}).items() if v is not None}
+        self._lock = threading.Lock()
+
+    def record(self, **fields):
+        entry = {"ts": datetime.now().isoformat(timespec="seconds"), **self.context}
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"Warning: failed to write LLM ledger {self.path}: {e}", file=sys.stderr)
+
+
+class LedgerTimer:
+    """记录一次调用的起止时间，finish 时写入台账"""
+
+    def __init__(self, ledger, **fields):
+        self.ledger = ledger
+        self.fields = fields
+        self.start = time.perf_counter()
+
+    def finish(self, status, attempts=0, usage=None, error=None, **extra):
+        if self.ledger is None:
+            return
+        usage = usage or {}
+        self.ledger.record(
+            **self.fields,
+            status=status,
+            latency_s=round(time.perf_counter() - self.start, 3),
+            attempts=attempts,
+            retries=max(attempts - 1, 0),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            cache_hit_tokens=usage.get("cache_hit_tokens", 0),
+            error=str(error)[:200] if error else None,
+            **extra,
+        )
+
+
+def read_ledger(path):
+    """读取台账文件，跳过损坏的行；文件不存在返回空列表"""
+    if not path or not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: skipping malformed ledger line in {path}", file=sys.stderr)
+    return records
+
+
+def percentile(values, q):
+    """最近秩百分位数，values 为空返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize(records):
+    """汇总一组台账记录；耗时分位数只统计真正发出请求的调用（不含本地缓存命中和回放）"""
+    api_calls = [r for r in records if r.get("status") not in ("cache", "replay", "replay_miss")]
+    latencies = [r.get("latency_s", 0) for r in api_calls]
+    return {
+        "calls": len(records),
+        "api_calls": len(api_calls),
+        "local_cache_hits": sum(1 for r in records if r.get("status") == "cache"),
+        "replayed": sum(1 for r in records if r.get("status") == "replay"),
+        "replay_misses": sum(1 for r in records if r.get("status") == "replay_miss"),
+        "errors": sum(1 for r in records if r.get("status") == "error"),
+        "deferred": sum(1 for r in records if r.get("status") == "deferred"),
+        "retries": sum(r.get("retries", 0) for r in records),
+        "hedges": sum(r.get("hedges", 0) for r in records),
+        "prompt_tokens": sum(r.get("prompt_tokens", 0) for r in records),
+        "completion_tokens": sum(r.get("completion_tokens", 0) for r in records),
+        "cache_hit_tokens": sum(r.get("cache_hit_tokens", 0) for r in records),
+        "latency_p50_s": percentile(latencies, 50),
+        "latency_p95_s": percentile(latencies, 95),
+        "latency_total_s": round(sum(latencies), 3),
+    }
+
+
+def ledger_metadata(path=None, student_id=None):
+    """供 metadata.json 使用：{"calls": [...], "summary": {...}}，无台账返回 None"""
+    records = read_ledger(path or default_ledger_path())
+    if not records:
+        return None
+    if student_id:
+        for r in records:
+            r.setdefault("student_id", student_id)
+    return {"calls": records, "summary": summarize(records)}
+
+
+def _iter_sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(".jsonl") or name == "metadata.json":
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def load_records(paths):
+    """从 metadata.json（llm_ledger.calls）和 .jsonl 台账中收集记录，补全 assignment/student_id"""
+    records = []
+    for path in _iter_sources(paths):
+        if path.endswith(".jsonl"):
+            records.extend(read_ledger(path))
+            continue
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: skipping {path}: {e}", file=sys.stderr)
+            continue
+        for r in (metadata.get("llm_ledger") or {}).get("calls", []):
+            r.setdefault("assignment", metadata.get("assignment"))
+            r.setdefault("student_id", metadata.get("student_id"))
+            records.append(r)
+    return records
+
+
+def rollup(records):
+    """按作业汇总，额外给出每个作业的学生数"""
+    by_assignment = defaultdict(list)
+    for r in records:
+        by_assignment[r.get("assignment") or "unknown"].append(r)
+    result = {}
+    for assignment, rows in sorted(by_assignment.items()):
+        summary = summarize(rows)
+        summary["students"] = len({r.get("student_id") for r in rows if r.get("student_id")})
+        result[assignment] = summary
+    return result
+
+
+def format_rollup(result):
+    def fmt(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    lines = [
+        "| 作业 | 学生 | 调用 | 错误 | 重试 | p50 s | p95 s | 输入 token | 缓存命中 | 输出 token |",
+        "|------|------|------|------|------|-------|-------|-----------|----------|-----------|",
+    ]
+    for assignment, s in result.items():
+        lines.append(
+            f"| {assignment} | {s['students']} | {s['calls']} | {s['errors']} | {s['retries']} | "
+            f"{fmt(s['latency_p50_s'])} | {fmt(s['latency_p95_s'])} | {s['prompt_tokens']} | "
+            f"{s['cache_hit_tokens']} | {s['completion_tokens']} |"
+        )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM call ledger tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rollup_parser = sub.add_parser("rollup", help="Roll up ledgers into per-assignment latency/token totals")
+    rollup_parser.add_argument("paths", nargs="+", help="metadata.json files, ledger .jsonl files or directories")
+    rollup_parser.add_argument("--json", action="store_true", help="Print JSON instead of a markdown table")
+    args = parser.parse_args()
+
+    result = rollup(load_records(args.paths))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(format_rollup(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试分组器微基准：categorize_test（逐个 re.search）vs TestClassifier（合并正则 + 缓存）
+
+用法：
+    python bench_classifier.py --tests 100000 --classnames 20
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autograde"))
+
+from grade_grouped import TestClassifier, categorize_test  # noqa: E402
+
+GROUPS_CONFIG = {
+    "groups": {
+        "core": {"pattern": "core", "max_score": 8},
+        "edge": {"pattern": "edge", "max_score": 4},
+        "public": {"pattern": "public", "max_score": 0},
+    },
+    "fallback_group": "public",
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark test-group classification")
+    parser.add_argument("--tests", type=int, default=100000, help="Number of testcases")
+    parser.add_argument("--classnames", type=int, default=20, help="Distinct classnames shared by the testcases")
+    args = parser.parse_args()
+
+    kinds = ["core_basic", "edge_cases", "public", "misc", "edge_core_mix"]
+    classnames = [f"tests.test_{kinds[i % len(kinds)]}_{i}" for i in range(args.classnames)]
+    workload = [classnames[i % len(classnames)] for i in range(args.tests)]
+
+    start = time.perf_counter()
+    expected = [categorize_test(c, GROUPS_CONFIG) for c in workload]
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    classifier = TestClassifier(GROUPS_CONFIG)
+    actual = [classifier.classify(c) for c in workload]
+    compiled = time.perf_counter() - start
+
+    assert actual == expected, "TestClassifier disagrees with categorize_test"
+    print(f"{args.tests} tests, {args.classnames} classnames")
+    print(f"categorize_test: {baseline * 1000:8.1f} ms")
+    print(f"TestClassifier:  {compiled * 1000:8.1f} ms  ({baseline / compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
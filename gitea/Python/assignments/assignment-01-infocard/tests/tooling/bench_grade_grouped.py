@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+grade_grouped.py 流式解析基准测试
+
+生成不同规模的合成 JUnit XML，测量解析 + 评分的耗时与进程常驻内存（RSS）峰值，
+用于确认内存占用不随测试数量增长。每个规模在单独的子进程中运行（ru_maxrss 只增不减），
+RSS 同时包含解析器在 C 层分配的内存，tracemalloc 看不到这部分。
+
+用法：
+    python bench_grade_grouped.py --sizes 1000 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autograde"))
+
+import grade_grouped  # noqa: E402
+
+GROUPS_CONFIG = {
+    "groups": {
+        "core": {"pattern": "core", "max_score": 8},
+        "edge": {"pattern": "edge", "max_score": 4},
+    },
+    "fallback_group": "core",
+}
+
+
+def write_junit_xml(path, n_tests):
+    """按块写入 n_tests 个 testcase，每 7 个失败 1 个，每 13 个跳过 1 个"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<testsuites>\n')
+        f.write(f'<testsuite name="pytest" tests="{n_tests}">\n')
+        for i in range(n_tests):
+            group = "core" if i % 3 else "edge"
+            f.write(f'<testcase classname="tests.test_{group}" name="test_case[{i}]" time="0.001"')
+            if i % 7 == 0:
+                f.write('><failure message="assert False">AssertionError: expected 1, got 2</failure></testcase>\n')
+            elif i % 13 == 0:
+                f.write('><skipped message="skip"/></testcase>\n')
+            else:
+                f.write("/>\n")
+        f.write("</testsuite>\n</testsuites>\n")
+
+
+def max_rss_kb():
+    """本进程的 RSS 峰值（KB）；macOS 的 ru_maxrss 单位为字节"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 if sys.platform == "darwin" else rss
+
+
+def run_once(junit_dir):
+    """在子进程中评分一次，返回 (测试数, 耗时, 评分前 RSS KB, RSS 峰值 KB, 总分)"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", junit_dir],
+        capture_output=True, text=True, check=True,
+    )
+    r = json.loads(proc.stdout)
+    return r["tests"], r["elapsed"], r["base_kb"], r["peak_kb"], r["score"]
+
+
+def child(junit_dir):
+    base = max_rss_kb()
+    start = time.perf_counter()
+    grade_data, test_count = grade_grouped.grade_junit_dir(junit_dir, GROUPS_CONFIG)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "tests": test_count, "elapsed": elapsed, "base_kb": base,
+        "peak_kb": max_rss_kb(), "score": grade_data["total_score"],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming JUnit parsing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    print(f"| {'tests':>9} | {'xml MB':>8} | {'time s':>8} | {'base RSS KB':>11} | {'peak RSS KB':>11} | {'score':>6} |")
+    print(f"|{'-' * 11}|{'-' * 10}|{'-' * 10}|{'-' * 13}|{'-' * 13}|{'-' * 8}|")
+
+    for n_tests in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            xml_path = os.path.join(tmp, "junit.xml")
+            write_junit_xml(xml_path, n_tests)
+            size_mb = os.path.getsize(xml_path) / 1024 / 1024
+            test_count, elapsed, base, peak, score = run_once(tmp)
+        print(
+            f"| {test_count:>9} | {size_mb:>8.1f} | {elapsed:>8.2f} | "
+            f"{base:>11.0f} | {peak:>11.0f} | {score:>6.2f} |"
+        )
+
+
+if __name__ == "__main__":
+    main()
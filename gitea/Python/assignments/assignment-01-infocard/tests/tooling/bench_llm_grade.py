@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+llm_grade.py 清单模式离线压测
+
+在进程内启动 llm_stub_server.StubServer，生成合成答案清单，按不同并发数和故障注入
+（5xx 比例、429 突发）运行 grade_manifest，统计耗时、服务端请求数和重试情况；
+最后一列为开启响应缓存后第二次运行的耗时。不需要网络和 API key。
+
+用法：
+    python bench_llm_grade.py --jobs 60 --concurrency 1 4 16 --latency lognormal:-1.5,0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autograde"))
+
+import llm_grade  # noqa: E402
+from llm_cache import LLMCache  # noqa: E402
+from llm_client import LLMClient  # noqa: E402
+from llm_resilience import CircuitBreaker  # noqa: E402
+from llm_stub_server import StubConfig, StubServer  # noqa: E402
+
+RUBRIC = {
+    "max_score": 10,
+    "criteria": [
+        {"id": "content", "max_score": 4, "scoring_guide": [[0, "缺失"], [2, "部分"], [4, "完整"]]},
+        {"id": "reflection", "max_score": 3, "scoring_guide": [[0, "缺失"], [1, "简单"], [3, "深入"]]},
+        {"id": "clarity", "max_score": 3, "scoring_guide": [[0, "混乱"], [3, "清晰"]]},
+    ],
+}
+
+# (名称, 5xx 比例, 每 N 个请求后的 429 突发, 突发长度)
+SCENARIOS = [
+    ("clean", 0.0, 0, 0),
+    ("errors 10%", 0.1, 0, 0),
+    ("429 bursts", 0.0, 20, 3),
+]
+
+
+def write_jobs(root, n_jobs):
+    rubric_path = os.path.join(root, "rubric.json")
+    with open(rubric_path, "w", encoding="utf-8") as f:
+        json.dump(RUBRIC, f, ensure_ascii=False)
+    jobs = []
+    for i in range(n_jobs):
+        answer_path = os.path.join(root, f"answer_{i}.md")
+        with open(answer_path, "w", encoding="utf-8") as f:
+            f.write(f"# 第 {i} 位同学的反思报告\n\n" + f"本周我用 AI 完成了第 {i} 个练习，并检查了输出。\n" * 20)
+        jobs.append({
+            "question": "写一份反思报告",
+            "answer": answer_path,
+            "rubric": rubric_path,
+            "out": os.path.join(root, f"grade_{i}.json"),
+            "summary": os.path.join(root, f"summary_{i}.md"),
+        })
+    return jobs
+
+
+def run_once(server, jobs, concurrency, cache):
+    client = LLMClient(server.url, "stub", pool_size=concurrency, breaker=CircuitBreaker(0))
+    llm_config = {"client": client, "model": "stub", "cache": cache}
+    start = time.perf_counter()
+    # 逐题输出和重试日志不打印，只看汇总
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        results = asyncio.run(llm_grade.grade_manifest(jobs, llm_config, concurrency))
+    elapsed = time.perf_counter() - start
+    attempts = sum(r.get("llm_attempts", 0) for r in results)
+    failed = sum(1 for r in results if "llm_error" in r.get("flags", []))
+    return elapsed, attempts, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark llm_grade manifest mode against a local LLM stub")
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--latency", default="lognormal:-1.5,0.5", help="Stub latency distribution (see llm_stub_server.py)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"| {'scenario':<11} | {'conc':>4} | {'time s':>7} | {'requests':>8} | {'429':>4} | {'5xx':>4} | {'attempts':>8} | {'failed':>6} | {'cached s':>8} |")
+    print(f"|{'-' * 13}|{'-' * 6}|{'-' * 9}|{'-' * 10}|{'-' * 6}|{'-' * 6}|{'-' * 10}|{'-' * 8}|{'-' * 10}|")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = write_jobs(tmp, args.jobs)
+        for name, error_rate, burst_every, burst_size in SCENARIOS:
+            for concurrency in args.concurrency:
+                config = StubConfig(
+                    latency=args.latency, error_rate=error_rate, burst_every=burst_every,
+                    burst_size=burst_size, retry_after=1, seed=args.seed,
+                )
+                server = StubServer(config).start()
+                cache = LLMCache(os.path.join(tmp, f"cache_{name}_{concurrency}.sqlite3"))
+                try:
+                    elapsed, attempts, failed = run_once(server, jobs, concurrency, cache)
+                    stats = dict(server.stats)
+                    cached_elapsed, _, _ = run_once(server, jobs, concurrency, cache)
+                finally:
+                    server.stop()
+                errors = stats.get("500", 0) + stats.get("503", 0)
+                print(
+                    f"| {name:<11} | {concurrency:>4} | {elapsed:>7.2f} | {stats.get('requests', 0):>8} | "
+                    f"{stats.get('429', 0):>4} | {errors:>4} | {attempts:>8} | {failed:>6} | {cached_elapsed:>8.2f} |"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+评分脚本的测试工具：pytest fixture、LLM 替身服务和基准脚本（运行：pytest tests/tooling）
+
+本目录不在 tests/autograde 下，工作流只复制 autograde/*.py，这些文件不会进入学生仓库的 .autograde/。
+共用模块从本作业的 autograde/ 导入；期末项目独有的模块（run_project、dep_cache、source_digest、
+llm_evaluate）从 assignment-05-final-project 的 autograde/ 导入，该目录排在 sys.path 最后。
+
+llm_stub：启动本地 LLM 替身服务（见 llm_stub_server.py），并把 LLM_API_URL /
+LLM_API_KEY（llm_grade.py、llm_evaluate.py）和 DEEPSEEK_BASE_URL / DEEPSEEK_API_KEY
+（期末项目示例 src/llm_features.py）指向它。测试中可直接修改 llm_stub.config 注入
+延迟、错误和 429，llm_stub.stats 记录各类响应次数：
+
+    def test_retries(llm_stub):
+        llm_stub.config.error_rate = 0.3
+        ...
+        assert llm_stub.stats["requests"] > llm_stub.stats["ok"]
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autograde"))
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "assignment-05-final-project", "tests", "autograde"
+))
+
+from llm_stub_server import StubConfig, StubServer  # noqa: E402
+
+
+@pytest.fixture
+def llm_stub(monkeypatch, tmp_path):
+    server = StubServer(StubConfig()).start()
+    monkeypatch.setenv("LLM_API_URL", server.url)
+    monkeypatch.setenv("LLM_API_KEY", "stub")
+    monkeypatch.setenv("DEEPSEEK_BASE_URL", server.base_url)
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "stub")
+    # 响应缓存和调用台账写到临时目录，避免不同测试互相影响
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setenv("LLM_LEDGER_PATH", str(tmp_path / "llm_ledger.jsonl"))
+    yield server
+    server.stop()
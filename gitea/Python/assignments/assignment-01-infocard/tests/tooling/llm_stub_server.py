@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容 LLM 替身服务（离线压测 / CI 用）
+
+实现 POST .../chat/completions：
+- response_format 为 json_object 时，从 prompt 中找出评分量表 JSON（含 criteria 的对象），
+  返回符合量表结构的确定性评分（同一 prompt 总是同一结果，分值取自 scoring_guide）；
+  llm_grade.py 的合并评分 prompt（==== item_N（评分量表：rubric_N）====）按题返回
+- 其他请求返回固定文本（--text-response）
+- usage 中模拟服务商前缀缓存：与最近请求的公共前缀计入 prompt_cache_hit_tokens
+
+可配置的故障注入（均由 --seed 决定，可复现）：
+- 延迟分布：fixed:0.2 / uniform:0.1,0.5 / lognormal:mu,sigma，另可加长尾
+  （--tail-prob 的请求额外等待 --tail-latency 秒）
+- --error-rate 的请求返回 500/503
+- 每 --burst-every 个请求后连续 --burst-size 个 429（带 Retry-After）
+- --malformed-rate 的请求返回无法解析的 content
+
+GET /stats 返回请求计数。用法：
+    python llm_stub_server.py --port 18080 --latency lognormal:-1.5,0.6 --error-rate 0.05
+    LLM_API_URL=http://127.0.0.1:18080/chat/completions python llm_grade.py ...
+测试中使用 conftest.py 的 llm_stub fixture。
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "autograde"))
+
+from prompt_budget import estimate_tokens  # noqa: E402
+from rubric import compile_rubric  # noqa: E402
+
+_BATCH_RUBRIC_RE = re.compile(r"==== 评分量表 (\S+) ====\n")
+_BATCH_ITEM_RE = re.compile(r"==== (\S+)（评分量表：(\S+)）====")
+
+
+def parse_latency(spec):
+    """解析延迟分布描述，返回采样函数 f(rng) -> 延迟秒数"""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda rng: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class StubConfig:
+    """替身服务的行为配置，运行中修改立即生效"""
+
+    def __init__(self, latency="fixed:0", tail_prob=0.0, tail_latency=0.0, error_rate=0.0,
+                 burst_every=0, burst_size=0, retry_after=1, malformed_rate=0.0,
+                 text_response="OK", confidence=0.9, seed=0):
+        self.latency = latency
+        self.tail_prob = tail_prob
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_size = burst_size
+        self.retry_after = retry_after
+        self.malformed_rate = malformed_rate
+        self.text_response = text_response
+        self.confidence = confidence
+        self.seed = seed
+
+
+def common_prefix_len(a, b):
+    """公共前缀长度（二分 + 切片比较）"""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def find_rubrics(prompt):
+    """prompt 中所有含 criteria 的 JSON 对象，按出现顺序"""
+    decoder = json.JSONDecoder()
+    rubrics = []
+    pos = prompt.find("{")
+    while pos != -1:
+        try:
+            obj, end = decoder.raw_decode(prompt, pos)
+        except json.JSONDecodeError:
+            pos = prompt.find("{", pos + 1)
+            continue
+        if isinstance(obj, dict) and obj.get("criteria"):
+            rubrics.append((pos, obj))
+        pos = prompt.find("{", end)
+    return rubrics
+
+
+def fake_grade(rubric_data, seed_text, confidence):
+    """按量表生成确定性评分：每项分值由 seed_text 的哈希从允许分值中选取"""
+    rubric = compile_rubric(rubric_data)
+    digest = hashlib.sha256(seed_text.encode("utf-8")).digest()
+    criteria = []
+    for i, criterion in enumerate(rubric.criteria):
+        allowed = criterion.allowed or tuple(range(int(criterion.max_score or 0) + 1)) or (0,)
+        score = allowed[digest[i % len(digest)] % len(allowed)]
+        criteria.append({"id": criterion.id, "score": score, "reason": "stub grade"})
+    return {
+        "total": sum(c["score"] for c in criteria),
+        "criteria": criteria,
+        "flags": [],
+        "confidence": confidence,
+    }
+
+
+def fake_json_content(prompt, confidence):
+    """json_object 请求的回复：合并评分 prompt 按题返回，否则返回单份评分"""
+    rubrics = find_rubrics(prompt)
+    items = _BATCH_ITEM_RE.findall(prompt)
+    if items:
+        by_id = {}
+        for match in _BATCH_RUBRIC_RE.finditer(prompt):
+            following = [obj for pos, obj in rubrics if pos >= match.end()]
+            if following:
+                by_id[match.group(1)] = following[0]
+        blocks = _BATCH_ITEM_RE.split(prompt)
+        answers = {blocks[i]: blocks[i + 2] for i in range(1, len(blocks) - 2, 3)}
+        return {
+            item_id: fake_grade(by_id.get(rubric_id, {}), answers.get(item_id, item_id), confidence)
+            for item_id, rubric_id in items
+        }
+    rubric_data = rubrics[0][1] if rubrics else {}
+    return fake_grade(rubric_data, prompt, confidence)
+
+
+class StubServer:
+    """在后台线程中运行的替身服务，url 为 chat/completions 完整地址"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self.stats = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._requests = 0
+        self._recent_prompts = deque(maxlen=32)
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self):
+        return f"{self.base_url}/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def _plan(self):
+        """决定本次请求的结果：(延迟, 状态)，状态为 ok / 429 / 5xx / malformed"""
+        config = self.config
+        with self._lock:
+            self._requests += 1
+            n = self._requests
+            delay = parse_latency(config.latency)(self._rng)
+            if config.tail_prob and self._rng.random() < config.tail_prob:
+                delay += config.tail_latency
+            if config.burst_every and config.burst_size and (n - 1) % (config.burst_every + config.burst_size) >= config.burst_every:
+                outcome = 429
+            elif config.error_rate and self._rng.random() < config.error_rate:
+                outcome = self._rng.choice([500, 503])
+            elif config.malformed_rate and self._rng.random() < config.malformed_rate:
+                outcome = "malformed"
+            else:
+                outcome = "ok"
+            self.stats["requests"] += 1
+            self.stats[str(outcome)] += 1
+        return delay, outcome
+
+    def _cache_hit_tokens(self, prompt):
+        with self._lock:
+            longest = max((common_prefix_len(prompt, p) for p in self._recent_prompts), default=0)
+            self._recent_prompts.append(prompt)
+        # 服务商按 64 token 的块缓存前缀
+        return estimate_tokens(prompt[:longest]) // 64 * 64 if longest else 0
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    for key, value in (headers or {}).items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端已超时或对冲请求已被放弃
+                    pass
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    with server._lock:
+                        self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    prompt = "\n".join(m.get("content", "") for m in request["messages"])
+                except (ValueError, KeyError, TypeError):
+                    self._send_json(400, {"error": {"message": "invalid request"}})
+                    return
+
+                delay, outcome = server._plan()
+                time.sleep(delay)
+                if outcome == 429:
+                    self._send_json(429, {"error": {"message": "rate limited"}},
+                                    {"Retry-After": str(server.config.retry_after)})
+                    return
+                if outcome in (500, 503):
+                    self._send_json(outcome, {"error": {"message": "injected failure"}})
+                    return
+
+                wants_json = (request.get("response_format") or {}).get("type") == "json_object"
+                if outcome == "malformed":
+                    content = '{"total": '
+                elif wants_json:
+                    content = json.dumps(fake_json_content(prompt, server.config.confidence), ensure_ascii=False)
+                else:
+                    content = server.config.text_response
+                self._send_json(200, {
+                    "id": "stub-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12],
+                    "object": "chat.completion",
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": {
+                        "prompt_tokens": estimate_tokens(prompt),
+                        "completion_tokens": estimate_tokens(content),
+                        "prompt_cache_hit_tokens": server._cache_hit_tokens(prompt),
+                    },
+                })
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible LLM stand-in for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", default="fixed:0", help="fixed:S | uniform:LO,HI | lognormal:MU,SIGMA (seconds)")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Probability of an extra --tail-latency delay")
+    parser.add_argument("--tail-latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500/503 response")
+    parser.add_argument("--burst-every", type=int, default=0, help="Serve a burst of 429s after every N requests, 0 = never")
+    parser.add_argument("--burst-size", type=int, default=0, help="Number of consecutive 429s per burst")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Probability of unparseable message content")
+    parser.add_argument("--text-response", default="OK", help="Reply for requests without response_format json_object")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency=args.latency, tail_prob=args.tail_prob, tail_latency=args.tail_latency,
+        error_rate=args.error_rate, burst_every=args.burst_every, burst_size=args.burst_size,
+        retry_after=args.retry_after, malformed_rate=args.malformed_rate,
+        text_response=args.text_response, seed=args.seed,
+    )
+    parse_latency(config.latency)
+    server = StubServer(config, args.host, args.port)
+    print(f"LLM stub listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+长答案分块评分：Markdown 切块边界、合并与 map 步骤（运行：pytest tests/tooling）
+"""
+
+import pytest
+
+from chunked_grading import condense_answer, split_markdown
+from prompt_budget import estimate_tokens
+
+
+def test_sections_follow_heading_path():
+    body = "说明" * 20
+    text = f"{body}\n\n# 实现\n{body}\n## 数据结构\n{body}\n# 反思\n{body}"
+    chunks = split_markdown(text, chunk_tokens=50)
+    assert [c["heading"] for c in chunks] == ["开头", "实现", "实现 > 数据结构", "反思"]
+    assert chunks[2]["text"] == f"## 数据结构\n{body}"
+
+
+def test_hash_in_code_fence_is_not_a_heading():
+    text = "# 代码\n```python\n# 这是注释\nprint(1)\n```\n# 结论\n可以运行"
+    chunks = split_markdown(text, chunk_tokens=15)
+    assert [c["heading"] for c in chunks] == ["代码", "结论"]
+    assert "# 这是注释" in chunks[0]["text"]
+
+
+def test_short_sections_are_merged():
+    text = "# 一\n甲\n# 二\n乙\n# 三\n丙"
+    chunks = split_markdown(text, chunk_tokens=100)
+    assert len(chunks) == 1
+    assert chunks[0]["heading"] == "一 … 三"
+    assert chunks[0]["text"] == "# 一\n甲\n\n# 二\n乙\n\n# 三\n丙"
+
+
+@pytest.mark.parametrize("body", [
+    "\n\n".join("第 %d 段：" % i + "内容" * 30 for i in range(10)),
+    "\n".join("第 %d 行：" % i + "内容" * 30 for i in range(10)),
+    "内容" * 500,
+], ids=["paragraphs", "lines", "characters"])
+def test_long_sections_split_within_limit(body):
+    chunks = split_markdown("# 长节\n" + body, chunk_tokens=200)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(c["text"]) <= 200 for c in chunks)
+    assert chunks[0]["heading"].startswith("长节（1/")
+    # 切分不丢内容
+    assert "".join(c["text"] for c in chunks).replace("\n", "").replace("# 长节", "") == body.replace("\n", "")
+
+
+def test_chunk_hash_depends_only_on_content():
+    first = split_markdown("# 一\n" + "甲" * 100 + "\n# 二\n" + "乙" * 100, chunk_tokens=120)
+    edited = split_markdown("# 一\n" + "甲" * 100 + "\n# 二\n" + "丙" * 100, chunk_tokens=120)
+    assert first[0]["hash"] == edited[0]["hash"]
+    assert first[1]["hash"] != edited[1]["hash"]
+
+
+def test_condense_answer_collects_evidence():
+    answer = "# 实现\n" + "实现" * 100 + "\n# 反思\n" + "反思" * 100
+    prompts = []
+
+    def call(prompt, heading):
+        prompts.append(heading)
+        return {"summary": f"{heading}概要", "evidence": {"content": [f"{heading}证据"], "style": "规范"}}, {"attempts": 1}
+
+    text, stats = condense_answer(answer, "题目", "{}", call, chunk_tokens=250)
+    assert sorted(prompts) == ["反思", "实现"]
+    assert stats == {"answer_tokens": estimate_tokens(answer), "chunks": 2, "cached": 0, "attempts": 2}
+    assert "## 第 1 节：实现" in text
+    assert "- content：实现证据" in text
+    assert "- style：规范" in text
+
+
+def test_condense_answer_propagates_map_failure():
+    def call(prompt, heading):
+        raise RuntimeError("map failed")
+
+    with pytest.raises(RuntimeError):
+        condense_answer("# 一\n" + "甲" * 300, "题目", "{}", call, chunk_tokens=100)
@@ -0,0 +1,79 @@
+"""
+班级级测试矩阵分析：通过矩阵、分组得分、失败率和区分度（运行：pytest tests/tooling）
+"""
+
+import numpy as np
+
+from cohort_analytics import analyze_matrix, build_report, load_cohort_matrix
+
+GROUPS = {
+    "groups": {
+        "core": {"pattern": "core", "max_score": 10},
+        "edge": {"pattern": "edge", "max_score": 5},
+    },
+    "fallback_group": "core",
+}
+
+
+def write_report(cohort_root, student, outcomes):
+    """outcomes: {(classname, name): passed}"""
+    junit_dir = cohort_root / student / "test-results"
+    junit_dir.mkdir(parents=True)
+    cases = []
+    for (classname, name), ok in outcomes.items():
+        body = "" if ok else '<failure message="assert"/>'
+        cases.append(f'<testcase classname="{classname}" name="{name}">{body}</testcase>')
+    (junit_dir / "report.xml").write_text(f"<testsuite>{''.join(cases)}</testsuite>", encoding="utf-8")
+
+
+def build_cohort(tmp_path):
+    write_report(tmp_path, "alice", {("test_core", "a"): True, ("test_core", "b"): True, ("test_edge", "c"): True})
+    write_report(tmp_path, "bob", {("test_core", "a"): True, ("test_core", "b"): False, ("test_edge", "c"): False})
+    # carol 的报告缺少 test_edge.c
+    write_report(tmp_path, "carol", {("test_core", "a"): True, ("test_core", "b"): False})
+    return load_cohort_matrix(str(tmp_path), GROUPS)
+
+
+def test_load_cohort_matrix(tmp_path):
+    students, test_ids, test_groups, passed, present = build_cohort(tmp_path)
+    assert students == ["alice", "bob", "carol"]
+    assert test_ids == ["test_core.a", "test_core.b", "test_edge.c"]
+    assert test_groups == ["core", "core", "edge"]
+    assert passed.tolist() == [[True, True, True], [True, False, False], [True, False, False]]
+    assert present.tolist() == [[True, True, True], [True, True, True], [True, True, False]]
+
+
+def test_group_scores_and_failure_rate(tmp_path):
+    _, _, test_groups, passed, present = build_cohort(tmp_path)
+    stats = analyze_matrix(test_groups, passed, present, GROUPS)
+    assert stats["group_names"] == ["core", "edge"]
+    # 与 grade_grouped.py 一致：组内通过比例 × 组满分；没有运行该组测试的学生得 0 分
+    np.testing.assert_allclose(stats["group_scores"], [[10, 5], [5, 0], [5, 0]])
+    assert stats["pass_count"].tolist() == [3, 1, 1]
+    assert stats["run_count"].tolist() == [3, 3, 2]
+    np.testing.assert_allclose(stats["failure_rate"], [0, 2 / 3, 0.5])
+
+
+def test_discrimination_excludes_the_test_itself():
+    groups = {"groups": {"core": {"pattern": "core", "max_score": 10}}}
+    # 测试 0 由其余测试通过多的学生通过，测试 1 相反，测试 2 无人通过（方差为 0）
+    passed = np.array([
+        [True, False, False, True, True],
+        [True, False, False, True, False],
+        [False, True, False, False, False],
+        [False, True, False, False, False],
+    ])
+    present = np.ones_like(passed)
+    stats = analyze_matrix(["core"] * 5, passed, present, groups)
+    assert stats["discrimination"][0] > 0.5
+    assert stats["discrimination"][1] < -0.5
+    assert np.isnan(stats["discrimination"][2])
+
+
+def test_report_flags_and_order(tmp_path):
+    students, test_ids, test_groups, passed, present = build_cohort(tmp_path)
+    report = build_report(students, test_ids, analyze_matrix(test_groups, passed, present, GROUPS))
+    assert report["everybody_passes"] == ["test_core.a"]
+    assert report["nobody_passes"] == []
+    assert [t["test"] for t in report["ranked_tests"]] == ["test_core.b", "test_edge.c", "test_core.a"]
+    assert report["groups"]["core"]["max"] == 10
@@ -0,0 +1,139 @@
+"""
+依赖缓存：requirements 规范化与依赖键、环境内容摘要、锁文件和淘汰（运行：pytest tests/tooling）
+"""
+
+import glob
+import os
+from pathlib import Path
+
+from dep_cache import (
+    READY_MARKER, DependencyCache, _FileLock, normalize_requirements, remove_tree, requirements_key,
+    set_writable, tree_digest,
+)
+
+
+def write(path, text):
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def test_normalize_requirements(tmp_path):
+    req = write(tmp_path / "requirements.txt", (
+        "# 项目依赖\n"
+        "Requests >= 2.0  # HTTP\n"
+        "\n"
+        "python_dotenv\n"
+        "numpy\n"
+        "numpy\n"
+        "-e .\n"
+    ))
+    assert normalize_requirements(req) == ["-e .", "numpy", "python-dotenv", "requests>=2.0"]
+
+
+def test_equivalent_requirements_share_a_key(tmp_path):
+    a = write(tmp_path / "a.txt", "requests>=2\nPyYAML\n")
+    b = write(tmp_path / "b.txt", "# 同样的依赖，不同写法\npyyaml\n\nrequests >= 2\n")
+    c = write(tmp_path / "c.txt", "requests>=2\npyyaml\nrich\n")
+    key = requirements_key(normalize_requirements(a))
+    assert requirements_key(normalize_requirements(b)) == key
+    assert requirements_key(normalize_requirements(c)) != key
+
+
+def test_referenced_files_are_part_of_the_key(tmp_path):
+    write(tmp_path / "base.txt", "numpy\n-r requirements.txt\n")  # 循环引用
+    write(tmp_path / "constraints.txt", "numpy==1.26.4\n")
+    req = write(tmp_path / "requirements.txt", "-r base.txt\n--constraint=constraints.txt\nrequests\n")
+    assert normalize_requirements(req) == ["-c numpy==1.26.4", "numpy", "requests"]
+    key = requirements_key(normalize_requirements(req))
+    # 内容相同、写法不同的引用命中同一个环境；引用的文件内容变化则不命中
+    write(req, "-rbase.txt\n-c constraints.txt\nrequests\n")
+    assert requirements_key(normalize_requirements(req)) == key
+    write(tmp_path / "constraints.txt", "numpy==2.0.0\n")
+    assert requirements_key(normalize_requirements(req)) != key
+    write(tmp_path / "base.txt", "numpy\npandas\n")
+    assert "pandas" in normalize_requirements(req)
+
+
+def test_tree_digest_and_permissions(tmp_path):
+    root = tmp_path / "venv"
+    (root / "lib").mkdir(parents=True)
+    write(root / "lib" / "pkg.py", "x = 1\n")
+    os.symlink("lib/pkg.py", root / "link.py")
+    digest = tree_digest(root)
+    # 就绪标记不计入摘要；内容、新文件和符号链接目标都计入
+    write(root / READY_MARKER, "{}")
+    assert tree_digest(root) == digest
+    write(root / "lib" / "pkg.py", "x = 2\n")
+    assert tree_digest(root) != digest
+    write(root / "lib" / "pkg.py", "x = 1\n")
+    write(root / "lib" / "evil.py", "")
+    assert tree_digest(root) != digest
+    os.remove(root / "lib" / "evil.py")
+    os.remove(root / "link.py")
+    os.symlink("lib", root / "link.py")
+    assert tree_digest(root) != digest
+
+    set_writable(root, False)
+    assert not os.stat(root / "lib" / "pkg.py").st_mode & 0o222
+    assert not os.stat(root / "lib").st_mode & 0o222
+    remove_tree(root)
+    assert not root.exists()
+
+
+def test_lock_reopens_unlinked_file(tmp_path):
+    path = tmp_path / "key.use"
+    first = _FileLock(path, shared=True)
+    assert first.acquire()
+    # 淘汰时删除锁文件：之后取锁的进程锁在新建的文件上，而不是已删除的文件上
+    path.unlink()
+    second = _FileLock(path, shared=True)
+    assert second.acquire()
+    assert second._current()
+    assert not first._current()
+    first.release()
+    second.release()
+
+
+def fake_venv(cache, key, mtime):
+    venv = cache.venvs / key
+    venv.mkdir(parents=True)
+    write(venv / READY_MARKER, "{}")
+    os.utime(venv / READY_MARKER, (mtime, mtime))
+    for suffix in (".digest", ".lock", ".use"):
+        write(cache.venvs / f"{key}{suffix}", "")
+    return venv
+
+
+def test_evict_removes_venv_and_lock_files(tmp_path):
+    cache = DependencyCache(tmp_path, max_venvs=1)
+    fake_venv(cache, "old", 1000)
+    fake_venv(cache, "busy", 2000)
+    fake_venv(cache, "new", 3000)
+    in_use = _FileLock(cache.venvs / "busy.use", shared=True)
+    assert in_use.acquire()
+    cache.wheels.mkdir(parents=True)
+    cache.evict(keep="new")
+    in_use.release()
+    # 正在使用的环境跳过；被淘汰的环境连同 .digest / .lock / .use 一起删除
+    assert sorted(p.name for p in cache.venvs.iterdir()) == [
+        "busy", "busy.digest", "busy.lock", "busy.use", "new", "new.digest", "new.lock", "new.use",
+    ]
+
+
+def test_modified_venv_is_rebuilt(tmp_path):
+    req = write(tmp_path / "requirements.txt", "# 没有第三方依赖\n")
+    cache = DependencyCache(tmp_path / "cache")
+    first = cache.ensure(req)
+    cache.release()
+    assert first["error"] is None and not first["cache_hit"]
+    assert cache.ensure(req)["cache_hit"]
+    cache.release()
+
+    # 以 root 运行的学生代码不受只读权限限制：摘要不一致时重建
+    site_packages = Path(glob.glob(os.path.join(first["venv"], "lib*", "python*", "site-packages"))[0])
+    os.chmod(site_packages, 0o755)
+    write(site_packages / "requests.py", "")
+    rebuilt = cache.ensure(req)
+    cache.release()
+    assert rebuilt["error"] is None and not rebuilt["cache_hit"]
+    assert not (site_packages / "requests.py").exists()
@@ -0,0 +1,71 @@
+"""
+JUnit 解析结果缓存：内容哈希 key 与按 mtime 的 LRU 淘汰（运行：pytest tests/tooling）
+"""
+
+import os
+
+from junit_cache import JUnitCache, cache_key, default_cache_dir
+
+
+def entry_size(cache, key):
+    return os.path.getsize(cache._path(key))
+
+
+def test_key_depends_on_content_not_names(tmp_path):
+    a = tmp_path / "a.xml"
+    b = tmp_path / "b.xml"
+    a.write_text("<testsuite name='a'/>")
+    b.write_text("<testsuite name='b'/>")
+    key = cache_key("grade_grouped/v1", [a, b], {"groups": {}})
+    assert key == cache_key("grade_grouped/v1", [b, a], {"groups": {}})
+    assert key != cache_key("grade_grouped/v2", [a, b], {"groups": {}})
+    assert key != cache_key("grade_grouped/v1", [a, b], {"groups": {"core": {}}})
+    b.write_text("<testsuite name='c'/>")
+    assert key != cache_key("grade_grouped/v1", [a, b], {"groups": {}})
+
+
+def test_cache_is_opt_in(monkeypatch):
+    monkeypatch.delenv("AUTOGRADE_CACHE_DIR", raising=False)
+    assert default_cache_dir() is None
+    monkeypatch.setenv("AUTOGRADE_CACHE_DIR", "/tmp/junit-cache")
+    assert default_cache_dir() == "/tmp/junit-cache"
+
+
+def test_get_put_roundtrip(tmp_path):
+    cache = JUnitCache(str(tmp_path))
+    assert cache.get("ab" * 32) is None
+    cache.put("ab" * 32, {"total": 3, "passed": 2})
+    assert cache.get("ab" * 32) == {"total": 3, "passed": 2}
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = JUnitCache(str(tmp_path))
+    key = "cd" * 32
+    os.makedirs(os.path.dirname(cache._path(key)))
+    with open(cache._path(key), "w") as f:
+        f.write("{not json")
+    assert cache.get(key) is None
+
+
+def test_lru_eviction(tmp_path):
+    value = {"payload": "x" * 100}
+    probe = JUnitCache(str(tmp_path / "probe"))
+    probe.put("00" * 32, value)
+    size = entry_size(probe, "00" * 32)
+
+    # 上限可容纳 4 个条目；超出后删到 80%（3 个条目）
+    cache = JUnitCache(str(tmp_path / "cache"), max_bytes=size * 4)
+    keys = [f"{i:02x}" * 32 for i in range(1, 5)]
+    for i, key in enumerate(keys):
+        cache.put(key, value)
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    # 命中刷新 mtime：keys[0] 变成最新
+    assert cache.get(keys[0]) == value
+
+    cache.put("ff" * 32, value)
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[2]) is None
+    assert cache.get(keys[0]) == value
+    assert cache.get(keys[3]) == value
+    assert cache.get("ff" * 32) == value
+    assert cache._size == size * 3
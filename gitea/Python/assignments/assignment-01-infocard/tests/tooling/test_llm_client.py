@@ -0,0 +1,112 @@
+"""
+LLMClient 在替身服务上的重试与本地缓存（运行：pytest tests/tooling）
+"""
+
+import json
+
+import pytest
+
+from llm_cache import LLMCache
+from llm_client import CircuitOpenError, LLMCallError, LLMClient
+from llm_resilience import PROBE, CircuitBreaker
+
+RUBRIC = {
+    "max_score": 4,
+    "criteria": [
+        {"id": "content", "max_score": 4, "scoring_guide": [[0, "缺失"], [2, "部分"], [4, "完整"]]},
+    ],
+}
+
+
+def make_prompt(answer):
+    return f"【评分量表】\n{json.dumps(RUBRIC, ensure_ascii=False)}\n\n【学生答案】\n{answer}"
+
+
+def make_client(llm_stub, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(threshold=0))
+    return LLMClient(llm_stub.url, "stub", max_attempts=8, backoff_base=0.01, hedge_after=0, **kwargs)
+
+
+def test_retries_5xx(llm_stub):
+    llm_stub.config.error_rate = 0.5
+    client = make_client(llm_stub)
+    attempts = 0
+    for i in range(8):
+        resp, info = client.chat_json("stub-model", make_prompt(f"答案 {i}"))
+        assert resp["criteria"][0]["score"] in (0, 2, 4)
+        attempts += info["attempts"]
+    errors = llm_stub.stats["500"] + llm_stub.stats["503"]
+    assert errors > 0
+    assert attempts == llm_stub.stats["requests"] == 8 + errors
+
+
+def test_retries_429_burst(llm_stub):
+    llm_stub.config.burst_every = 1
+    llm_stub.config.burst_size = 1
+    llm_stub.config.retry_after = 0
+    client = make_client(llm_stub, breaker=None)
+    for i in range(3):
+        _, info = client.chat_json("stub-model", make_prompt(f"答案 {i}"))
+        assert info["attempts"] == (1 if i == 0 else 2)
+    assert llm_stub.stats["429"] == 2
+    # 429 不计入熔断
+    assert client.breaker.state == "closed"
+
+
+def open_breaker():
+    """cooldown 为 0 的熔断器，打开后立即进入 half-open"""
+    breaker = CircuitBreaker(threshold=0.5, min_requests=1, cooldown=0)
+    breaker.record(False)
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_half_open_probe_released_on_429(llm_stub):
+    # 第 1 个请求成功，第 2 个 429，第 3 个成功
+    llm_stub.config.burst_every = 1
+    llm_stub.config.burst_size = 1
+    llm_stub.config.retry_after = 0
+    client = make_client(llm_stub, breaker=CircuitBreaker(threshold=0.5, min_requests=1, cooldown=0))
+    client.chat_json("stub-model", make_prompt("答案 0"))
+    client.breaker = open_breaker()
+    # 试探遇到 429 后不能一直占着 half-open，下一轮重新试探并成功
+    _, info = client.chat_json("stub-model", make_prompt("答案 1"))
+    assert info["attempts"] == 2
+    assert client.breaker.state == "closed"
+
+
+def test_other_callers_probe_not_released(llm_stub):
+    # 另一个调用方持有 half-open 的试探：本次调用被拒绝，且不能结束别人的试探
+    breaker = open_breaker()
+    assert breaker.allow() == PROBE
+    client = make_client(llm_stub, breaker=breaker)
+    with pytest.raises(CircuitOpenError):
+        client.chat_json("stub-model", make_prompt("答案"))
+    assert breaker.allow() is None
+    assert llm_stub.stats["requests"] == 0
+
+
+def test_half_open_probe_released_on_fatal(llm_stub):
+    llm_stub.config.malformed_rate = 1.0
+    client = make_client(llm_stub, breaker=open_breaker())
+    with pytest.raises(LLMCallError) as excinfo:
+        client.chat_json("stub-model", make_prompt("答案"))
+    assert not isinstance(excinfo.value, CircuitOpenError)
+    assert client.breaker.state == "half_open"
+    llm_stub.config.malformed_rate = 0.0
+    resp, info = client.chat_json("stub-model", make_prompt("答案"))
+    assert info["attempts"] == 1
+    assert client.breaker.state == "closed"
+
+
+def test_cache_hit_skips_request(llm_stub, tmp_path):
+    cache = LLMCache()
+    assert cache.path.startswith(str(tmp_path))
+    client = make_client(llm_stub)
+    first, info = client.chat_json("stub-model", make_prompt("同一份答案"), cache=cache)
+    assert info["attempts"] == 1
+    second, info = client.chat_json("stub-model", make_prompt("同一份答案"), cache=cache)
+    assert info == {"attempts": 0, "hedges": 0, "usage": None}
+    assert second == first
+    assert llm_stub.stats["requests"] == 1
+    assert cache.stats() == {"hits": 1, "misses": 1}
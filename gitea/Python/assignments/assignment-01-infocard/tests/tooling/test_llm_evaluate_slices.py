@@ -0,0 +1,95 @@
+"""
+期末项目按维度的增量重评：输入切片和 prompt 参数不变时复用上次的评分（运行：pytest tests/tooling）
+"""
+
+import copy
+from types import SimpleNamespace
+
+from llm_cache import LLMCache
+from llm_client import LLMClient
+from llm_evaluate import PROMPT_BUDGETS, evaluate_dimension, slice_key
+from rubric import compile_rubric
+
+RUBRIC = compile_rubric({
+    "max_score": 6,
+    "criteria": [
+        {"id": "llm_integration", "scoring_guide": [[0, "无"], [3, "有"]]},
+        {"id": "core_feature_works", "scoring_guide": [[0, "不可用"], [3, "可用"]]},
+    ],
+})
+
+RUN_RESULTS = {
+    "manifest": {"project": {"name": "问答助手", "description": "命令行问答"}},
+    "command_results": [
+        {"command": "python main.py", "description": "演示", "category": "demo",
+         "exit_code": 0, "stdout": "你好！", "stderr": "", "duration": 1.2},
+        {"command": "python main.py --bad", "description": "错误参数", "category": "error_handling",
+         "exit_code": 2, "stdout": "", "stderr": "usage", "duration": 0.3},
+    ],
+    "generated_files": [],
+    "source_code": {"main.py": "print('hi')\n"},
+    "security_issues": [],
+    "structure_check": {},
+}
+
+
+def make_args(**overrides):
+    args = {
+        "prompt_budget": None, "template_dir": None,
+        "template_threshold": 0.9, "chunk_threshold": 6000, "chunk_tokens": 3000,
+    }
+    args.update(overrides)
+    return SimpleNamespace(**args)
+
+
+def key(dimension, run_results=RUN_RESULTS, **overrides):
+    return slice_key(dimension, run_results, RUBRIC, {"model": "stub-model"}, make_args(**overrides), {})
+
+
+def test_volatile_fields_do_not_change_the_key():
+    changed = copy.deepcopy(RUN_RESULTS)
+    changed["command_results"][0]["duration"] = 9.9
+    assert key("functionality", changed) == key("functionality")
+    changed["command_results"][0]["stdout"] = "再见"
+    assert key("functionality", changed) != key("functionality")
+
+
+def test_key_only_uses_the_dimension_inputs():
+    changed = copy.deepcopy(RUN_RESULTS)
+    changed["source_code"]["main.py"] = "print('bye')\n"
+    assert key("functionality", changed) == key("functionality")
+    assert key("code_quality", changed) != key("code_quality")
+
+
+def test_key_uses_the_dimension_prompt_settings():
+    # 文档预筛和分块参数只影响文档维度
+    assert key("functionality", template_threshold=0.5, chunk_tokens=100) == key("functionality")
+    assert key("documentation", template_threshold=0.5) != key("documentation")
+    assert key("documentation", chunk_tokens=100) != key("documentation")
+    # 预算按生效值计算：显式给出默认值与不给相同
+    assert key("code_quality", prompt_budget=PROMPT_BUDGETS["code_quality"]) == key("code_quality")
+    assert key("code_quality", prompt_budget=1000) != key("code_quality")
+
+
+def test_evaluate_dimension_reuses_grade(llm_stub, tmp_path):
+    client = LLMClient(llm_stub.url, "stub", max_attempts=2, backoff_base=0.01, hedge_after=0)
+    cache_path = str(tmp_path / "cache.sqlite3")
+    llm_config = {
+        "client": client, "model": "stub-model", "cache": LLMCache(cache_path),
+        "tags": {"dimension": "functionality"},
+    }
+    grade_cache = LLMCache(cache_path)
+    run_results = copy.deepcopy(RUN_RESULTS)
+
+    first = evaluate_dimension("functionality", run_results, RUBRIC, llm_config, make_args(), grade_cache)
+    assert first["input_slice"]["reused"] is False
+    assert llm_stub.stats["requests"] == 1
+
+    run_results["command_results"][0]["duration"] = 5.0
+    second = evaluate_dimension("functionality", run_results, RUBRIC, llm_config, make_args(), grade_cache)
+    assert second["input_slice"] == {"hash": first["input_slice"]["hash"], "reused": True}
+    assert second["total"] == first["total"]
+    assert llm_stub.stats["requests"] == 1
+
+    third = evaluate_dimension("functionality", run_results, RUBRIC, llm_config, make_args(prompt_budget=2000), grade_cache)
+    assert third["input_slice"]["reused"] is False
@@ -0,0 +1,61 @@
+"""
+LLM 调用的录制 / 回放：回放不发请求，未命中抛出 ReplayMissError（运行：pytest tests/tooling）
+"""
+
+import json
+
+import pytest
+
+from llm_client import LLMClient, ReplayMissError
+from llm_replay import LLMReplay
+
+PROMPT = '【评分量表】\n{"criteria": [{"id": "content", "scoring_guide": [[0, "缺失"], [2, "完整"]]}]}\n\n【学生答案】\n答案'
+
+
+def make_client(llm_stub, replay):
+    return LLMClient(llm_stub.url, "stub", max_attempts=2, backoff_base=0.01, hedge_after=0, replay=replay)
+
+
+def test_record_then_replay_without_requests(llm_stub, tmp_path):
+    tapes = tmp_path / "tapes"
+    recorder = LLMReplay(str(tapes), "record")
+    recorded, _ = make_client(llm_stub, recorder).chat_json("stub-model", PROMPT, tags={"student_id": "s1"})
+    assert recorder.recorded == 1
+    entry = json.loads(next(tapes.glob("*.json")).read_text(encoding="utf-8"))
+    assert entry["response"] == recorded
+    assert entry["tags"] == {"student_id": "s1"}
+
+    llm_stub.stats.clear()
+    player = LLMReplay(str(tapes), "replay")
+    replayed, info = make_client(llm_stub, player).chat_json("stub-model", PROMPT)
+    assert replayed == recorded
+    assert info == {"attempts": 0, "hedges": 0, "usage": None}
+    assert player.hits == 1
+    assert llm_stub.stats["requests"] == 0
+
+
+def test_replay_miss(llm_stub, tmp_path):
+    player = LLMReplay(str(tmp_path / "empty"), "replay")
+    client = make_client(llm_stub, player)
+    with pytest.raises(ReplayMissError):
+        client.chat_json("stub-model", PROMPT, tags={"student_id": "s2", "dimension": None})
+    # 模型或温度不同也是另一个调用
+    LLMReplay(str(tmp_path / "empty"), "record").put(player.make_key("stub-model", 0, PROMPT), {}, {"total": 0})
+    with pytest.raises(ReplayMissError):
+        client.chat_json("other-model", PROMPT)
+    assert llm_stub.stats["requests"] == 0
+    assert player.misses[0]["student_id"] == "s2"
+    assert "dimension" not in player.misses[0]
+    assert player.report() == 2
+
+
+def test_unreadable_recording_is_a_miss(tmp_path):
+    player = LLMReplay(str(tmp_path), "replay")
+    (tmp_path / "abc.json").write_text("{broken", encoding="utf-8")
+    assert player.get("abc") is None
+    assert len(player.misses) == 1
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        LLMReplay("tapes", "rewind")
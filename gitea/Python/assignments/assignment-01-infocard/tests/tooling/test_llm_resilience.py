@@ -0,0 +1,78 @@
+"""
+熔断器的 half-open 试探归属与台账预热（运行：pytest tests/tooling）
+"""
+
+from datetime import datetime, timedelta
+
+from llm_resilience import ALLOW, PROBE, CircuitBreaker, LatencyTracker, seed_from_ledger
+
+
+def open_breaker():
+    """cooldown 为 0 的熔断器，打开后立即进入 half-open"""
+    breaker = CircuitBreaker(threshold=0.5, min_requests=1, cooldown=0)
+    breaker.record(False)
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_only_one_probe_in_half_open():
+    breaker = open_breaker()
+    assert breaker.allow() == PROBE
+    assert breaker.allow() is None
+
+
+def test_non_probe_result_keeps_probe():
+    breaker = open_breaker()
+    assert breaker.allow() == PROBE
+    # 打开前发出的普通请求此时才返回失败：不结束另一个调用方的试探
+    breaker.record(False)
+    assert breaker.allow() is None
+    breaker.record(True, probe=True)
+    assert breaker.state == "closed"
+    assert breaker.allow() == ALLOW
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(threshold=0.5, min_requests=1, cooldown=60)
+    breaker.record(False)
+    breaker._open_until = 0
+    assert breaker.allow() == PROBE
+    breaker.record(False, probe=True)
+    assert breaker.state == "open"
+
+
+def test_release_probe_allows_next_probe():
+    breaker = open_breaker()
+    assert breaker.allow() == PROBE
+    breaker.release_probe()
+    assert breaker.state == "half_open"
+    assert breaker.allow() == PROBE
+
+
+def ledger_record(ts, status="error", attempts=1, latency_s=0.5):
+    return {"ts": ts.isoformat(timespec="seconds"), "status": status, "attempts": attempts, "latency_s": latency_s}
+
+
+def test_seed_skips_stale_and_future_records():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    records = [
+        ledger_record(now - timedelta(hours=1)),
+        ledger_record(now + timedelta(hours=1)),
+        ledger_record(now + timedelta(days=365)),
+    ]
+    breaker = CircuitBreaker(threshold=0.5, min_requests=1)
+    seed_from_ledger(records, breaker=breaker, now=now)
+    assert breaker.state == "closed"
+
+
+def test_seed_uses_recent_records():
+    now = datetime(2026, 1, 1, 12, 0, 0)
+    tracker = LatencyTracker(hedge_after=45, min_samples=1)
+    breaker = CircuitBreaker(threshold=0.5, min_requests=2)
+    records = [
+        ledger_record(now - timedelta(seconds=30), status="ok", latency_s=2.0),
+        ledger_record(now - timedelta(seconds=20), attempts=2),
+    ]
+    seed_from_ledger(records, tracker, breaker, now=now)
+    assert tracker.hedge_delay() == 2.0
+    assert breaker.state == "open"
@@ -0,0 +1,87 @@
+"""
+LLM 替身服务：确定性评分、合并评分 prompt、故障注入和前缀缓存模拟（运行：pytest tests/tooling）
+"""
+
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from llm_stub_server import common_prefix_len, fake_json_content, parse_latency
+
+RUBRIC = {
+    "criteria": [
+        {"id": "content", "scoring_guide": [[0, "缺失"], [2, "部分"], [4, "完整"]]},
+        {"id": "style", "max_score": 2},
+    ],
+}
+
+
+def post(url, prompt, json_mode=True):
+    body = {"model": "stub-model", "messages": [{"role": "user", "content": prompt}]}
+    if json_mode:
+        body["response_format"] = {"type": "json_object"}
+    request = urllib.request.Request(url, json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+def test_parse_latency():
+    assert parse_latency("fixed:0.2")(None) == 0.2
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1,2")
+
+
+def test_common_prefix_len():
+    assert common_prefix_len("abcdef", "abcxyz") == 3
+    assert common_prefix_len("abc", "abc") == 3
+    assert common_prefix_len("", "abc") == 0
+
+
+def test_fake_grade_follows_rubric_and_is_deterministic():
+    prompt = f"【评分量表】\n{json.dumps(RUBRIC)}\n\n【学生答案】\n答案"
+    grade = fake_json_content(prompt, 0.9)
+    assert grade == fake_json_content(prompt, 0.9)
+    scores = {c["id"]: c["score"] for c in grade["criteria"]}
+    assert scores["content"] in (0, 2, 4)
+    assert scores["style"] in (0, 1, 2)
+    assert grade["total"] == sum(scores.values())
+
+
+def test_batch_prompt_graded_per_item():
+    prompt = (
+        f"==== 评分量表 rubric_1 ====\n{json.dumps(RUBRIC)}\n"
+        "==== item_1（评分量表：rubric_1）====\n第一题答案\n"
+        "==== item_2（评分量表：rubric_1）====\n第二题答案\n"
+    )
+    grades = fake_json_content(prompt, 0.9)
+    assert set(grades) == {"item_1", "item_2"}
+    assert all(len(g["criteria"]) == 2 for g in grades.values())
+
+
+def test_text_response_and_prefix_cache(llm_stub):
+    llm_stub.config.text_response = "pong"
+    prefix = "系统说明" * 200
+    first = post(llm_stub.url, prefix + "问题一", json_mode=False)
+    second = post(llm_stub.url, prefix + "问题二", json_mode=False)
+    assert first["choices"][0]["message"]["content"] == "pong"
+    assert first["usage"]["prompt_cache_hit_tokens"] == 0
+    assert second["usage"]["prompt_cache_hit_tokens"] > 0
+    assert second["usage"]["prompt_cache_hit_tokens"] % 64 == 0
+
+
+def test_injected_429_burst(llm_stub):
+    llm_stub.config.burst_every = 2
+    llm_stub.config.burst_size = 1
+    statuses = []
+    for i in range(6):
+        try:
+            post(llm_stub.url, f"请求 {i}", json_mode=False)
+            statuses.append(200)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+            assert e.headers["Retry-After"] == "1"
+    assert statuses == [200, 200, 429, 200, 200, 429]
+    assert llm_stub.stats["429"] == 2
+    assert llm_stub.stats["requests"] == 6
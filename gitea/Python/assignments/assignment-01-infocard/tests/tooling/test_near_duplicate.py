@@ -0,0 +1,63 @@
+"""
+近似重复答案聚类：MinHash 签名、LSH 候选和贪心聚类阈值（运行：pytest tests/tooling）
+"""
+
+from near_duplicate import NUM_PERM, cluster_texts, lsh_candidates, minhash
+from template_screen import shingles, template_similarity
+
+BASE = (
+    "本次作业实现了成绩统计程序：从 CSV 读入学生成绩，计算平均分、最高分和最低分，"
+    "按分数段统计人数并输出报告。对空文件、非数字成绩和缺失列做了异常处理，"
+    "并为每个函数编写了单元测试。遇到的主要问题是编码格式，最后统一使用 UTF-8 读取。"
+)
+OTHER = (
+    "我用 matplotlib 画了三张图：成绩分布直方图、各班平均分柱状图和历次考试的折线图，"
+    "调整了中文字体和配色，并把图片保存到 output 目录，报告中说明了每张图反映的结论。"
+)
+
+
+def test_minhash_is_deterministic():
+    signature = minhash(shingles(BASE))
+    assert len(signature) == NUM_PERM
+    assert signature == minhash(shingles(BASE))
+    assert minhash(set()) is None
+
+
+def test_identical_signatures_are_candidates():
+    signatures = [minhash(shingles(BASE)), minhash(shingles(BASE)), minhash(shingles(OTHER)), None]
+    pairs = lsh_candidates(signatures)
+    assert (0, 1) in pairs
+    assert not any(3 in pair for pair in pairs)
+    # 不同分组（题目 / 量表）之间不产生候选
+    assert (0, 1) not in lsh_candidates(signatures, groups=["q1", "q2", "q1", "q1"])
+
+
+def test_cluster_identical_answers():
+    texts = [BASE, OTHER, "\n  " + BASE.lower() + "  \n", None, "", BASE]
+    clusters = cluster_texts(texts)
+    assert clusters == [{"representative": 0, "members": [0, 2, 5], "similarity": {2: 1.0, 5: 1.0}}]
+
+
+def test_threshold_is_inclusive():
+    edited = BASE.replace("UTF-8", "utf8 编码")
+    similarity = template_similarity(edited, BASE)
+    assert 0.8 < similarity < 1.0
+    assert cluster_texts([BASE, edited], threshold=similarity)[0]["members"] == [0, 1]
+    assert cluster_texts([BASE, edited], threshold=similarity + 0.01) == []
+
+
+def test_no_transitive_merge():
+    a = BASE
+    b = BASE + "另外补充了命令行参数。"
+    c = b + "还增加了导出 Excel 的功能，并写了使用说明。"
+    ab, bc, ac = template_similarity(a, b), template_similarity(b, c), template_similarity(a, c)
+    threshold = min(ab, bc)
+    assert ac < threshold
+    # a 是代表，只收纳与 a 本身足够相似的 b；c 与 b 相似也不并入
+    clusters = cluster_texts([a, b, c], threshold=threshold)
+    assert [cluster["members"] for cluster in clusters] == [[0, 1]]
+
+
+def test_groups_keep_clusters_apart():
+    assert cluster_texts([BASE, BASE], groups=["q1", "q2"]) == []
+    assert cluster_texts([BASE, BASE], groups=["q1", "q1"])[0]["members"] == [0, 1]
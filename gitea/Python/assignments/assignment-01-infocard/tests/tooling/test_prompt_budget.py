@@ -0,0 +1,81 @@
+"""
+prompt 材料的 token 预算：估计、截断、max-min 公平分配和按优先级打包（运行：pytest tests/tooling）
+"""
+
+from prompt_budget import PromptBudget, estimate_tokens, fair_allocate, truncate_to_tokens
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd" * 10) == 11
+    # CJK 字符和全角标点约 1 token/字
+    assert estimate_tokens("学生成绩统计，") == 8
+
+
+def test_fair_allocate():
+    # 短的完整保留，长的平分剩余
+    assert fair_allocate([10, 50, 100], 90) == [10, 40, 40]
+    assert fair_allocate([100, 10, 50], 90) == [40, 10, 40]
+    assert fair_allocate([5, 5], 100) == [5, 5]
+    assert fair_allocate([30, 30, 30], 10) == [3, 3, 3]
+    assert fair_allocate([5, 5], -3) == [0, 0]
+    assert fair_allocate([], 10) == []
+
+
+def test_truncate_keeps_head_tail_or_both():
+    text = "HEAD" + "x" * 4000 + "TAIL"
+    assert truncate_to_tokens("short", 100) == "short"
+    head = truncate_to_tokens(text, 100)
+    assert head.startswith("HEAD") and "TAIL" not in head
+    tail = truncate_to_tokens(text, 100, keep="tail")
+    assert tail.endswith("TAIL") and "HEAD" not in tail
+    both = truncate_to_tokens(text, 100, keep="head_tail")
+    assert both.startswith("HEAD") and both.endswith("TAIL")
+    for truncated in (head, tail, both):
+        assert "已截断，原文约 1003 tokens" in truncated
+        assert estimate_tokens(truncated) <= 101
+
+
+def test_pack_floors_then_priority_tiers():
+    budget = PromptBudget(600, min_tokens=100)
+    long_text = "x" * 4000  # 1001 tokens
+    budget.add("readme", long_text, priority=0)
+    budget.add("main.py", long_text, priority=1)
+    budget.add("notes", "y" * 196, priority=1)  # 50 tokens，不足保底按实际长度
+    packed = budget.pack()
+    # 保底 100 + 100 + 50，剩余 350 全部给优先级 0
+    assert packed["notes"] == "y" * 196
+    assert 400 < estimate_tokens(packed["readme"]) <= 450
+    assert 50 < estimate_tokens(packed["main.py"]) <= 100
+    assert budget.trimmed == [
+        {"section": "readme", "tokens": 1001, "kept_tokens": 450},
+        {"section": "main.py", "tokens": 1001, "kept_tokens": 100},
+    ]
+
+
+def test_pack_same_tier_is_fair():
+    budget = PromptBudget(1000, min_tokens=100)
+    budget.add("small", "s" * 796)  # 200 tokens
+    budget.add("big1", "b" * 4000)
+    budget.add("big2", "c" * 4000)
+    budget.pack()
+    assert budget.trimmed == [
+        {"section": "big1", "tokens": 1001, "kept_tokens": 400},
+        {"section": "big2", "tokens": 1001, "kept_tokens": 400},
+    ]
+
+
+def test_pack_budget_below_floors():
+    budget = PromptBudget(120, min_tokens=100)
+    for name in ("a", "b", "c"):
+        budget.add(name, "x" * 4000)
+    budget.pack()
+    assert [t["kept_tokens"] for t in budget.trimmed] == [40, 40, 40]
+
+
+def test_pack_everything_fits():
+    budget = PromptBudget(1000)
+    budget.add("a", "hello")
+    budget.add("b", None)
+    assert budget.pack() == {"a": "hello", "b": ""}
+    assert budget.trimmed == []
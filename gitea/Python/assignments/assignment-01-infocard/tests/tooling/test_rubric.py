@@ -0,0 +1,96 @@
+"""
+量表预编译与本地分数修复：吸附到允许分值、补齐和丢弃评分项（运行：pytest tests/tooling）
+"""
+
+import json
+
+from rubric import compile_rubric, load_rubric
+
+RUBRIC = {
+    "max_score": 10,
+    "borderline_band": [5, 6],
+    "criteria": [
+        {"id": "content", "max_score": 6, "scoring_guide": [[0, "缺失"], [3, "部分"], [6, "完整"]]},
+        {"id": "format", "scoring_guide": {"0": "混乱", "2": "一般", "4": "清晰"}},
+    ],
+}
+
+
+def grade(*criteria, **extra):
+    return {"criteria": [{"id": cid, "score": score} for cid, score in criteria], **extra}
+
+
+def test_compiled_once_per_content(tmp_path):
+    rubric = compile_rubric(RUBRIC)
+    assert compile_rubric(dict(RUBRIC)) is rubric
+    assert compile_rubric(rubric) is rubric
+    path = tmp_path / "rubric.json"
+    path.write_text(json.dumps(RUBRIC, ensure_ascii=False), encoding="utf-8")
+    assert load_rubric(path) is load_rubric(path)
+    assert rubric.order == ("content", "format")
+    assert rubric.by_id["content"].allowed == (0, 3, 6)
+    # 没有 max_score 时取 scoring_guide 中的最大分值
+    assert rubric.by_id["format"].max_score == 4
+
+
+def test_snap_to_nearest_allowed_score():
+    content = compile_rubric(RUBRIC).by_id["content"]
+    assert content.snap(4) == 3
+    assert content.snap(5) == 6
+    # 等距时取较低值；超出范围截断
+    assert content.snap(4.5) == 3
+    assert content.snap(-2) == 0
+    assert content.snap(9) == 6
+
+
+def test_valid_result_is_untouched():
+    resp = grade(("content", 6), ("format", 2))
+    assert compile_rubric(RUBRIC).repair(resp) == []
+    assert resp["total"] == 8
+    assert "flags" not in resp and "score_repairs" not in resp
+
+
+def test_repair_snaps_fills_and_drops():
+    resp = grade(("format", "3.9"), ("extra", 5), ("content", 4))
+    repairs = compile_rubric(RUBRIC).repair(resp)
+    assert [c["id"] for c in resp["criteria"]] == ["content", "format"]
+    assert [c["score"] for c in resp["criteria"]] == [3, 4]
+    assert resp["total"] == 7
+    assert {"id": "extra", "action": "dropped"} in repairs
+    assert {"id": "content", "action": "snapped", "from": 4, "to": 3} in repairs
+    assert resp["flags"] == ["need_review", "score_repaired"]
+
+    resp = grade(("content", None))
+    compile_rubric(RUBRIC).repair(resp)
+    assert [c["score"] for c in resp["criteria"]] == [0, 0]
+    assert [r["action"] for r in resp["score_repairs"]] == ["filled", "filled"]
+
+
+def test_empty_criteria_not_repaired():
+    resp = {"criteria": [], "total": 0, "flags": ["llm_error"]}
+    assert compile_rubric(RUBRIC).repair(resp) == []
+    assert resp == {"criteria": [], "total": 0, "flags": ["llm_error"]}
+
+
+def test_validate():
+    rubric = compile_rubric(RUBRIC)
+    assert rubric.validate(grade(("content", 3)))
+    assert not rubric.validate(grade(("unknown", 3)))
+    assert not rubric.validate(grade(("content", "高")))
+    assert not rubric.validate({"criteria": "content: 3"})
+
+
+def test_finalize_flags_borderline_and_low_confidence():
+    rubric = compile_rubric(RUBRIC)
+    assert rubric.finalize(grade(("content", 6), ("format", 4)))["flags"] == []
+    assert rubric.finalize(grade(("content", 3), ("format", 2)))["flags"] == ["need_review"]
+    low = rubric.finalize(grade(("content", 6), ("format", 4), confidence=0.5))
+    assert low["flags"] == ["need_review"]
+
+
+def test_invalid_rubric_text_only_rounds():
+    rubric = compile_rubric("{not json")
+    resp = grade(("anything", 2.6), ("other", -1))
+    rubric.repair(resp)
+    assert [c["score"] for c in resp["criteria"]] == [3, 0]
+    assert resp["total"] == 3
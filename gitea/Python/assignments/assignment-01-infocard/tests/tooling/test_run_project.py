@@ -0,0 +1,95 @@
+"""
+期末项目命令的并行执行：stateful / after 解析、快照和结果顺序（运行：pytest tests/tooling）
+"""
+
+from run_project import ProjectRunner
+
+
+def cmd(command, **extra):
+    return {"command": command, "description": command, **extra}
+
+
+def plan_of(tmp_path, commands):
+    runner = ProjectRunner(str(tmp_path))
+    plan = runner.plan_commands({"commands": commands})
+    return runner, [(spec["stateful"], spec["after"], spec["snapshot"]) for spec in plan]
+
+
+def test_plan_defaults(tmp_path):
+    _, plan = plan_of(tmp_path, {
+        "demo": [cmd("init"), cmd("show", stateful=False), cmd("add")],
+        "error_handling": [cmd("bad")],
+    })
+    # demo 默认 stateful；无状态命令取前面最近一个 stateful 命令结束时的状态
+    assert plan == [(True, [], None), (False, [], 0), (True, [], None), (False, [], 2)]
+
+
+def test_plan_after(tmp_path):
+    runner, plan = plan_of(tmp_path, {
+        "demo": [
+            cmd("init", id="init"),
+            cmd("add", id="add"),
+            cmd("report", id="report", stateful=False, after="init"),
+            cmd("fresh", stateful=False, after=[]),
+        ],
+        "error_handling": [
+            cmd("after-report", after=["report"]),
+            cmd("typo", after="missing"),
+        ],
+    })
+    assert plan == [
+        (True, [], None),
+        (True, [], None),
+        (False, [0], 0),      # 只等待 init，取 init 之后的状态
+        (False, [], None),    # after: [] 在初始状态上运行
+        (False, [2], None),   # 依赖的命令都不是 stateful：初始状态
+        (False, [], 1),       # 引用有误：忽略 after，按默认方式运行
+    ]
+    assert any("missing" in error for error in runner.results["errors"])
+
+
+def make_project(tmp_path):
+    project = tmp_path / "project"
+    project.mkdir()
+    (project / "state.txt").write_text("0\n")
+    return project
+
+
+def test_parallel_runs_see_sequential_state(tmp_path):
+    project = make_project(tmp_path)
+    manifest = {"commands": {
+        "demo": [
+            cmd("echo 1 >> state.txt", id="first"),
+            cmd("cat state.txt", stateful=False),
+            cmd("echo 2 >> state.txt"),
+            cmd("cat state.txt && echo scratch > scratch.txt", stateful=False, after="first"),
+        ],
+        "error_handling": [cmd("cat state.txt; exit 3")],
+    }}
+    runner = ProjectRunner(str(project), jobs=4)
+    runner.run_all_commands(manifest)
+    results = runner.results["command_results"]
+    # 结果按 manifest 顺序排列
+    expected = [c["command"] for category in ("demo", "error_handling") for c in manifest["commands"][category]]
+    assert [r["command"] for r in results] == expected
+    assert results[1]["stdout"] == "0\n1\n"
+    assert results[3]["stdout"] == "0\n1\n"
+    assert results[4]["stdout"] == "0\n1\n2\n"
+    assert results[4]["exit_code"] == 3
+    # 无状态命令在克隆中运行，不改变项目目录
+    assert (project / "state.txt").read_text() == "0\n1\n2\n"
+    assert not (project / "scratch.txt").exists()
+
+
+def test_clone_paths_are_reported_as_project_dir(tmp_path):
+    project = make_project(tmp_path)
+    runner = ProjectRunner(str(project), jobs=2)
+    runner.run_all_commands({"commands": {"error_handling": [cmd("pwd")]}})
+    assert runner.results["command_results"][0]["stdout"].strip() == str(project.resolve())
+
+
+def test_jobs_1_runs_in_place(tmp_path):
+    project = make_project(tmp_path)
+    runner = ProjectRunner(str(project), jobs=1)
+    runner.run_all_commands({"commands": {"error_handling": [cmd("echo x > scratch.txt")]}})
+    assert (project / "scratch.txt").exists()
@@ -0,0 +1,95 @@
+"""
+学生源代码的 AST 摘要：复杂度、LLM / 文件读写调用识别和重点函数挑选（运行：pytest tests/tooling）
+"""
+
+import ast
+
+from source_digest import build_digest, complexity, format_bodies, format_outline, get_digest
+
+APP = '''"""命令行问答助手"""
+import json
+import requests
+
+API_URL = "https://api.deepseek.com/chat/completions"
+
+
+def ask(question, api_key):
+    """调用 LLM 回答问题"""
+    resp = requests.post(API_URL, json={"messages": [{"role": "user", "content": question}]},
+                         headers={"Authorization": api_key})
+    return resp.json()["choices"][0]["message"]["content"]
+
+
+def save_history(history, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(history, f)
+
+
+def helper(x):
+    return x
+
+
+class Session:
+    def run(self):
+        def inner():
+            return 1
+        return inner()
+
+
+if __name__ == "__main__":
+    print(ask("你好", "key"))
+'''
+
+
+def test_complexity():
+    tree = ast.parse(
+        "def f(xs):\n"
+        "    for x in xs:\n"
+        "        if x > 0 and x < 10 or x == 100:\n"
+        "            return [y for y in xs if y]\n"
+        "    return None\n"
+    )
+    # 1 + for + if + 布尔运算 2 个 + 推导式 1 + 推导式中的 if 1
+    assert complexity(tree.body[0]) == 7
+
+
+def test_call_sites_and_outline():
+    digest = build_digest({"app.py": APP})
+    entry = digest["files"][0]
+    assert entry["doc"] == "命令行问答助手"
+    assert entry["imports"] == ["json", "requests"]
+    functions = {f["qualname"]: f for f in entry["functions"]}
+    assert set(functions) == {"ask", "save_history", "helper", "Session.run", "Session.run.inner", "<module>"}
+    assert functions["ask"]["llm_calls"] == [{"line": 10, "call": "requests.post"}]
+    assert {c["call"] for c in functions["save_history"]["file_io"]} == {"open", "json.dump"}
+    assert functions["Session.run.inner"]["nested"] is True
+    outline = format_outline(digest)
+    assert "def ask(question, api_key)  # L8，复杂度 1，LLM 调用: requests.post" in outline
+    assert "class Session" in outline
+
+
+def test_bodies_ranked_by_signal_within_budget():
+    digest = build_digest({"app.py": APP})
+    names = [b["qualname"] for b in digest["bodies"]]
+    # LLM 调用优先；没有信号的 helper 和嵌套函数不入选
+    assert names[0] == "ask"
+    assert "save_history" in names
+    assert "helper" not in names and "Session.run.inner" not in names
+    small = build_digest({"app.py": APP}, body_tokens=40)
+    assert [b["qualname"] for b in small["bodies"]] == ["save_history"]
+
+
+def test_syntax_error_keeps_raw_source():
+    digest = build_digest({"broken.py": "def f(:\n    pass\n"})
+    assert "parse_error" in digest["files"][0]
+    assert digest["raw"] == {"broken.py": "def f(:\n    pass\n"}
+    assert "broken.py（无法解析，原文）" in format_bodies(digest)
+
+
+def test_get_digest_reuses_until_source_changes():
+    run_results = {"source_code": {"app.py": APP}}
+    digest = get_digest(run_results)
+    assert run_results["source_digest"] is digest
+    assert get_digest(run_results) is digest
+    run_results["source_code"] = {"app.py": APP + "\nx = 1\n"}
+    assert get_digest(run_results) is not digest
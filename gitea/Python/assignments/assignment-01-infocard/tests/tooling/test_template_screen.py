@@ -0,0 +1,56 @@
+"""
+文档与模板的相似度预筛（运行：pytest tests/tooling）
+"""
+
+from template_screen import load_template, screen, shingles, template_similarity
+
+TEMPLATE = """# 实验报告
+
+## 我做了什么
+
+（在这里描述你完成的功能）
+
+## 遇到的问题
+
+（在这里记录遇到的问题和解决办法）
+"""
+
+
+def test_whitespace_and_case_do_not_matter():
+    reformatted = TEMPLATE.replace("\n\n", "\n").replace("# ", "#   ").upper()
+    assert template_similarity(reformatted, TEMPLATE) == 1.0
+
+
+def test_short_and_empty_text():
+    assert shingles("") == set()
+    assert shingles("abc") == {"abc"}
+    assert template_similarity("", "") == 1.0
+    assert template_similarity("", TEMPLATE) == 0.0
+
+
+def test_unchanged_template_matches():
+    result = screen(TEMPLATE, TEMPLATE)
+    assert result == {"path": "template_match", "similarity": 1.0, "threshold": 0.9}
+
+
+def test_filled_in_report_goes_to_llm():
+    answer = TEMPLATE.replace(
+        "（在这里描述你完成的功能）",
+        "实现了信息卡片的输入校验：姓名不能为空，年龄必须是 0 到 150 之间的整数，邮箱用正则检查格式。"
+        "校验失败时打印具体原因并让用户重新输入，全部通过后把卡片保存为 JSON 文件。",
+    )
+    result = screen(answer, TEMPLATE)
+    assert result["path"] == "llm"
+    assert result["similarity"] < 0.9
+
+
+def test_threshold_is_inclusive():
+    similarity = template_similarity(TEMPLATE + "补充", TEMPLATE)
+    assert screen(TEMPLATE + "补充", TEMPLATE, threshold=similarity)["path"] == "template_match"
+    assert screen(TEMPLATE + "补充", TEMPLATE, threshold=similarity + 0.01)["path"] == "llm"
+
+
+def test_missing_template_skips_screen(tmp_path):
+    assert load_template(None) is None
+    assert load_template(str(tmp_path / "missing.md")) is None
+    assert screen(TEMPLATE, None) is None
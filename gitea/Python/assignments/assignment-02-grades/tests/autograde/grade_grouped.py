@@ -5,42 +5,92 @@
 - core 组满分 10
 - edge 组满分 5
 - 总分为各组得分之和（满分 15）
+
+批量重评：--cohort-root <dir> 用进程池评分 <dir>/<student>/test-results/*.xml，
+在每个学生目录写出 grade.json / summary.md，并汇总为 cohort_grades.jsonl / .csv
 """
 
 import argparse
+import csv
 import xml.etree.ElementTree as ET
 import json
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 
+from junit_cache import JUnitCache, cache_key, default_cache_dir
 
-def parse_junit_files(junit_dir):
-    """解析目录下所有 JUnit XML 报告"""
-    results = []
-    xml_files = glob(os.path.join(junit_dir, "TEST-*.xml")) or glob(
+
+# 每组只保留前 N 个未通过的测试名称，避免超大测试集撑爆内存
+MAX_FAILED_NAMES = 10
+# 日志中最多逐条打印的测试数
+MAX_LISTED_TESTS = 200
+# 解析结果缓存的命名空间，计分逻辑变化时需更新
+CACHE_NAMESPACE = "grade_grouped:v1"
+
+
+def find_junit_files(junit_dir):
+    """查找目录下的 JUnit XML 报告"""
+    return glob(os.path.join(junit_dir, "TEST-*.xml")) or glob(
         os.path.join(junit_dir, "*.xml")
     )
 
-    for xml_file in xml_files:
+
+def _testcase_outcome(testcase):
+    """返回 (passed, skipped)"""
+    # 注意：Element 没有子元素时 bool 值为 False，所以用 find() is not None
+    failed = testcase.find("failure") is not None or testcase.find("error") is not None
+    skipped = testcase.find("skipped") is not None
+    return not failed and not skipped, skipped
+
+
+def iter_testcases(xml_file):
+    """
+    流式遍历单个 JUnit XML 报告中的 testcase
+
+    使用 iterparse 边解析边释放已处理的节点，内存占用与测试数量无关。
+
+    Yields
+    ------
+    (classname, name, passed, skipped)
+    """
+    stack = []
+    suite_depth = 0
+    for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if elem.tag == "testsuite":
+                suite_depth += 1
+            continue
+
+        stack.pop()
+        if elem.tag == "testsuite":
+            suite_depth -= 1
+        elif elem.tag == "testcase" and suite_depth > 0:
+            passed, skipped = _testcase_outcome(elem)
+            yield elem.get("classname", ""), elem.get("name", ""), passed, skipped
+
+        # testsuite 下的子节点（testcase、system-out 等）处理完即从父节点移除
+        if stack and stack[-1].tag == "testsuite" and elem.tag != "testsuite":
+            stack[-1].remove(elem)
+
+
+def parse_junit_files(junit_dir):
+    """解析目录下所有 JUnit XML 报告（返回完整列表，大型测试集请用 grade_junit_dir）"""
+    results = []
+    for xml_file in find_junit_files(junit_dir):
         try:
-            root = ET.parse(xml_file).getroot()
-            for testsuite in root.iter("testsuite"):
-                for testcase in testsuite.iter("testcase"):
-                    classname = testcase.get("classname", "")
-                    name = testcase.get("name", "")
-                    # 注意：Element 没有子元素时 bool 值为 False，所以用 find() is not None
-                    failed = testcase.find("failure") is not None or testcase.find("error") is not None
-                    skipped = testcase.find("skipped") is not None
-                    results.append(
-                        {
-                            "classname": classname,
-                            "name": name,
-                            "passed": not failed and not skipped,
-                            "skipped": skipped,
-                        }
-                    )
+            for classname, name, passed, skipped in iter_testcases(xml_file):
+                results.append(
+                    {
+                        "classname": classname,
+                        "name": name,
+                        "passed": passed,
+                        "skipped": skipped,
+                    }
+                )
         except Exception as e:
             print(f"Error parsing {xml_file}: {e}", file=sys.stderr)
     return results
@@ -70,30 +120,86 @@ def categorize_test(classname, groups_config):
     return groups_config.get("fallback_group", "core")
 
 
-def calculate_grouped_score(test_results, groups_config):
-    """按分组计算得分"""
-    groups = groups_config.get("groups", {})
-    group_stats = {}
+class TestClassifier:
+    """
+    由 test_groups.json 编译一次的测试分组器
 
-    for group_name, group_info in groups.items():
+    所有分组 pattern 合并为一个带命名分组的正则：每个分支是一个
+    (?=.*?pattern) 前瞻，在字符串开头按配置顺序依次尝试，因此与
+    categorize_test 一样是“第一个能匹配的分组获胜”。结果按 classname 缓存。
+    """
+
+    def __init__(self, groups_config):
+        self.fallback = groups_config.get("fallback_group", "core")
+        self._cache = {}
+        self._group_names = {}
+        patterns = [group_info.get("pattern", "") for group_info in groups_config.get("groups", {}).values()]
+        branches = []
+        for i, group_name in enumerate(groups_config.get("groups", {})):
+            key = f"g{i}"
+            self._group_names[key] = group_name
+            branches.append(f"(?=.*?(?:{patterns[i]}))(?P<{key}>)")
+        try:
+            # 反向引用的分组编号在合并后会错位，这类配置不合并
+            if any(re.search(r"\\\d|\(\?P=", p) for p in patterns):
+                raise re.error("backreference in group pattern")
+            self._regex = re.compile("|".join(branches), re.IGNORECASE | re.DOTALL) if branches else None
+            self._patterns = None
+        except re.error:
+            # pattern 含反向引用、重复命名分组等无法合并的写法时，退回逐个匹配
+            self._regex = None
+            self._patterns = [
+                (group_name, re.compile(group_info.get("pattern", ""), re.IGNORECASE))
+                for group_name, group_info in groups_config.get("groups", {}).items()
+            ]
+
+    def _match(self, classname):
+        if self._regex is not None:
+            m = self._regex.match(classname)
+            return self._group_names[m.lastgroup] if m else self.fallback
+        for group_name, pattern in self._patterns or []:
+            if pattern.search(classname):
+                return group_name
+        return self.fallback
+
+    def classify(self, classname):
+        """返回 classname 所属分组"""
+        group = self._cache.get(classname)
+        if group is None:
+            group = self._cache[classname] = self._match(classname)
+        return group
+
+
+def new_group_stats(groups_config):
+    """初始化各组计数器"""
+    group_stats = {}
+    for group_name, group_info in groups_config.get("groups", {}).items():
         group_stats[group_name] = {
             "passed": 0,
             "total": 0,
             "max_score": group_info.get("max_score", 0),
             "tests": [],
         }
+    return group_stats
 
-    for test in test_results:
-        group = categorize_test(test["classname"], groups_config)
-        if group not in group_stats:
-            group = groups_config.get("fallback_group", "core")
 
-        group_stats[group]["total"] += 1
-        if test["passed"]:
-            group_stats[group]["passed"] += 1
-        else:
-            group_stats[group]["tests"].append(f"{test['classname']}.{test['name']}")
+def tally_test(group_stats, classifier, classname, name, passed):
+    """将单个测试结果计入所属分组，返回分组名"""
+    group = classifier.classify(classname)
+    if group not in group_stats:
+        group = classifier.fallback
+
+    stats = group_stats[group]
+    stats["total"] += 1
+    if passed:
+        stats["passed"] += 1
+    elif len(stats["tests"]) < MAX_FAILED_NAMES:
+        stats["tests"].append(f"{classname}.{name}")
+    return group
 
+
+def summarize_group_stats(group_stats):
+    """由各组计数器计算得分"""
     total_score = 0
     total_max = 0
     group_scores = {}
@@ -111,7 +217,7 @@ def calculate_grouped_score(test_results, groups_config):
             "total": stats["total"],
             "max_score": stats["max_score"],
             "score": round(group_score, 2),
-            "failed_tests": stats["tests"][:10],
+            "failed_tests": stats["tests"][:MAX_FAILED_NAMES],
         }
         total_score += group_score
 
@@ -122,40 +228,75 @@ def calculate_grouped_score(test_results, groups_config):
     }
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Grade programming assignments with test groups")
-    parser.add_argument("--junit-dir", required=True, help="Directory containing JUnit XML files")
-    parser.add_argument("--groups", default="test_groups.json", help="Test groups configuration file")
-    parser.add_argument("--out", default="grade.json", help="Output JSON file")
-    parser.add_argument("--summary", default="summary.md", help="Output summary markdown file")
-    args = parser.parse_args()
+def calculate_grouped_score(test_results, groups_config):
+    """按分组计算得分"""
+    group_stats = new_group_stats(groups_config)
+    classifier = TestClassifier(groups_config)
+    for test in test_results:
+        tally_test(group_stats, classifier, test["classname"], test["name"], test["passed"])
+    return summarize_group_stats(group_stats)
 
-    test_results = parse_junit_files(args.junit_dir)
 
-    if not test_results:
-        print("Warning: No test results found", file=sys.stderr)
-        grade_data = {
-            "total_score": 0,
-            "max_score": 0,
-            "groups": {},
-            "error": "No test results found",
-        }
-    else:
-        groups_config = load_groups_config(args.groups)
-        
-        # Debug: 显示测试分类
-        print(f"📝 Found {len(test_results)} tests:")
-        for test in test_results:
-            group = categorize_test(test["classname"], groups_config)
-            status = "✅" if test["passed"] else "❌"
-            print(f"  {status} [{group}] {test['classname']}.{test['name']}")
-        
-        grade_data = calculate_grouped_score(test_results, groups_config)
-
-    with open(args.out, "w", encoding="utf-8") as f:
+def grade_junit_dir(junit_dir, groups_config, verbose=False, cache=None):
+    """
+    流式解析并评分，每个 testcase 直接计入分组计数器，不保留完整测试列表
+
+    传入 cache（JUnitCache）时，以 XML 内容 + 分组配置的哈希查缓存，命中则跳过解析和计分
+
+    Returns
+    -------
+    (grade_data, test_count)
+    """
+    group_stats = new_group_stats(groups_config)
+    classifier = TestClassifier(groups_config)
+    test_count = 0
+    xml_files = find_junit_files(junit_dir)
+
+    key = None
+    if cache is not None and xml_files:
+        key = cache_key(CACHE_NAMESPACE, xml_files, groups_config)
+        cached = cache.get(key)
+        if cached is not None:
+            if verbose:
+                print(f"  ♻️ 命中解析缓存 ({key[:12]})")
+            return cached["grade"], cached["test_count"]
+
+    parse_failed = False
+    for xml_file in xml_files:
+        try:
+            for classname, name, passed, _ in iter_testcases(xml_file):
+                group = tally_test(group_stats, classifier, classname, name, passed)
+                test_count += 1
+                if verbose and test_count <= MAX_LISTED_TESTS:
+                    status = "✅" if passed else "❌"
+                    print(f"  {status} [{group}] {classname}.{name}")
+        except Exception as e:
+            parse_failed = True
+            print(f"Error parsing {xml_file}: {e}", file=sys.stderr)
+
+    if verbose and test_count > MAX_LISTED_TESTS:
+        print(f"  ... 还有 {test_count - MAX_LISTED_TESTS} 个测试未列出")
+
+    grade_data = summarize_group_stats(group_stats)
+    if key is not None and test_count > 0 and not parse_failed:
+        cache.put(key, {"grade": grade_data, "test_count": test_count})
+    return grade_data, test_count
+
+
+NO_RESULTS_GRADE = {
+    "total_score": 0,
+    "max_score": 0,
+    "groups": {},
+    "error": "No test results found",
+}
+
+
+def write_grade_files(grade_data, out_path, summary_path):
+    """写出 grade.json 和 summary.md"""
+    with open(out_path, "w", encoding="utf-8") as f:
         json.dump(grade_data, f, ensure_ascii=False, indent=2)
 
-    with open(args.summary, "w", encoding="utf-8") as f:
+    with open(summary_path, "w", encoding="utf-8") as f:
         f.write("# 编程测试成绩报告\n\n")
         f.write(f"**总分：{grade_data['total_score']:.2f} / {grade_data['max_score']}**\n\n")
         f.write("## 分组得分\n\n")
@@ -177,9 +318,143 @@ def main():
             if len(all_failed) > 20:
                 f.write(f"\n... 还有 {len(all_failed) - 20} 个未通过的测试\n")
 
+
+def find_cohort_students(cohort_root, junit_subdir="test-results"):
+    """查找 <cohort_root>/<student>/<junit_subdir>/*.xml，返回按学生名排序的目录列表"""
+    students = []
+    for entry in sorted(os.listdir(cohort_root)):
+        junit_dir = os.path.join(cohort_root, entry, junit_subdir)
+        if os.path.isdir(junit_dir) and find_junit_files(junit_dir):
+            students.append(entry)
+    return students
+
+
+def grade_cohort_student(cohort_root, student, junit_subdir, groups_config, out_name, summary_name, cache=None):
+    """进程池 worker：评分单个学生并在其目录下写出 grade.json / summary.md"""
+    student_dir = os.path.join(cohort_root, student)
+    grade_data, test_count = grade_junit_dir(os.path.join(student_dir, junit_subdir), groups_config, cache=cache)
+    if test_count == 0:
+        grade_data = dict(NO_RESULTS_GRADE)
+    write_grade_files(
+        grade_data,
+        os.path.join(student_dir, out_name),
+        os.path.join(student_dir, summary_name),
+    )
+    return student, grade_data, test_count
+
+
+def write_cohort_table(rows, group_names, jsonl_path, csv_path):
+    """写出合并成绩表（JSONL + CSV）"""
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for student, grade_data, test_count in rows:
+            record = {"student": student, "test_count": test_count, **grade_data}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    fieldnames = ["student", "total_score", "max_score", "test_count"]
+    for group_name in group_names:
+        fieldnames += [f"{group_name}_passed", f"{group_name}_total", f"{group_name}_score"]
+    fieldnames.append("error")
+
+    with open(csv_path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for student, grade_data, test_count in rows:
+            row = {
+                "student": student,
+                "total_score": grade_data["total_score"],
+                "max_score": grade_data["max_score"],
+                "test_count": test_count,
+                "error": grade_data.get("error", ""),
+            }
+            for group_name in group_names:
+                group_info = grade_data["groups"].get(group_name, {})
+                row[f"{group_name}_passed"] = group_info.get("passed", 0)
+                row[f"{group_name}_total"] = group_info.get("total", 0)
+                row[f"{group_name}_score"] = group_info.get("score", 0)
+            writer.writerow(row)
+
+
+def grade_cohort(args, groups_config, cache=None):
+    """批量评分：用进程池并行解析 <cohort_root>/<student>/test-results/*.xml"""
+    students = find_cohort_students(args.cohort_root, args.junit_subdir)
+    print(f"📝 Found {len(students)} students under {args.cohort_root}")
+    if not students:
+        print("Warning: No test results found", file=sys.stderr)
+
+    out_name = os.path.basename(args.out)
+    summary_name = os.path.basename(args.summary)
+    rows = []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            pool.submit(
+                grade_cohort_student,
+                args.cohort_root,
+                student,
+                args.junit_subdir,
+                groups_config,
+                out_name,
+                summary_name,
+                cache,
+            )
+            for student in students
+        ]
+        for student, future in zip(students, futures):
+            try:
+                _, grade_data, test_count = future.result()
+            except Exception as e:
+                # 单个学生目录或报告异常时记为错误行，不影响其他学生的成绩表
+                print(f"  {student}: grading failed: {e}", file=sys.stderr)
+                grade_data, test_count = dict(NO_RESULTS_GRADE, error=f"Grading failed: {e}"), 0
+            rows.append((student, grade_data, test_count))
+            print(f"  {student}: {grade_data['total_score']:.2f}/{grade_data['max_score']} ({test_count} tests)")
+
+    group_names = list(groups_config.get("groups", {}))
+    write_cohort_table(rows, group_names, args.cohort_jsonl, args.cohort_csv)
+    print(f"Cohort grading complete: {len(rows)} students -> {args.cohort_jsonl}, {args.cohort_csv}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade programming assignments with test groups")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--junit-dir", help="Directory containing JUnit XML files")
+    source.add_argument(
+        "--cohort-root",
+        help="Grade every <cohort-root>/<student>/<junit-subdir>/*.xml in one run",
+    )
+    parser.add_argument("--groups", default="test_groups.json", help="Test groups configuration file")
+    parser.add_argument("--out", default="grade.json", help="Output JSON file")
+    parser.add_argument("--summary", default="summary.md", help="Output summary markdown file")
+    parser.add_argument("--junit-subdir", default="test-results", help="JUnit directory inside each student dir (cohort mode)")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (cohort mode, default: CPU count)")
+    parser.add_argument("--cohort-jsonl", default="cohort_grades.jsonl", help="Combined grade table, JSONL (cohort mode)")
+    parser.add_argument("--cohort-csv", default="cohort_grades.csv", help="Combined grade table, CSV (cohort mode)")
+    parser.add_argument("--cache-dir", default=default_cache_dir(), help="Parsed-result cache directory; caching is off unless this or $AUTOGRADE_CACHE_DIR is set")
+    parser.add_argument("--cache-max-mb", type=float, default=64, help="Cache size cap in MB (LRU eviction)")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-parse JUnit XML")
+    args = parser.parse_args()
+
+    groups_config = load_groups_config(args.groups)
+    cache = None
+    if args.cache_dir and not args.no_cache:
+        cache = JUnitCache(args.cache_dir, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+
+    if args.cohort_root:
+        grade_cohort(args, groups_config, cache)
+        return
+
+    # Debug: 显示测试分类
+    print("📝 Tests:")
+    grade_data, test_count = grade_junit_dir(args.junit_dir, groups_config, verbose=True, cache=cache)
+    print(f"📝 Found {test_count} tests")
+
+    if test_count == 0:
+        print("Warning: No test results found", file=sys.stderr)
+        grade_data = dict(NO_RESULTS_GRADE)
+
+    write_grade_files(grade_data, args.out, args.summary)
+
     print(f"Grading complete: {grade_data['total_score']:.2f}/{grade_data['max_score']}")
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+LLM 响应的持久化缓存（SQLite）
+
+key 为 (model, temperature, 完整渲染后的 prompt) 的 SHA-256，prompt 中已包含题目、
+量表和学生答案，因此量表或答案任一变化都会产生新 key。只缓存解析成功的 JSON 响应。
+temperature=0 时同一输入的评分结果可复用，学生重复触发评分不再调用 API。
+
+按 last_used 做 LRU，响应总字节数超过上限时从最久未用的开始淘汰。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+def default_cache_path():
+    """$LLM_CACHE_PATH 或 ~/.cache/autograde/llm_cache.sqlite3；调用时读取环境变量"""
+    return os.getenv(
+        "LLM_CACHE_PATH",
+        os.path.join(os.path.expanduser("~"), ".cache", "autograde", "llm_cache.sqlite3"),
+    )
+
+
+class LLMCache:
+    """
+    SQLite 缓存，可在多线程（批量评分）和多进程间共享
+
+    refresh=True 时不读缓存，但仍写入新结果（用于强制重新评分）
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES, refresh=False):
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT,"
+            " response TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, temperature, prompt):
+        payload = json.dumps([model, temperature, prompt], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """命中返回解析后的 dict（每次返回新对象），否则返回 None"""
+        if self.refresh:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+                self._conn.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            except Exception as e:
+                print(f"Warning: LLM cache read failed: {e}", file=sys.stderr)
+                self.misses += 1
+                return None
+
+    def put(self, key, model, response):
+        """写入解析后的响应，并按大小上限淘汰"""
+        text = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, model, text, len(text.encode("utf-8")), now, now),
+                )
+                self._evict()
+                self._conn.commit()
+            except Exception as e:
+                print(f"Warning: LLM cache write failed: {e}", file=sys.stderr)
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def scoped(self):
+        """共用本缓存、单独计数的视图（清单模式下每个任务一个，写入各自的 summary.md）"""
+        return CacheScope(self)
+
+    def close(self):
+        self._conn.close()
+
+
+class CacheScope:
+    """LLMCache 的计数视图：读写委托给底层缓存，hits / misses 只统计经由本视图的查询"""
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, model, temperature, prompt):
+        return self.cache.make_key(model, temperature, prompt)
+
+    def get(self, key):
+        value = self.cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, model, response):
+        self.cache.put(key, model, response)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
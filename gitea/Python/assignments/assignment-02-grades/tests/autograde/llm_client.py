@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+LLM API 客户端（OpenAI 兼容的 chat/completions 接口）
+
+- 共享一个 requests.Session，keep-alive 复用 TCP/TLS 连接，连接池大小与并发数匹配
+- 429 / 5xx / 连接错误 / 超时自动重试：指数退避 + full jitter，响应带 Retry-After 时
+  至少等待该时长
+- 每次调用有总时长预算（deadline），重试等待不会超出预算
+- 返回尝试次数和 usage（含服务商上下文缓存命中的 token 数），调用方写入 grade.json，
+  客户端累计全部调用的 token 用量，用于衡量整个班级评分中前缀缓存的效果
+- 提供 ledger（llm_ledger.LLMLedger）时每次调用（含缓存命中和失败）写一行台账
+- 单次请求超过观测到的 p90 耗时时发出对冲请求；请求失败率过高时熔断，直接抛出
+  CircuitOpenError，由调用方标记 llm_deferred + need_review（见 llm_resilience）
+- 提供 replay（llm_replay.LLMReplay）时录制每次调用，或只从录制中回放、不发出请求
+"""
+
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_ledger import LedgerTimer, read_ledger
+from llm_resilience import DEFAULT_HEDGE_AFTER, PROBE, CircuitBreaker, LatencyTracker, seed_from_ledger
+
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMCallError(Exception):
+    """重试耗尽、预算用完或不可重试的错误，attempts 为已发出的请求轮数（不含对冲请求）"""
+
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class CircuitOpenError(LLMCallError):
+    """熔断器打开，调用被推迟（未发出或不再继续发出请求）"""
+
+
+class ReplayMissError(LLMCallError):
+    """回放模式下没有该调用的录制"""
+
+
+def parse_retry_after(value):
+    """解析 Retry-After（秒数或 HTTP 日期），无法解析返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_usage(usage):
+    """
+    统一 usage 字段：prompt_tokens / completion_tokens / cache_hit_tokens
+
+    缓存命中数兼容 DeepSeek（prompt_cache_hit_tokens）和 OpenAI
+    （prompt_tokens_details.cached_tokens）两种格式
+    """
+    usage = usage or {}
+    hit = usage.get("prompt_cache_hit_tokens")
+    if hit is None:
+        hit = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    return {
+        "prompt_tokens": usage.get("prompt_tokens") or 0,
+        "completion_tokens": usage.get("completion_tokens") or 0,
+        "cache_hit_tokens": hit or 0,
+    }
+
+
+class LLMClient:
+    """
+    线程安全地被多个评分线程共享（批量模式下 pool_size 应不小于并发数）
+    """
+
+    def __init__(self, api_url, api_key, max_attempts=4, deadline=180.0, timeout=(10, 60),
+                 backoff_base=1.0, backoff_max=20.0, pool_size=16, ledger=None,
+                 hedge_after=DEFAULT_HEDGE_AFTER, breaker=None, replay=None):
+        self.api_url = api_url
+        self.ledger = ledger
+        self.replay = replay
+        self.latency = LatencyTracker(hedge_after)
+        self.breaker = breaker or CircuitBreaker()
+        if ledger is not None:
+            seed_from_ledger(read_ledger(ledger.path), self.latency, self.breaker)
+        self.max_attempts = max(1, max_attempts)
+        self.deadline = deadline
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+        self.totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cache_hit_tokens": 0}
+        self._totals_lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        """第 attempt 次失败后的等待时间（full jitter）"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def chat_json(self, model, prompt, temperature=0, top_p=1, cache=None, tags=None):
+        """
+        发送单条 user 消息并把回复解析为 JSON
+
+        提供 cache（LLMCache）时先查缓存，只缓存解析成功的响应。
+        返回 (dict, info)，info 含 attempts（请求轮数）、hedges（对冲请求数）和 usage
+        （见 parse_usage）；本地缓存命中时 attempts 为 0、usage 为 None。
+        熔断器打开时抛出 CircuitOpenError。tags（如 dimension、student_id）原样写入台账。
+        回放模式下只读取录制（attempts 为 0、usage 为 None），没有录制时抛出 ReplayMissError。
+        """
+        timer = LedgerTimer(self.ledger, model=model, **(tags or {}))
+        replay_key = None
+        if self.replay is not None:
+            replay_key = self.replay.make_key(model, temperature, prompt)
+            if self.replay.replaying:
+                recorded = self.replay.get(replay_key, tags)
+                if recorded is None:
+                    timer.finish("replay_miss")
+                    raise ReplayMissError(f"No recorded LLM response for prompt {replay_key[:16]}", 0)
+                timer.finish("replay")
+                return recorded[0], {"attempts": 0, "hedges": 0, "usage": None}
+
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, temperature, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                timer.finish("cache")
+                self._record(replay_key, model, temperature, top_p, prompt, cached, None, tags)
+                return cached, {"attempts": 0, "hedges": 0, "usage": None}
+        try:
+            parsed, info = self._post_json(model, prompt, temperature, top_p)
+        except CircuitOpenError as e:
+            timer.finish("deferred", attempts=e.attempts, error=e)
+            raise
+        except LLMCallError as e:
+            timer.finish("error", attempts=e.attempts, error=e)
+            raise
+        timer.finish("ok", attempts=info["attempts"], usage=info["usage"], hedges=info["hedges"] or None)
+        if cache is not None:
+            cache.put(cache_key, model, parsed)
+        self._record(replay_key, model, temperature, top_p, prompt, parsed, info["usage"], tags)
+        return parsed, info
+
+    def _record(self, key, model, temperature, top_p, prompt, parsed, usage, tags):
+        if key is None:
+            return
+        request = {"model": model, "temperature": temperature, "top_p": top_p, "prompt": prompt}
+        self.replay.put(key, request, parsed, usage, tags)
+
+    def _post_json(self, model, prompt, temperature, top_p):
+        """带重试地发送请求，返回 (dict, info)，失败抛出 LLMCallError"""
+        data = {
+            "model": model,
+            "temperature": temperature,
+            "top_p": top_p,
+            "messages": [{"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"},
+        }
+        deadline_at = time.monotonic() + self.deadline
+        attempt = 0
+        hedges = 0
+        last_error = None
+
+        while attempt < self.max_attempts:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            permit = self.breaker.allow()
+            if not permit:
+                raise CircuitOpenError(
+                    f"LLM API circuit open after repeated failures, deferring call (last error: {last_error})", attempt
+                )
+            # 只有持有 half-open 试探的请求才结束试探，其他请求的结果不影响试探
+            probe = permit == PROBE
+            attempt += 1
+            try:
+                outcome, hedged = self._hedged_request(data, remaining)
+            except BaseException:
+                if probe:
+                    self.breaker.release_probe()
+                raise
+            hedges += hedged
+            kind = outcome[0]
+            if kind == "ok":
+                _, parsed, usage, latency = outcome
+                self.breaker.record(True, probe)
+                self.latency.add(latency)
+                self._add_usage(usage)
+                return parsed, {"attempts": attempt, "hedges": hedges, "usage": usage}
+            if kind == "fatal":
+                # 不可重试的错误不计入熔断，但要结束 half-open 的试探，否则熔断器一直拒绝请求
+                if probe:
+                    self.breaker.release_probe()
+                raise LLMCallError(f"LLM API call failed: {outcome[1]}", attempt) from outcome[1]
+            _, last_error, retry_after = outcome
+            # 429 说明服务正常但在限流，不计入熔断（同样要结束试探）
+            if last_error != "HTTP 429":
+                self.breaker.record(False, probe)
+            elif probe:
+                self.breaker.release_probe()
+
+            if attempt >= self.max_attempts:
+                break
+            delay = self._backoff(attempt)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay >= deadline_at:
+                break
+            print(f"LLM API attempt {attempt} failed ({last_error}), retrying in {delay:.1f}s", file=sys.stderr)
+            time.sleep(delay)
+
+        raise LLMCallError(f"LLM API call failed after {attempt} attempts: {last_error}", attempt)
+
+    def _request(self, data, budget):
+        """
+        发出一次请求
+
+        返回 ("ok", parsed, usage, latency)、("retry", error, retry_after) 或 ("fatal", exception)
+        """
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                self.api_url,
+                json=data,
+                timeout=(min(self.timeout[0], budget), min(self.timeout[1], budget)),
+            )
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            return "retry", e, None
+        if response.status_code in RETRY_STATUS:
+            return "retry", f"HTTP {response.status_code}", parse_retry_after(response.headers.get("Retry-After"))
+        try:
+            response.raise_for_status()
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+            parsed = json.loads(content)
+        except (requests.exceptions.HTTPError, ValueError, KeyError, IndexError, TypeError) as e:
+            return "fatal", e
+        return "ok", parsed, parse_usage(result.get("usage")), time.monotonic() - start
+
+    def _hedged_request(self, data, budget):
+        """
+        一轮请求：超过 hedge 等待时间仍未返回时再发一个相同请求，取先返回的有效结果
+
+        返回 (outcome, 对冲请求数)。请求在守护线程中执行，落后的请求不等待其结束。
+        """
+        delay = self.latency.hedge_delay()
+        if delay is None or delay >= budget:
+            return self._request(data, budget), 0
+
+        results = queue.Queue()
+        start = time.monotonic()
+
+        def run(request_budget):
+            results.put(self._request(data, request_budget))
+
+        threading.Thread(target=run, args=(budget,), daemon=True).start()
+        try:
+            return results.get(timeout=delay), 0
+        except queue.Empty:
+            pass
+        print(f"LLM API request slower than {delay:.1f}s, sending a hedged request", file=sys.stderr)
+        threading.Thread(target=run, args=(budget - (time.monotonic() - start),), daemon=True).start()
+        outcome = results.get()
+        if outcome[0] != "ok":
+            outcome = results.get()
+        return outcome, 1
+
+    def _add_usage(self, usage):
+        with self._totals_lock:
+            self.totals["calls"] += 1
+            for key, value in usage.items():
+                self.totals[key] += value
+
+    def usage_summary(self):
+        """累计用量的一行文字描述，无 API 调用时返回 None"""
+        totals = self.totals
+        if not totals["calls"]:
+            return None
+        ratio = totals["cache_hit_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+        return (
+            f"{totals['calls']} calls, {totals['prompt_tokens']} prompt tokens "
+            f"({totals['cache_hit_tokens']} cache hits, {ratio:.0%}), {totals['completion_tokens']} completion tokens"
+        )
+
+    def close(self):
+        self.session.close()
@@ -1,16 +1,48 @@
 #!/usr/bin/env python3
 """
 LLM 简答题评分脚本
+
+单题：--question/--answer/--rubric
+批量：--manifest jobs.jsonl，每行一个 {"question", "answer", "rubric", "out", "summary"}，
+      用 asyncio 并发评分，受 --concurrency 和 --rpm/--tpm 限速
+合并：--manifest 配合 --batch-size N，每 N 个任务合成一次调用，逐项校验结果，
+      未通过校验的任务单独重评
+预筛：--template（清单中为 "template"）给出作业模板时，与模板几乎相同的答案
+      直接判 0 并送审，不调用 LLM
+查重：--manifest 配合 --cluster-threshold，近似重复的答案每簇只评分一次，
+      成员复用代表的结果并标记 cluster_id / near_duplicate / need_review
+路由：--config 给出的路由配置（tests/llm/routing.yaml）启用 llm_routing 时，先用便宜模型评分，
+      置信度低、落在边界带或未通过校验时再用强模型重评（见 llm_routing）
+回放：--llm-record DIR 录制所有 LLM 调用，--llm-replay DIR 只从录制中回放、不发出请求，
+      未录制的调用标记 llm_replay_miss（见 llm_replay）
+长答案：估计超过 --chunk-threshold tokens 的答案按 Markdown 标题分块，并行按评分项摘录证据，
+      评分调用只看到证据汇总；各块的摘录按内容缓存（见 chunked_grading）。任一块摘录失败时
+      该题按 LLM 调用失败处理（llm_error / llm_deferred），与 llm_evaluate.py 的文档维度一致
 """
 
 import os
 import json
 import argparse
-import requests
+import asyncio
+import copy
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
+from chunked_grading import DEFAULT_CHUNK_THRESHOLD, DEFAULT_CHUNK_TOKENS, condense_answer
+from llm_cache import LLMCache
+from llm_client import CircuitOpenError, LLMCallError, LLMClient, ReplayMissError
+from llm_ledger import LLMLedger
+from llm_replay import LLMReplay
+from llm_resilience import DEFAULT_HEDGE_AFTER, CircuitBreaker
+from llm_routing import load_routing
+from near_duplicate import DEFAULT_CLUSTER_THRESHOLD, cluster_texts
+from prompt_budget import estimate_tokens
+from rubric import compile_rubric
+from template_screen import DEFAULT_THRESHOLD, load_template, screen
+
 load_dotenv()
 
 
@@ -26,6 +58,8 @@ def read_file_or_string(value):
     return value
 
 
+# 提示词布局：固定的评分说明和量表在前、学生答案在后，同一作业所有学生的 prompt
+# 共享字节一致的前缀，可命中服务商的上下文（前缀）缓存
 PROMPT_TEMPLATE = """你是严格且一致的助教，按提供的评分量表为学生的简答题评分。
 
 评分规则：
@@ -50,112 +84,279 @@ PROMPT_TEMPLATE = """你是严格且一致的助教，按提供的评分量表
 - total 必须等于所有 criteria 的 score 之和
 - 如果答案与题目无关或为空，total=0，并加 flag "need_review"
 
+【评分量表】
+<<<{rubric}>>>
+
 【题目】
 <<<{question}>>>
 
-【评分量表】
+【学生答案】
+<<<{answer}>>>
+"""
+
+BATCH_PROMPT_TEMPLATE = """你是严格且一致的助教，按各题提供的评分量表分别为学生的多道简答题评分。
+
+评分规则：
+- 每道题独立评分，只依据该题自己的评分量表，题与题之间互不影响
+- 严格依据量表中各评分项的 scoring_guide 进行评分
+- 每个评分项只能给出 scoring_guide 中定义的整数分值（如 0, 1, 2, 3, 4）
+- 不输出任何解释性文本；只输出 JSON
+
+输出格式（键为题目编号，必须覆盖下列所有编号）：
+  {{
+  "item_1": {{
+    "total": number (该题各项分数之和),
+    "criteria": [
+      {{"id": "评分项id", "score": 整数(必须是scoring_guide中定义的分值), "reason": "简短评语"}},
+      ...
+    ],
+    "flags": [],
+    "confidence": number(0-1, 评分置信度)
+  }},
+  ...
+  }}
+
+重要：
+- score 必须是整数，只能是 scoring_guide 中定义的分值（如 0/1/2/3/4）
+- 不要给出 2.5, 3.5 这样的中间值
+- total 必须等于该题所有 criteria 的 score 之和
+- 如果答案与题目无关或为空，该题 total=0，并加 flag "need_review"
+
+{rubrics}{items}"""
+
+BATCH_RUBRIC_TEMPLATE = """==== 评分量表 {rubric_id} ====
 <<<{rubric}>>>
 
+"""
+
+BATCH_ITEM_TEMPLATE = """==== {item_id}（评分量表：{rubric_id}）====
+【题目】
+<<<{question}>>>
+
 【学生答案】
 <<<{answer}>>>
+
 """
 
 
-def call_llm(url, key, model, prompt):
-    headers = {
-        "Authorization": f"Bearer {key}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "model": model,
-        "temperature": 0,
-        "top_p": 1,
-        "messages": [{"role": "user", "content": prompt}],
-        "response_format": {"type": "json_object"},
+def ledger_dimension(answer_path):
+    """台账中的默认 dimension：答案文件名（不含扩展名），如 REPORT"""
+    return os.path.splitext(os.path.basename(answer_path))[0]
+
+
+def empty_result(*flags):
+    return {
+        "total": 0,
+        "criteria": [],
+        "flags": ["need_review", *flags],
+        "confidence": 0.0,
     }
-    response = requests.post(url, headers=headers, json=data, timeout=(10, 60))
-    response.raise_for_status()
-    result = response.json()
-    content = result.get("choices", [{}])[0].get("message", {}).get("content", "{}")
-    return json.loads(content)
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Grade short answer questions using LLM")
-    parser.add_argument("--question", required=True, help="Path to question file")
-    parser.add_argument("--answer", required=True, help="Path to answer file")
-    parser.add_argument("--rubric", required=True, help="Path to rubric JSON file")
-    parser.add_argument("--out", default="grade.json", help="Output JSON file")
-    parser.add_argument("--summary", default="summary.md", help="Output summary markdown file")
-    parser.add_argument("--model", default=os.getenv("LLM_MODEL", "deepseek-chat"))
-    parser.add_argument("--api_url", default=os.getenv("LLM_API_URL", "https://api.deepseek.com/chat/completions"))
-    parser.add_argument("--api_key", default=os.getenv("LLM_API_KEY", ""))
-    args = parser.parse_args()
+def validate_result(resp, rubric_text):
+    """结果能否在本地按量表修复（见 rubric.Rubric.validate），不能修复时重评"""
+    return compile_rubric(rubric_text).validate(resp)
 
-    if not args.api_key:
-        print("Warning: LLM_API_KEY not set. LLM grading may fail.", file=sys.stderr)
 
-    question = read_file_or_string(args.question).strip()
-    answer = read_file(args.answer).strip()
-    rubric_text = read_file(args.rubric).strip()
+def finalize_result(resp, rubric_text):
+    """按量表修复分数（吸附到允许分值、补齐缺失评分项）、重算 total，并按边界带和置信度加 need_review"""
+    return compile_rubric(rubric_text).finalize(resp)
 
+
+def call_model(llm_config, model, prompt, tags=None):
+    """调用一次 LLM，结果中带 llm_attempts 和 llm_usage"""
+    resp, info = llm_config["client"].chat_json(model, prompt, cache=llm_config.get("cache"), tags=tags)
+    resp["llm_attempts"] = info["attempts"]
+    if info["usage"]:
+        resp["llm_usage"] = info["usage"]
+    return resp
+
+
+def route_result(resp, prompt, rubric_text, llm_config, tags=None):
+    """配置了分级路由（llm_config["routing"]）时按需用强模型重评，见 llm_routing"""
+    routing = llm_config.get("routing")
+    if routing is None:
+        return resp
+    return routing.route(resp, rubric_text, lambda model: call_model(llm_config, model, prompt, tags))
+
+
+def is_long_answer(answer, llm_config):
+    """答案是否超过分块阈值（llm_config["chunk_threshold"]，0 或未设置表示不分块）"""
+    threshold = llm_config.get("chunk_threshold")
+    return bool(threshold and answer and estimate_tokens(answer) > threshold)
+
+
+def condense(question, answer, rubric_text, llm_config, tags=None):
+    """长答案的 map 步骤：分块摘录证据，返回 (代替原答案的证据文本, 统计)，见 chunked_grading"""
+    def call(prompt, heading):
+        return llm_config["client"].chat_json(
+            llm_config["model"], prompt, cache=llm_config.get("cache"), tags={**(tags or {}), "stage": "map"}
+        )
+
+    evidence, stats = condense_answer(
+        answer, question, rubric_text, call, llm_config.get("chunk_tokens", DEFAULT_CHUNK_TOKENS)
+    )
+    print(
+        f"Long answer (~{stats['answer_tokens']} tokens): extracted evidence from {stats['chunks']} chunks "
+        f"({stats['cached']} cached)", file=sys.stderr,
+    )
+    return evidence, stats
+
+
+def grade_answer(question, answer, rubric_text, llm_config, template_text=None, tags=None):
+    """
+    评分单个答案，返回与 grade.json 相同结构的 dict
+
+    提供 template_text 时先做模板预筛，结果中 prescreen 记录走了哪条路径；
+    tags（dimension、student_id）写入 LLM 调用台账。长答案先分块摘录证据再评分，
+    结果中 chunked 记录分块统计
+    """
+    attempts = 0
+    chunked = None
+    prescreen = screen(answer, template_text, llm_config.get("template_threshold", DEFAULT_THRESHOLD))
     if not question or not answer:
-        resp = {
-            "total": 0,
-            "criteria": [],
-            "flags": ["need_review", "empty_answer"],
-            "confidence": 0.0,
-        }
+        resp = empty_result("empty_answer")
+    elif prescreen and prescreen["path"] == "template_match":
+        print(f"Answer matches the template (similarity {prescreen['similarity']}), skipping LLM call", file=sys.stderr)
+        resp = empty_result("template_unchanged")
     else:
         try:
-            prompt = PROMPT_TEMPLATE.format(question=question, rubric=rubric_text, answer=answer)
-            resp = call_llm(args.api_url, args.api_key, args.model, prompt)
+            graded_answer = answer
+            if is_long_answer(answer, llm_config):
+                graded_answer, chunked = condense(question, answer, rubric_text, llm_config, tags)
+            prompt = PROMPT_TEMPLATE.format(question=question, rubric=rubric_text, answer=graded_answer)
+            resp = call_model(llm_config, llm_config["model"], prompt, tags)
+            resp = route_result(resp, prompt, rubric_text, llm_config, tags)
+        except ReplayMissError as e:
+            print(f"LLM grading not replayed: {e}", file=sys.stderr)
+            resp = empty_result("llm_replay_miss")
+        except CircuitOpenError as e:
+            print(f"LLM grading deferred: {e}", file=sys.stderr)
+            resp = empty_result("llm_deferred")
+            attempts = e.attempts
+        except LLMCallError as e:
+            print(f"LLM grading failed: {e}", file=sys.stderr)
+            resp = empty_result("llm_error")
+            attempts = e.attempts
         except Exception as e:
             print(f"LLM grading failed: {e}", file=sys.stderr)
-            resp = {
-                "total": 0,
-                "criteria": [],
-                "flags": ["need_review", "llm_error"],
-                "confidence": 0.0,
-            }
-
-    criteria = resp.get("criteria", [])
-    if criteria:
-        for c in criteria:
-            c["score"] = round(float(c.get("score", 0)))
-        resp["total"] = sum(c.get("score", 0) for c in criteria)
-
-    try:
-        rubric_data = json.loads(rubric_text)
-        lo, hi = rubric_data.get("borderline_band", [None, None])
-        total = float(resp.get("total", 0))
-        flags = set(resp.get("flags", []))
-        if lo is not None and hi is not None and lo <= total <= hi:
-            flags.add("need_review")
-        confidence = resp.get("confidence", 1.0)
-        if confidence < 0.7:
-            flags.add("need_review")
-        resp["flags"] = sorted(list(flags))
-    except Exception:
-        pass
-
-    with open(args.out, "w", encoding="utf-8") as f:
+            resp = empty_result("llm_error")
+    resp.setdefault("llm_attempts", attempts)
+    if chunked:
+        resp["chunked"] = chunked
+    if prescreen:
+        resp["prescreen"] = prescreen
+    return finalize_result(resp, rubric_text)
+
+
+def grade_batch(items, llm_config, tags=None):
+    """
+    一次调用评分多个 (question, answer, rubric_text, template_text)，返回与 items 对应的结果列表
+
+    tags 为与 items 对应的台账标签列表；合并调用在台账中记为 dimension=batch
+
+    空答案和与模板几乎相同的答案直接在本地判 0，长答案单独分块评分；合并调用失败或某项结果未通过
+    validate_result 时，该项单独调用 grade_answer 重评。结果中 llm_mode 记录
+    batch / batch_fallback。
+    """
+    threshold = llm_config.get("template_threshold", DEFAULT_THRESHOLD)
+    tags = tags or [None] * len(items)
+    results = [None] * len(items)
+    pending = {}
+    prescreens = {}
+    for i, (question, answer, rubric_text, template_text) in enumerate(items):
+        prescreens[i] = screen(answer, template_text, threshold) if answer else None
+        if (
+            question and answer and not is_long_answer(answer, llm_config)
+            and not (prescreens[i] and prescreens[i]["path"] == "template_match")
+        ):
+            pending[f"item_{i + 1}"] = i
+        else:
+            results[i] = grade_answer(question, answer, rubric_text, llm_config, template_text, tags[i])
+
+    batch_resp, info = {}, {"attempts": 0, "usage": None}
+    if len(pending) > 1:
+        # 量表按首次出现顺序编号并集中放在题目之前，保持前缀稳定
+        rubric_ids = {}
+        for i in pending.values():
+            rubric_ids.setdefault(items[i][2], f"rubric_{len(rubric_ids) + 1}")
+        rubrics = "".join(
+            BATCH_RUBRIC_TEMPLATE.format(rubric_id=rubric_id, rubric=rubric_text)
+            for rubric_text, rubric_id in rubric_ids.items()
+        )
+        blocks = "".join(
+            BATCH_ITEM_TEMPLATE.format(
+                item_id=item_id, rubric_id=rubric_ids[items[i][2]], question=items[i][0], answer=items[i][1]
+            )
+            for item_id, i in pending.items()
+        )
+        try:
+            batch_resp, info = llm_config["client"].chat_json(
+                llm_config["model"], BATCH_PROMPT_TEMPLATE.format(rubrics=rubrics, items=blocks),
+                cache=llm_config.get("cache"), tags={"dimension": "batch", "batch_items": len(pending)},
+            )
+        except Exception as e:
+            print(f"Batched LLM grading failed, falling back to per-item calls: {e}", file=sys.stderr)
+
+    for item_id, i in pending.items():
+        question, answer, rubric_text, template_text = items[i]
+        resp = batch_resp.get(item_id) if isinstance(batch_resp, dict) else None
+        if validate_result(resp, rubric_text):
+            resp["llm_attempts"] = info["attempts"]
+            if info["usage"]:
+                resp["llm_batch_usage"] = info["usage"]  # 整个合并调用的用量，各项共享
+            # 需要升级时用单题 prompt 调用强模型
+            prompt = PROMPT_TEMPLATE.format(question=question, rubric=rubric_text, answer=answer)
+            resp = route_result(resp, prompt, rubric_text, llm_config, tags[i])
+            if prescreens[i]:
+                resp["prescreen"] = prescreens[i]
+            resp = finalize_result(resp, rubric_text)
+            resp["llm_mode"] = "batch"
+        else:
+            if len(pending) > 1:
+                print(f"Batched result for {item_id} failed validation, regrading individually", file=sys.stderr)
+            resp = grade_answer(question, answer, rubric_text, llm_config, template_text, tags[i])
+            resp["llm_mode"] = "batch_fallback"
+        results[i] = resp
+    return results
+
+
+def write_outputs(resp, rubric_text, out_path, summary_path, cache_stats=None):
+    """写出 grade.json 和 summary.md，返回 max_score"""
+    with open(out_path, "w", encoding="utf-8") as f:
         json.dump(resp, f, ensure_ascii=False, indent=2)
 
-    try:
-        rubric_data = json.loads(rubric_text)
-        max_score = rubric_data.get("max_score", 10)
-    except Exception:
-        max_score = 10
+    max_score = compile_rubric(rubric_text).max_score
 
     lines = [
         "# 简答题评分",
         f"- **总分**：**{resp.get('total', 0):.2f} / {max_score}**",
         f"- **置信度**：{resp.get('confidence', 0):.2f}",
         f"- **标记**：{', '.join(resp.get('flags', [])) or '无'}",
-        "",
-        "## 分项评分",
     ]
+    repairs = resp.get("score_repairs")
+    if repairs:
+        lines.append(f"- **分数修复**：{len(repairs)} 项（" + "，".join(f"{r['id']} {r['action']}" for r in repairs) + "）")
+    if cache_stats is not None:
+        lines.append(f"- **LLM 缓存**：命中 {cache_stats['hits']}，未命中 {cache_stats['misses']}")
+    routing = resp.get("routing")
+    if routing and routing.get("escalated"):
+        primary = routing.get("primary")
+        detail = f"{primary['model']} {primary.get('total', 0):.2f} 分 → {routing['model']}" if primary else f"{routing['strong_model']} 调用失败"
+        lines.append(f"- **模型升级**：{detail}（{', '.join(routing['reasons'])}）")
+    chunked = resp.get("chunked")
+    if chunked:
+        lines.append(
+            f"- **分块评分**：答案约 {chunked['answer_tokens']} tokens，分 {chunked['chunks']} 节摘录证据"
+            f"（{chunked['cached']} 节复用缓存）"
+        )
+    usage = resp.get("llm_usage")
+    if usage:
+        lines.append(
+            f"- **Token**：输入 {usage['prompt_tokens']}（上下文缓存命中 {usage['cache_hit_tokens']}），"
+            f"输出 {usage['completion_tokens']}"
+        )
+    lines += ["", "## 分项评分"]
     for criterion in resp.get("criteria", []):
         criterion_id = criterion.get("id", "")
         score = criterion.get("score", 0)
@@ -164,12 +365,295 @@ def main():
         if reason:
             lines.append(f"  - {reason}")
 
-    with open(args.summary, "w", encoding="utf-8") as f:
+    with open(summary_path, "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
 
+    return max_score
+
+
+class RateLimiter:
+    """
+    requests-per-minute / tokens-per-minute 双令牌桶
+
+    rpm、tpm 为 0 表示不限制该项。单个请求的 token 数超过 tpm 时按 tpm 计，避免永久阻塞。
+    """
+
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens=0):
+        async with self._lock:
+            tokens = min(tokens, self.tpm) if self.tpm else 0
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            if self.tpm:
+                self._tokens -= tokens
+
+
+def load_manifest(manifest_path):
+    """
+    读取批量评分清单（JSONL 或 JSON 数组），相对路径按清单所在目录解析
+
+    每个任务：question（文件或字符串）、answer、rubric、out、summary，
+    可选 template，以及写入台账的 dimension（默认 answer 文件名）、student_id
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        jobs = json.loads(text)
+    else:
+        jobs = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    for i, job in enumerate(jobs):
+        job["answer"] = resolve(job["answer"])
+        job["rubric"] = resolve(job["rubric"])
+        job["out"] = resolve(job.get("out", f"grade_{i}.json"))
+        job["summary"] = resolve(job.get("summary", f"summary_{i}.md"))
+        if job.get("template"):
+            job["template"] = resolve(job["template"])
+        question = resolve(job["question"])
+        if os.path.exists(question):
+            job["question"] = question
+    return jobs
+
+
+def mark_cluster(resp, cluster_id, representative, similarity=None):
+    """给近似重复簇中的结果加上 cluster_id 和 near_duplicate / need_review 标记"""
+    resp["cluster_id"] = cluster_id
+    resp["cluster_representative"] = representative
+    if similarity is not None:
+        resp["cluster_similarity"] = similarity
+    resp["flags"] = sorted(set(resp.get("flags", [])) | {"near_duplicate", "need_review"})
+    return resp
+
+
+async def grade_manifest(jobs, llm_config, concurrency=8, rpm=0, tpm=0, batch_size=1, cluster_threshold=0):
+    """
+    并发评分清单中的所有任务，每个任务照常写出 grade.json / summary.md
+
+    batch_size > 1 时按清单顺序每 batch_size 个任务合成一次调用（见 grade_batch）。
+    cluster_threshold > 0 时先对同一题目和量表下的答案做近似重复聚类（见 near_duplicate），
+    每簇只评分代表答案，其余成员复用代表的结果（llm_mode 为 cluster_reuse）
+    """
+    # to_thread 使用默认线程池，其大小需不小于并发数
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm, tpm)
+    rubric_cache = {}
+    template_cache = {}
+
+    def load(job):
+        question = read_file_or_string(job["question"]).strip()
+        answer = read_file(job["answer"]).strip()
+        if job["rubric"] not in rubric_cache:
+            rubric_cache[job["rubric"]] = read_file(job["rubric"]).strip()
+        template = job.get("template")
+        if template not in template_cache:
+            template_cache[template] = load_template(template)
+        return question, answer, rubric_cache[job["rubric"]], template_cache[template]
+
+    def job_tags(job):
+        return {"dimension": job.get("dimension") or ledger_dimension(job["answer"]), "student_id": job.get("student_id")}
+
+    loaded = [load(job) for job in jobs]
+    cluster_of = {}
+    followers = []
+    if cluster_threshold:
+        template_threshold = llm_config.get("template_threshold", DEFAULT_THRESHOLD)
+
+        def cluster_text(question, answer, template_text):
+            # 空答案和未修改的模板在本地判 0，不参与聚类
+            prescreen = screen(answer, template_text, template_threshold)
+            if not question or not answer or (prescreen and prescreen["path"] == "template_match"):
+                return None
+            return answer
+
+        clusters = cluster_texts(
+            [cluster_text(q, a, t) for q, a, _, t in loaded], cluster_threshold,
+            groups=[(q, r) for q, _, r, _ in loaded],
+        )
+        for n, cluster in enumerate(clusters, 1):
+            cluster_of[cluster["representative"]] = f"cluster_{n}"
+            for member, similarity in cluster["similarity"].items():
+                followers.append((member, cluster["representative"], f"cluster_{n}", similarity))
+
+    results = [None] * len(jobs)
+
+    def write(i, resp, cache_stats=None):
+        results[i] = resp
+        max_score = write_outputs(resp, loaded[i][2], jobs[i]["out"], jobs[i]["summary"], cache_stats)
+        print(f"  {jobs[i]['answer']}: {resp.get('total', 0):.2f}/{max_score}")
+
+    async def run(chunk):
+        items = [loaded[i] for i in chunk]
+        # 每个任务（批量时每批）单独统计缓存命中，写入各自的 summary.md
+        scope = llm_config["cache"].scoped() if llm_config.get("cache") is not None else None
+        config = {**llm_config, "cache": scope} if scope is not None else llm_config
+        tokens = sum(estimate_tokens(rubric_text + answer) for question, answer, rubric_text, _ in items if question and answer)
+
+        async with semaphore:
+            if tokens:
+                await limiter.acquire(estimate_tokens(PROMPT_TEMPLATE) + tokens)
+            if len(items) == 1:
+                question, answer, rubric_text, template_text = items[0]
+                resps = [await asyncio.to_thread(
+                    grade_answer, question, answer, rubric_text, config, template_text, job_tags(jobs[chunk[0]])
+                )]
+            else:
+                resps = await asyncio.to_thread(grade_batch, items, config, [job_tags(jobs[i]) for i in chunk])
+
+        for i, resp in zip(chunk, resps):
+            if i in cluster_of:
+                mark_cluster(resp, cluster_of[i], jobs[i]["answer"])
+            write(i, resp, scope.stats() if scope is not None else None)
+
+    follower_ids = {member for member, *_ in followers}
+    pending = [i for i in range(len(jobs)) if i not in follower_ids]
+    batch_size = max(batch_size, 1)
+    chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+    for member, representative, cluster_id, similarity in followers:
+        resp = copy.deepcopy(results[representative])
+        for key in ("llm_attempts", "llm_usage", "llm_batch_usage", "prescreen", "chunked"):
+            resp.pop(key, None)
+        resp["llm_mode"] = "cluster_reuse"
+        write(member, mark_cluster(resp, cluster_id, jobs[representative]["answer"], similarity))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade short answer questions using LLM")
+    parser.add_argument("--question", help="Path to question file")
+    parser.add_argument("--answer", help="Path to answer file")
+    parser.add_argument("--rubric", help="Path to rubric JSON file")
+    parser.add_argument("--out", default="grade.json", help="Output JSON file")
+    parser.add_argument("--summary", default="summary.md", help="Output summary markdown file")
+    parser.add_argument("--template", help="Assignment template of the answer file; near-identical answers get 0 without an LLM call")
+    parser.add_argument("--template-threshold", type=float, default=DEFAULT_THRESHOLD, help="Shingle Jaccard similarity at or above which the answer counts as unchanged")
+    parser.add_argument("--manifest", help="JSONL/JSON list of grading jobs, graded concurrently")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight LLM calls (manifest mode)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Jobs per combined LLM call, 1 = one call per job (manifest mode)")
+    parser.add_argument("--cluster-threshold", type=float, default=0, help=f"Grade near-duplicate answers (shingle Jaccard >= threshold, e.g. {DEFAULT_CLUSTER_THRESHOLD}) once per cluster and flag them for review, 0 = off (manifest mode)")
+    parser.add_argument("--chunk-threshold", type=int, default=DEFAULT_CHUNK_THRESHOLD, help="Answers above this many estimated tokens are split by Markdown heading and graded from per-chunk evidence, 0 = never")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="Max estimated tokens per chunk for long answers")
+    parser.add_argument("--rpm", type=float, default=0, help="Requests per minute limit, 0 = unlimited (manifest mode)")
+    parser.add_argument("--tpm", type=float, default=0, help="Estimated tokens per minute limit, 0 = unlimited (manifest mode)")
+    parser.add_argument("--model", default=os.getenv("LLM_MODEL", "deepseek-chat"))
+    parser.add_argument("--api_url", default=os.getenv("LLM_API_URL", "https://api.deepseek.com/chat/completions"))
+    parser.add_argument("--api_key", default=os.getenv("LLM_API_KEY", ""))
+    parser.add_argument("--max-attempts", type=int, default=4, help="Max HTTP attempts per LLM call (429/5xx/timeouts are retried)")
+    parser.add_argument("--deadline", type=float, default=180, help="Total time budget in seconds per LLM call, including retries")
+    parser.add_argument("--cache-path", default=None, help="LLM response cache (default: $LLM_CACHE_PATH or ~/.cache/autograde/llm_cache.sqlite3)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the LLM response cache")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses and overwrite them")
+    parser.add_argument("--hedge-after", type=float, default=DEFAULT_HEDGE_AFTER, help="Seconds before sending a hedged duplicate request until enough latencies are observed (then p90 is used), 0 = never hedge")
+    parser.add_argument("--breaker-threshold", type=float, default=0.5, help="Request failure rate that opens the circuit breaker and defers remaining calls, 0 = disabled")
+    parser.add_argument("--dimension", help="Ledger label for this grading call (default: answer file name)")
+    parser.add_argument("--student-id", default=os.getenv("STUDENT_ID"), help="Ledger student id (default: $STUDENT_ID)")
+    parser.add_argument("--ledger", default=None, help="LLM call ledger JSONL (default: $LLM_LEDGER_PATH or .autograde/llm_ledger.jsonl)")
+    parser.add_argument("--no-ledger", action="store_true", help="Do not record LLM calls")
+    parser.add_argument("--config", default=os.getenv("LLM_ROUTING_CONFIG"), help="Routing config (tests/llm/routing.yaml, or an assignment config.yaml with grading.llm_routing) enabling cheap-then-strong model routing (default: $LLM_ROUTING_CONFIG)")
+    parser.add_argument("--llm-record", metavar="DIR", help="Save every LLM request/response to DIR, keyed by prompt hash")
+    parser.add_argument("--llm-replay", metavar="DIR", help="Serve LLM responses only from DIR (no network, no response cache) and report misses")
+    args = parser.parse_args()
+
+    if not args.manifest and not (args.question and args.answer and args.rubric):
+        parser.error("--question, --answer and --rubric are required unless --manifest is given")
+    if args.llm_record and args.llm_replay:
+        parser.error("--llm-record and --llm-replay are mutually exclusive")
+
+    replay = None
+    if args.llm_replay:
+        replay = LLMReplay(args.llm_replay, "replay")
+    elif args.llm_record:
+        replay = LLMReplay(args.llm_record, "record")
+
+    if not args.api_key and not args.llm_replay:
+        print("Warning: LLM_API_KEY not set. LLM grading may fail.", file=sys.stderr)
+
+    cache = None if args.no_cache or args.llm_replay else LLMCache(args.cache_path, refresh=args.refresh)
+    client = LLMClient(
+        args.api_url, args.api_key,
+        max_attempts=args.max_attempts, deadline=args.deadline, pool_size=max(args.concurrency, 1),
+        ledger=None if args.no_ledger else LLMLedger(args.ledger, {"assignment": os.getenv("ASSIGNMENT_ID")}),
+        hedge_after=args.hedge_after, breaker=CircuitBreaker(args.breaker_threshold), replay=replay,
+    )
+    llm_config = {
+        "client": client, "model": args.model, "cache": cache, "template_threshold": args.template_threshold,
+        "chunk_threshold": args.chunk_threshold, "chunk_tokens": args.chunk_tokens,
+    }
+    routing = load_routing(args.config, args.model)
+    if routing is not None:
+        llm_config.update(model=routing.cheap_model, routing=routing)
+        print(f"LLM routing: {routing.cheap_model} first, escalating to {routing.strong_model} when uncertain")
+
+    if args.manifest:
+        jobs = load_manifest(args.manifest)
+        print(
+            f"Grading {len(jobs)} jobs (concurrency={args.concurrency}, batch_size={args.batch_size}, "
+            f"rpm={args.rpm or '∞'}, tpm={args.tpm or '∞'})"
+        )
+        start = time.perf_counter()
+        results = asyncio.run(grade_manifest(
+            jobs, llm_config, args.concurrency, args.rpm, args.tpm, args.batch_size, args.cluster_threshold
+        ))
+        print(f"LLM grading complete: {len(jobs)} jobs in {time.perf_counter() - start:.1f}s")
+        clustered = [r for r in results if r.get("cluster_id")]
+        if clustered:
+            print(
+                f"Near-duplicate clusters: {len({r['cluster_id'] for r in clustered})} clusters, "
+                f"{sum(1 for r in clustered if r.get('llm_mode') == 'cluster_reuse')} answers reused a representative's grade"
+            )
+        if cache is not None:
+            print(f"LLM cache: {cache.hits} hits, {cache.misses} misses")
+        if client.usage_summary():
+            print(f"LLM usage: {client.usage_summary()}")
+        if replay is not None:
+            replay.report()
+        return
+
+    question = read_file_or_string(args.question).strip()
+    answer = read_file(args.answer).strip()
+    rubric_text = read_file(args.rubric).strip()
+
+    tags = {"dimension": args.dimension or ledger_dimension(args.answer), "student_id": args.student_id}
+    resp = grade_answer(question, answer, rubric_text, llm_config, load_template(args.template), tags)
+    cache_stats = cache.stats() if cache is not None else None
+    max_score = write_outputs(resp, rubric_text, args.out, args.summary, cache_stats)
+
     print(f"LLM grading complete: {resp.get('total', 0):.2f}/{max_score}")
+    if replay is not None:
+        replay.report()
 
 
 if __name__ == "__main__":
     main()
-
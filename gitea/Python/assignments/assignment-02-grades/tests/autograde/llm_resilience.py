@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+LLM 调用的尾延迟对冲与熔断
+
+- LatencyTracker：记录单次请求的成功耗时，请求超过观测到的 p90 仍未返回时，
+  LLMClient 再发一个对冲请求（hedge），取先返回的有效结果。样本不足时使用固定的
+  hedge_after 秒数
+- CircuitBreaker：按最近若干次请求的失败率熔断，打开期间调用直接失败（deferred），
+  由评分脚本给出 need_review，而不是在每个维度上等满超时把 CI 任务拖到超时
+
+同一次 CI 运行中各评分步骤是独立进程，两者都可以用 LLM 调用台账（llm_ledger.jsonl）
+中最近的记录预热，前一个步骤观察到的延迟和失败对后续步骤同样生效。
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from llm_ledger import percentile
+
+DEFAULT_HEDGE_AFTER = 45.0
+HEDGE_QUANTILE = 90
+HEDGE_MIN_SAMPLES = 5
+# 延迟分布很集中时 p90 接近中位数，设下限避免大量无谓的对冲
+HEDGE_MIN_DELAY = 1.0
+
+DEFAULT_FAILURE_THRESHOLD = 0.5
+DEFAULT_MIN_REQUESTS = 4
+DEFAULT_COOLDOWN = 120.0
+
+# CircuitBreaker.allow() 的返回值：普通放行 / half-open 时放行的试探请求；拒绝时返回 None
+ALLOW = "allow"
+PROBE = "probe"
+
+# 只用最近这段时间内的台账记录预热，避免本地长期累积的台账影响判断
+SEED_WINDOW_S = 600
+
+
+class LatencyTracker:
+    """最近 window 次成功请求的耗时，给出对冲等待时间"""
+
+    def __init__(self, hedge_after=DEFAULT_HEDGE_AFTER, quantile=HEDGE_QUANTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, window=50):
+        self.hedge_after = hedge_after
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self._samples.append(latency)
+
+    def hedge_delay(self):
+        """发出对冲请求前的等待秒数，hedge_after <= 0 表示不对冲，返回 None"""
+        if not self.hedge_after or self.hedge_after <= 0:
+            return None
+        with self._lock:
+            samples = list(self._samples)
+        if len(samples) < self.min_samples:
+            return self.hedge_after
+        return max(percentile(samples, self.quantile), HEDGE_MIN_DELAY)
+
+
+class CircuitBreaker:
+    """
+    失败率熔断器：closed → open（cooldown 秒内拒绝请求）→ half-open（放行一次试探）
+
+    最近 window 次请求中至少 min_requests 次、失败率不低于 threshold 时打开；
+    half-open 的试探成功则关闭并清空窗口，失败则重新打开。试探只属于 allow() 返回 PROBE
+    的调用方：它用 record(ok, probe=True) 结束试探；不计入熔断的结果（429、不可重试的错误）
+    用 release_probe() 结束试探，保持 half-open，下一次请求重新试探。其他请求的结果不影响试探
+    """
+
+    def __init__(self, threshold=DEFAULT_FAILURE_THRESHOLD, min_requests=DEFAULT_MIN_REQUESTS,
+                 cooldown=DEFAULT_COOLDOWN, window=20):
+        self.threshold = threshold
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._open_until = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._open_until is None:
+                return "closed"
+            return "open" if time.monotonic() < self._open_until else "half_open"
+
+    def allow(self):
+        """是否允许发出请求：拒绝时返回 None，否则返回 ALLOW；half-open 时只放行一个试探请求，返回 PROBE"""
+        if self.threshold is None or self.threshold <= 0:
+            return ALLOW
+        with self._lock:
+            if self._open_until is None:
+                return ALLOW
+            if time.monotonic() < self._open_until or self._probing:
+                return None
+            self._probing = True
+            return PROBE
+
+    def release_probe(self):
+        """结束 half-open 的试探但不计入结果；只能由 allow() 返回 PROBE 的调用方调用"""
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok, probe=False):
+        """记录一次请求结果；probe 表示这是 allow() 返回 PROBE 的试探请求"""
+        with self._lock:
+            if probe and self._open_until is not None:
+                self._probing = False
+                if ok:
+                    self._open_until = None
+                    self._outcomes.clear()
+                else:
+                    self._open_until = time.monotonic() + self.cooldown
+                return
+            self._outcomes.append(bool(ok))
+            failures = self._outcomes.count(False)
+            if (self._open_until is None and len(self._outcomes) >= self.min_requests
+                    and failures / len(self._outcomes) >= self.threshold):
+                self._open_until = time.monotonic() + self.cooldown
+
+
+def seed_from_ledger(records, tracker=None, breaker=None, now=None):
+    """
+    用台账中最近 SEED_WINDOW_S 秒内的记录预热；时间戳晚于 now 的记录不可信，忽略
+
+    只尝试一次就成功的调用耗时即单次请求耗时，计入 tracker；
+    每条记录按 attempts 展开为请求结果：成功记录的最后一次为成功、其余为失败，
+    失败记录全部为失败。缓存命中和熔断跳过的记录没有发出请求，忽略。
+    """
+    now = now or datetime.now()
+    cutoff = now - timedelta(seconds=SEED_WINDOW_S)
+    for r in records:
+        try:
+            if not cutoff <= datetime.fromisoformat(r["ts"]) <= now:
+                continue
+        except (KeyError, TypeError, ValueError):
+            continue
+        status, attempts = r.get("status"), r.get("attempts", 0)
+        if status == "ok":
+            if tracker is not None and attempts == 1 and not r.get("hedges"):
+                tracker.add(r.get("latency_s", 0))
+            outcomes = [False] * (attempts - 1) + [True]
+        elif status == "error":
+            outcomes = [False] * attempts
+        else:
+            continue
+        if breaker is not None:
+            for ok in outcomes:
+                breaker.record(ok)
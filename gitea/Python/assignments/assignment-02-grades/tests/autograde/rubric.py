@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+评分量表的预编译与本地分数校验
+
+量表 JSON 只解析一次，按内容的 SHA-256 缓存为 Rubric 对象，预先算好评分项顺序、
+每项允许的分值（scoring_guide 中的分值）、每项和总分的满分、边界带。
+LLM 返回的结果在本地修复而不是重新调用 LLM：
+- 分数吸附到最近的允许分值（等距时取较低值），超出范围的截断
+- 量表中有但结果中缺失的评分项补 0 分
+- 量表中没有的评分项丢弃
+- 评分项按量表顺序排列，重算 total
+有修复时结果中记录 score_repairs，并加 score_repaired / need_review 标记。
+
+scoring_guide 兼容两种写法：[[0, "说明"], [1, "说明"]] 和 {"0": "说明", "1": "说明"}
+"""
+
+import hashlib
+import json
+import sys
+import threading
+
+DEFAULT_MAX_SCORE = 10
+LOW_CONFIDENCE = 0.7
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _number(value):
+    """转为数值（整数值返回 int），无法转换返回 None；bool 不算数值"""
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number != number:  # NaN
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def _allowed_scores(scoring_guide):
+    if isinstance(scoring_guide, dict):
+        keys = scoring_guide.keys()
+    elif isinstance(scoring_guide, list):
+        keys = [g[0] if isinstance(g, (list, tuple)) and g else (g.get("score") if isinstance(g, dict) else None)
+                for g in scoring_guide]
+    else:
+        return ()
+    return tuple(sorted({n for n in (_number(k) for k in keys) if n is not None}))
+
+
+class Criterion:
+    """量表中的一个评分项"""
+
+    def __init__(self, data):
+        self.id = data.get("id")
+        self.allowed = _allowed_scores(data.get("scoring_guide"))
+        max_score = _number(data.get("max_score"))
+        if max_score is None and self.allowed:
+            max_score = self.allowed[-1]
+        self.max_score = max_score
+
+    def snap(self, score):
+        """吸附到最近的允许分值；没有 scoring_guide 时取整并截断到 [0, max_score]"""
+        if self.allowed:
+            candidates = [s for s in self.allowed if self.max_score is None or s <= self.max_score] or list(self.allowed)
+            return min(candidates, key=lambda s: (abs(s - score), s))
+        score = max(0, round(score))
+        return min(score, self.max_score) if self.max_score is not None else score
+
+
+class Rubric:
+    """
+    编译后的量表，通过 compile_rubric / load_rubric 获取（按内容缓存，请勿修改）
+
+    data 为原始 JSON（dict），text 为原始文本（用于拼 prompt）
+    """
+
+    def __init__(self, data, text):
+        self.data = data
+        self.text = text
+        self.criteria = [Criterion(c) for c in data.get("criteria", []) if isinstance(c, dict) and c.get("id")]
+        self.by_id = {c.id: c for c in self.criteria}
+        self.order = tuple(c.id for c in self.criteria)
+        self.max_score = data.get("max_score", DEFAULT_MAX_SCORE)
+        band = data.get("borderline_band")
+        self.borderline_band = tuple(band) if isinstance(band, (list, tuple)) and len(band) == 2 else None
+
+    def is_borderline(self, total):
+        if self.borderline_band is None:
+            return False
+        lo, hi = self.borderline_band
+        return lo <= total <= hi
+
+    def validate(self, resp):
+        """
+        结果是否可以在本地修复：criteria 为 dict 列表，且（量表有评分项时）
+        至少一项是量表中的评分项并给出了数值分数
+        """
+        if not isinstance(resp, dict) or not isinstance(resp.get("criteria"), list):
+            return False
+        if not all(isinstance(c, dict) for c in resp["criteria"]):
+            return False
+        if not self.criteria:
+            return all(_number(c.get("score")) is not None for c in resp["criteria"])
+        return any(c.get("id") in self.by_id and _number(c.get("score")) is not None for c in resp["criteria"])
+
+    def repair(self, resp):
+        """
+        就地修复 resp 的 criteria 并重算 total，返回修复记录列表
+
+        criteria 为空（如 llm_error / 模板未修改的 0 分结果）时不做处理
+        """
+        criteria = resp.get("criteria")
+        if not isinstance(criteria, list) or not criteria:
+            return []
+        repairs = []
+        if not self.criteria:
+            for c in criteria:
+                c["score"] = max(0, round(_number(c.get("score")) or 0))
+            resp["total"] = sum(c["score"] for c in criteria)
+            return repairs
+
+        given = {}
+        for c in criteria:
+            cid = c.get("id") if isinstance(c, dict) else None
+            if cid not in self.by_id or cid in given:
+                repairs.append({"id": cid, "action": "dropped"})
+                continue
+            given[cid] = c
+
+        repaired = []
+        for criterion in self.criteria:
+            c = given.get(criterion.id)
+            score = _number(c.get("score")) if c is not None else None
+            if score is None:
+                repairs.append({"id": criterion.id, "action": "filled", "to": 0})
+                c = {**(c or {}), "id": criterion.id, "score": 0}
+                c["reason"] = f"{c.get('reason') or ''} [LLM 未给出有效分数，按 0 分处理]".strip()
+            else:
+                snapped = criterion.snap(score)
+                if snapped != score:
+                    repairs.append({"id": criterion.id, "action": "snapped", "from": score, "to": snapped})
+                c["score"] = snapped
+            repaired.append(c)
+
+        resp["criteria"] = repaired
+        resp["total"] = sum(c["score"] for c in repaired)
+        if repairs:
+            resp["score_repairs"] = repairs
+            resp["flags"] = sorted(set(resp.get("flags", [])) | {"score_repaired", "need_review"})
+        return repairs
+
+    def finalize(self, resp):
+        """修复分数，并按边界带和置信度加 need_review"""
+        self.repair(resp)
+        flags = set(resp.get("flags", []))
+        total = _number(resp.get("total"))
+        if total is not None and self.is_borderline(total):
+            flags.add("need_review")
+        confidence = _number(resp.get("confidence", 1.0))
+        if confidence is not None and confidence < LOW_CONFIDENCE:
+            flags.add("need_review")
+        resp["flags"] = sorted(flags)
+        return resp
+
+
+def _compile(digest, data, text):
+    with _cache_lock:
+        rubric = _cache.get(digest)
+        if rubric is None:
+            rubric = _cache[digest] = Rubric(data, text)
+        return rubric
+
+
+def compile_rubric(source):
+    """
+    由量表文本或 dict 得到 Rubric（按内容哈希缓存）；已是 Rubric 时原样返回
+
+    文本不是合法 JSON 时给出警告，按空量表处理（只取整、不做校验）
+    """
+    if isinstance(source, Rubric):
+        return source
+    if isinstance(source, dict):
+        text = json.dumps(source, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with _cache_lock:
+            if digest in _cache:
+                return _cache[digest]
+        return _compile(digest, source, json.dumps(source, ensure_ascii=False, indent=2))
+    text = source or ""
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _cache_lock:
+        if digest in _cache:
+            return _cache[digest]
+    try:
+        data = json.loads(text) if text.strip() else {}
+    except json.JSONDecodeError as e:
+        print(f"Warning: rubric is not valid JSON ({e}), scores will not be validated", file=sys.stderr)
+        data = {}
+    if not isinstance(data, dict):
+        data = {}
+    return _compile(digest, data, text)
+
+
+def load_rubric(path):
+    """读取量表文件并编译（按文件内容哈希缓存）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return compile_rubric(f.read().strip())
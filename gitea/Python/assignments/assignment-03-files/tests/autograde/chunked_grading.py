@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+长答案分块评分（map-reduce）
+
+答案的估计 token 数超过阈值时不再整篇发给评分模型：
+- 切块：按 Markdown 标题切分（代码块内的 # 不算标题），过长的节再按段落切分，
+  过短的相邻节合并，每块不超过 chunk_tokens
+- map：每块一次 LLM 调用，按量表的评分项摘录证据（不打分），各块并行
+- reduce：评分调用只看到题目、量表和各块证据的汇总（condense_answer 的返回值代替原答案）
+
+map 的 prompt 只包含量表、题目、本节标题和本节内容，不含块序号，LLMCache 以 prompt 哈希为键，
+相当于按块内容哈希缓存：修改或插入一节，只有这一节需要重新摘录。
+"""
+
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_budget import estimate_tokens
+
+DEFAULT_CHUNK_THRESHOLD = 6000
+DEFAULT_CHUNK_TOKENS = 2000
+DEFAULT_MAP_WORKERS = 4
+
+MAP_PROMPT_TEMPLATE = """你是助教的助手，负责从学生答案的一个片段中按评分项摘录证据，不打分。
+
+规则：
+- 只依据本片段的内容，逐个评分项摘录相关要点，每条不超过 80 字，尽量保留原文中的关键词、数据和示例
+- 片段与某评分项无关时该项给空列表；不要推测片段以外的内容
+- 不输出任何解释性文本；只输出 JSON
+
+输出格式：
+  {{
+  "summary": "本片段的主要内容（不超过 60 字）",
+  "evidence": {{"评分项id": ["要点", ...], ...}}
+  }}
+
+【评分量表】
+<<<{rubric}>>>
+
+【题目】
+<<<{question}>>>
+
+【答案片段：{heading}】
+<<<{chunk}>>>
+"""
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+
+def _sections(text):
+    """按标题切分，返回 [(标题路径, 文本)]；第一个标题之前的内容记在"开头"下"""
+    sections = []
+    path = []
+    heading, lines = "开头", []
+    in_fence = False
+    for line in text.splitlines():
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING_RE.match(line)
+        if match:
+            if any(l.strip() for l in lines):
+                sections.append((heading, "\n".join(lines).strip("\n")))
+            level = len(match.group(1))
+            path = [(lvl, title) for lvl, title in path if lvl < level] + [(level, match.group(2))]
+            heading, lines = " > ".join(title for _, title in path), [line]
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((heading, "\n".join(lines).strip("\n")))
+    return sections
+
+
+def _split_long(text, max_tokens):
+    """超长的节按段落切分，单个段落仍超长时按行、最后按字符切分"""
+    pieces = []
+    for separator in ("\n\n", "\n"):
+        parts = text.split(separator)
+        if len(parts) > 1:
+            break
+    else:
+        # 没有换行：按字符切分（CJK 约 1 token/字，按最坏情况计；estimate_tokens 另加 1）
+        step = max(max_tokens - 1, 1)
+        return [text[i:i + step] for i in range(0, len(text), step)]
+    current = ""
+    for part in parts:
+        candidate = f"{current}{separator}{part}" if current else part
+        if estimate_tokens(candidate) <= max_tokens:
+            current = candidate
+            continue
+        if current:
+            pieces.append(current)
+        if estimate_tokens(part) > max_tokens:
+            pieces.extend(_split_long(part, max_tokens))
+            current = ""
+        else:
+            current = part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_markdown(text, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    """
+    把 Markdown 切成不超过 chunk_tokens 的块，返回 [{"heading", "text", "hash"}]
+
+    heading 为标题路径（如 "反思 > 遇到的问题"），合并的多节为 "首节 … 末节"
+    """
+    pieces = []
+    for heading, body in _sections(text):
+        if estimate_tokens(body) <= chunk_tokens:
+            pieces.append((heading, heading, body))
+            continue
+        parts = _split_long(body, chunk_tokens)
+        for n, part in enumerate(parts, 1):
+            label = f"{heading}（{n}/{len(parts)}）"
+            pieces.append((label, label, part))
+
+    chunks = []
+    for first, last, body in pieces:
+        if chunks and estimate_tokens(chunks[-1]["text"] + "\n\n" + body) <= chunk_tokens:
+            chunks[-1]["text"] += "\n\n" + body
+            chunks[-1]["last"] = last
+        else:
+            chunks.append({"first": first, "last": last, "text": body})
+    for chunk in chunks:
+        first, last = chunk.pop("first"), chunk.pop("last")
+        chunk["heading"] = first if first == last else f"{first} … {last}"
+        chunk["hash"] = hashlib.sha256(chunk["text"].encode("utf-8")).hexdigest()[:16]
+    return chunks
+
+
+def map_chunks(chunks, question, rubric_text, call, workers=DEFAULT_MAP_WORKERS):
+    """
+    并行摘录各块证据，返回 (与 chunks 对应的结果列表, 统计)
+
+    call(prompt, heading) 返回 chat_json 的 (dict, info)；任一块失败时异常向上抛出，
+    由调用方按 LLM 调用失败处理。统计中 cached 为未发出请求（缓存或回放）的块数
+    """
+    def run(chunk):
+        prompt = MAP_PROMPT_TEMPLATE.format(
+            rubric=rubric_text, question=question, heading=chunk["heading"], chunk=chunk["text"]
+        )
+        return call(prompt, chunk["heading"])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+        outputs = list(pool.map(run, chunks))
+    results = [result if isinstance(result, dict) else {} for result, _ in outputs]
+    stats = {
+        "chunks": len(chunks),
+        "cached": sum(1 for _, info in outputs if not info["attempts"]),
+        "attempts": sum(info["attempts"] for _, info in outputs),
+    }
+    return results, stats
+
+
+def format_evidence(chunks, results):
+    """把各块的概要和证据整理成评分调用的输入"""
+    lines = []
+    for n, (chunk, result) in enumerate(zip(chunks, results), 1):
+        lines.append(f"## 第 {n} 节：{chunk['heading']}")
+        if result.get("summary"):
+            lines.append(f"概要：{result['summary']}")
+        evidence = result.get("evidence")
+        if isinstance(evidence, dict):
+            for criterion_id, points in evidence.items():
+                if isinstance(points, str):
+                    points = [points]
+                points = [str(p) for p in points or [] if p]
+                if points:
+                    lines.append(f"- {criterion_id}：" + "；".join(points))
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def condense_answer(answer, question, rubric_text, call, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                    workers=DEFAULT_MAP_WORKERS):
+    """
+    map 步骤：返回 (代替原答案交给评分调用的证据文本, 统计)
+
+    统计含 answer_tokens、chunks、cached、attempts
+    """
+    chunks = split_markdown(answer, chunk_tokens)
+    results, stats = map_chunks(chunks, question, rubric_text, call, workers)
+    tokens = estimate_tokens(answer)
+    header = (
+        f"（答案较长，约 {tokens} tokens，已分 {len(chunks)} 节摘录证据。以下是各节按评分项摘录的要点，"
+        "不是原文；证据中没有出现的内容视为答案未涉及）"
+    )
+    return f"{header}\n\n{format_evidence(chunks, results)}", {"answer_tokens": tokens, **stats}
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+按置信度分级调用模型：先用便宜的快速模型评分，不确定时才交给强模型
+
+路由策略写在 tests/llm/routing.yaml 的 llm_routing 中（随 tests 仓库发布，workflow 复制到
+.autograde/routing.yaml 并设置 $LLM_ROUTING_CONFIG）；也可以用作业 config.yaml 的
+grading.llm_routing：
+
+    llm_routing:
+      enabled: true
+      cheap_model: deepseek-chat        # 省略时用 --model / $LLM_MODEL
+      strong_model: deepseek-reasoner
+      min_confidence: 0.7               # 置信度低于该值时升级
+      escalate_on_borderline: true      # 总分落在量表 borderline_band 内时升级
+      escalate_on_invalid: true         # 结果未通过量表校验时升级
+
+升级条件与 need_review 的条件相同。升级后 grade.json 以强模型的结果为准，
+routing.primary 中保留便宜模型的结果；强模型调用失败时保留便宜模型的结果，
+routing.strong_error 记录原因。未安装 PyYAML 或没有该配置时只用单一模型。
+"""
+
+import copy
+import os
+import sys
+
+from rubric import LOW_CONFIDENCE, compile_rubric
+
+try:
+    import yaml
+except ImportError:  # 评分环境未安装 PyYAML 时不启用路由
+    yaml = None
+
+
+class RoutingPolicy:
+    """分级路由策略，由 load_routing 从路由配置读取"""
+
+    def __init__(self, cheap_model, strong_model, min_confidence=LOW_CONFIDENCE,
+                 escalate_on_borderline=True, escalate_on_invalid=True):
+        self.cheap_model = cheap_model
+        self.strong_model = strong_model
+        self.min_confidence = min_confidence
+        self.escalate_on_borderline = escalate_on_borderline
+        self.escalate_on_invalid = escalate_on_invalid
+
+    def escalation_reasons(self, resp, rubric):
+        """便宜模型的结果需要升级的原因列表（invalid / low_confidence / borderline），不修改 resp"""
+        rubric = compile_rubric(rubric)
+        if not rubric.validate(resp):
+            return ["invalid"] if self.escalate_on_invalid else []
+        reasons = []
+        try:
+            confidence = float(resp.get("confidence", 1.0))
+        except (TypeError, ValueError):
+            confidence = 0.0
+        if confidence < self.min_confidence:
+            reasons.append("low_confidence")
+        if self.escalate_on_borderline and rubric.borderline_band is not None:
+            probe = copy.deepcopy(resp)
+            rubric.repair(probe)
+            if rubric.is_borderline(probe.get("total", 0)):
+                reasons.append("borderline")
+        return reasons
+
+    def route(self, resp, rubric, call_strong):
+        """
+        resp 为便宜模型的结果，需要升级时调用 call_strong(model) 取得强模型的结果
+
+        返回最终结果，其中 routing 记录所用模型、是否升级及原因
+        """
+        reasons = self.escalation_reasons(resp, rubric)
+        if not reasons:
+            resp["routing"] = {"model": self.cheap_model, "escalated": False}
+            return resp
+        print(f"Escalating to {self.strong_model} ({', '.join(reasons)})", file=sys.stderr)
+        rubric = compile_rubric(rubric)
+        primary = rubric.finalize(copy.deepcopy(resp))
+        try:
+            strong = call_strong(self.strong_model)
+            if not rubric.validate(strong) and rubric.validate(resp):
+                raise ValueError("result failed rubric validation")
+        except Exception as e:
+            print(f"Strong model call failed, keeping {self.cheap_model} result: {e}", file=sys.stderr)
+            resp["routing"] = {
+                "model": self.cheap_model, "escalated": True, "reasons": reasons,
+                "strong_model": self.strong_model, "strong_error": str(e)[:200],
+            }
+            return resp
+        strong["routing"] = {
+            "model": self.strong_model, "escalated": True, "reasons": reasons,
+            "primary": {"model": self.cheap_model, **primary},
+        }
+        return strong
+
+
+def load_routing(path, default_model=None):
+    """
+    读取路由配置：顶层的 llm_routing（tests/llm/routing.yaml）或作业 config.yaml 的
+    grading.llm_routing，未配置、未启用或无法读取时返回 None
+    """
+    if not path:
+        return None
+    if not os.path.exists(path):
+        print(f"Warning: config {path} not found, LLM routing disabled", file=sys.stderr)
+        return None
+    if yaml is None:
+        print("Warning: PyYAML not installed, LLM routing disabled", file=sys.stderr)
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        print(f"Warning: failed to read {path} ({e}), LLM routing disabled", file=sys.stderr)
+        return None
+    section = config.get("llm_routing") or (config.get("grading") or {}).get("llm_routing") or {}
+    if not section.get("enabled", True) or not section.get("strong_model"):
+        return None
+    return RoutingPolicy(
+        cheap_model=section.get("cheap_model") or default_model,
+        strong_model=section["strong_model"],
+        min_confidence=float(section.get("min_confidence", LOW_CONFIDENCE)),
+        escalate_on_borderline=bool(section.get("escalate_on_borderline", True)),
+        escalate_on_invalid=bool(section.get("escalate_on_invalid", True)),
+    )
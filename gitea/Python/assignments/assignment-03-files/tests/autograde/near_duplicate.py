@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+班级提交中近似重复答案的聚类（MinHash + LSH）
+
+很多 REPORT.md 是互相复制或由同一个 AI 提示生成的，内容几乎相同。批量评分时先按
+归一化文本的字符 shingle（与 template_screen 相同）计算 MinHash 签名，LSH 分桶找出
+候选对，再用精确的 Jaccard 相似度确认。每个簇只调用一次 LLM，其余成员复用代表答案的
+评分结果，并加 cluster_id / near_duplicate / need_review 标记供人工确认。
+
+聚类是贪心的：按清单顺序，第一个未归簇的答案作为代表，只收纳与代表本身相似度不低于
+阈值的答案，不做传递合并（A≈B、B≈C 不代表 C 可以复用 A 的分数）。
+"""
+
+import hashlib
+from collections import defaultdict
+
+from template_screen import jaccard, shingles
+
+DEFAULT_CLUSTER_THRESHOLD = 0.9
+NUM_PERM = 64
+# 16 个带 × 4 行：Jaccard ≈ 0.5 时成为候选的概率约 0.65，0.8 以上几乎必然成为候选
+NUM_BANDS = 16
+
+
+def _hash64(shingle):
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def minhash(shingle_set):
+    """
+    shingle 集合的 MinHash 签名（NUM_PERM 个整数），空集合返回 None
+
+    使用 one permutation hashing：每个 shingle 只哈希一次，按哈希值分到 NUM_PERM 个桶，
+    每桶取最小值，比 NUM_PERM 次独立置换快一个数量级；空桶从右侧最近的非空桶借值（densification）
+    """
+    if not shingle_set:
+        return None
+    bins = [None] * NUM_PERM
+    for s in shingle_set:
+        h = _hash64(s)
+        k, v = h % NUM_PERM, h // NUM_PERM
+        if bins[k] is None or v < bins[k]:
+            bins[k] = v
+    signature = list(bins)
+    for k in range(NUM_PERM):
+        if bins[k] is None:
+            offset = 1
+            while bins[(k + offset) % NUM_PERM] is None:
+                offset += 1
+            signature[k] = (bins[(k + offset) % NUM_PERM], offset)
+    return tuple(signature)
+
+
+def lsh_candidates(signatures, groups=None, bands=NUM_BANDS):
+    """
+    LSH 分桶，返回候选对 {(i, j)}（i < j）
+
+    groups 与 signatures 对应，只在同一组（如同一题目 + 量表）内产生候选
+    """
+    rows = NUM_PERM // bands
+    buckets = defaultdict(list)
+    for i, sig in enumerate(signatures):
+        if sig is None:
+            continue
+        group = groups[i] if groups else None
+        for band in range(bands):
+            buckets[(group, band, sig[band * rows:(band + 1) * rows])].append(i)
+    pairs = set()
+    for members in buckets.values():
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pairs.add((members[x], members[y]))
+    return pairs
+
+
+def cluster_texts(texts, threshold=DEFAULT_CLUSTER_THRESHOLD, groups=None):
+    """
+    对 texts 聚类，texts 中为 None 的项不参与
+
+    返回簇列表（只含 2 个及以上成员的簇），每个簇：
+    {"representative": i, "members": [i, j, ...], "similarity": {j: 与代表的相似度}}
+    """
+    shingle_sets = [shingles(t) if t else set() for t in texts]
+    signatures = [minhash(s) for s in shingle_sets]
+    neighbours = defaultdict(list)
+    for i, j in lsh_candidates(signatures, groups):
+        neighbours[i].append(j)
+
+    clusters = []
+    assigned = set()
+    for i in range(len(texts)):
+        if i in assigned or not shingle_sets[i]:
+            continue
+        similarity = {}
+        for j in sorted(neighbours[i]):
+            if j in assigned:
+                continue
+            sim = jaccard(shingle_sets[i], shingle_sets[j])
+            if sim >= threshold:
+                similarity[j] = round(sim, 3)
+        if similarity:
+            assigned.add(i)
+            assigned.update(similarity)
+            clusters.append({"representative": i, "members": [i, *similarity], "similarity": similarity})
+    return clusters
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+隐藏测试集的班级级分析（基于 grade_grouped.py 的批量评分目录）
+
+读取 <cohort_root>/<student>/test-results/*.xml，构建 学生 × 测试 的通过矩阵
+（NumPy 布尔数组），批量计算：
+- 各组得分分布（与 grade_grouped.py 的计分方式一致）
+- 每个测试的失败率
+- 区分度：测试通过情况与同组其余测试通过数的点二列相关（point-biserial）
+- 无人通过 / 全员通过的测试标记
+
+输出 analytics.json 和按难度排序的 hardest_tests.md
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from grade_grouped import TestClassifier, find_cohort_students, find_junit_files, iter_testcases, load_groups_config
+
+
+def load_cohort_matrix(cohort_root, groups_config, junit_subdir="test-results"):
+    """
+    构建通过矩阵
+
+    Returns
+    -------
+    students : list of str
+    test_ids : list of str
+        "classname.name"
+    test_groups : list of str
+        每个测试所属分组
+    passed : np.ndarray[bool], shape (n_students, n_tests)
+    present : np.ndarray[bool], shape (n_students, n_tests)
+        该学生的报告中是否包含此测试
+    """
+    students = find_cohort_students(cohort_root, junit_subdir)
+    classifier = TestClassifier(groups_config)
+    test_index = {}
+    test_groups = []
+    outcomes = []
+
+    for student in students:
+        junit_dir = os.path.join(cohort_root, student, junit_subdir)
+        student_outcomes = []
+        for xml_file in find_junit_files(junit_dir):
+            try:
+                for classname, name, ok, _ in iter_testcases(xml_file):
+                    test_id = f"{classname}.{name}"
+                    col = test_index.get(test_id)
+                    if col is None:
+                        col = test_index[test_id] = len(test_index)
+                        test_groups.append(classifier.classify(classname))
+                    student_outcomes.append((col, ok))
+            except Exception as e:
+                print(f"Error parsing {xml_file}: {e}", file=sys.stderr)
+        outcomes.append(student_outcomes)
+
+    passed = np.zeros((len(students), len(test_index)), dtype=bool)
+    present = np.zeros_like(passed)
+    for row, student_outcomes in enumerate(outcomes):
+        if not student_outcomes:
+            continue
+        cols, oks = zip(*student_outcomes)
+        cols = np.fromiter(cols, dtype=np.intp, count=len(cols))
+        present[row, cols] = True
+        passed[row, cols] = np.fromiter(oks, dtype=bool, count=len(oks))
+
+    return students, list(test_index), test_groups, passed, present
+
+
+def _column_pearson(x, y):
+    """逐列计算 x 与 y 的 Pearson 相关系数，方差为 0 的列返回 nan"""
+    xc = x - x.mean(axis=0)
+    yc = y - y.mean(axis=0)
+    denom = np.sqrt((xc * xc).sum(axis=0) * (yc * yc).sum(axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denom > 0, (xc * yc).sum(axis=0) / denom, np.nan)
+
+
+def analyze_matrix(test_groups, passed, present, groups_config):
+    """
+    批量计算各项统计量
+
+    Returns
+    -------
+    dict
+        group_scores: (n_students, n_groups) 各组得分
+        failure_rate / discrimination / pass_count / run_count: 每个测试一项
+        group_names / group_of_test
+    """
+    group_names = list(groups_config.get("groups", {}))
+    fallback = groups_config.get("fallback_group", "core")
+    group_pos = {name: i for i, name in enumerate(group_names)}
+    group_of_test = np.array(
+        [group_pos.get(g, group_pos.get(fallback, 0)) for g in test_groups], dtype=np.intp
+    )
+    max_scores = np.array(
+        [groups_config["groups"][name].get("max_score", 0) for name in group_names], dtype=float
+    )
+
+    # 测试 → 分组的 one-hot，用矩阵乘法一次得到每个学生各组的通过数/总数
+    membership = np.zeros((passed.shape[1], len(group_names)))
+    membership[np.arange(passed.shape[1]), group_of_test] = 1.0
+    x = passed.astype(float)
+    group_passed = x @ membership
+    group_total = present.astype(float) @ membership
+    with np.errstate(divide="ignore", invalid="ignore"):
+        group_scores = np.where(group_total > 0, group_passed / group_total, 0.0) * max_scores
+
+    pass_count = passed.sum(axis=0)
+    run_count = present.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        failure_rate = np.where(run_count > 0, 1.0 - pass_count / run_count, np.nan)
+
+    # 区分度：与同组“其余测试”的通过数相关，避免测试自身抬高相关系数
+    rest_score = group_passed[:, group_of_test] - x
+    discrimination = _column_pearson(x, rest_score)
+
+    return {
+        "group_names": group_names,
+        "group_of_test": group_of_test,
+        "group_scores": group_scores,
+        "pass_count": pass_count,
+        "run_count": run_count,
+        "failure_rate": failure_rate,
+        "discrimination": discrimination,
+    }
+
+
+def describe_scores(scores):
+    """单组得分分布"""
+    if scores.size == 0:
+        return {}
+    p25, median, p75 = np.percentile(scores, [25, 50, 75])
+    return {
+        "mean": round(float(scores.mean()), 2),
+        "std": round(float(scores.std()), 2),
+        "min": round(float(scores.min()), 2),
+        "p25": round(float(p25), 2),
+        "median": round(float(median), 2),
+        "p75": round(float(p75), 2),
+        "max": round(float(scores.max()), 2),
+    }
+
+
+def _round_or_none(value, ndigits=3):
+    return None if np.isnan(value) else round(float(value), ndigits)
+
+
+def build_report(students, test_ids, stats):
+    """整理为可序列化的 dict，测试按失败率降序、区分度降序排列"""
+    group_names = stats["group_names"]
+    tests = []
+    for col, test_id in enumerate(test_ids):
+        pass_count = int(stats["pass_count"][col])
+        run_count = int(stats["run_count"][col])
+        flags = []
+        if run_count and pass_count == 0:
+            flags.append("nobody_passes")
+        elif run_count and pass_count == run_count:
+            flags.append("everybody_passes")
+        tests.append({
+            "test": test_id,
+            "group": group_names[stats["group_of_test"][col]] if group_names else None,
+            "passed": pass_count,
+            "run": run_count,
+            "failure_rate": _round_or_none(stats["failure_rate"][col]),
+            "discrimination": _round_or_none(stats["discrimination"][col]),
+            "flags": flags,
+        })
+
+    tests.sort(key=lambda t: (
+        -(t["failure_rate"] or 0),
+        -(t["discrimination"] if t["discrimination"] is not None else -2),
+        t["test"],
+    ))
+
+    return {
+        "students": len(students),
+        "tests": len(test_ids),
+        "groups": {
+            name: describe_scores(stats["group_scores"][:, i])
+            for i, name in enumerate(group_names)
+        },
+        "nobody_passes": [t["test"] for t in tests if "nobody_passes" in t["flags"]],
+        "everybody_passes": [t["test"] for t in tests if "everybody_passes" in t["flags"]],
+        "ranked_tests": tests,
+    }
+
+
+def write_hardest_tests(report, path, title, top):
+    """写出 hardest_tests.md"""
+    lines = [
+        f"# {title} 测试难度分析",
+        "",
+        f"- **学生数**：{report['students']}",
+        f"- **测试数**：{report['tests']}",
+        f"- **无人通过**：{len(report['nobody_passes'])}",
+        f"- **全员通过**：{len(report['everybody_passes'])}",
+        "",
+        "## 分组得分分布",
+        "",
+        "| 分组 | 平均 | 标准差 | 最低 | P25 | 中位数 | P75 | 最高 |",
+        "|------|------|--------|------|-----|--------|-----|------|",
+    ]
+    for name, dist in report["groups"].items():
+        if dist:
+            lines.append(
+                f"| {name} | {dist['mean']:.2f} | {dist['std']:.2f} | {dist['min']:.2f} | "
+                f"{dist['p25']:.2f} | {dist['median']:.2f} | {dist['p75']:.2f} | {dist['max']:.2f} |"
+            )
+
+    lines += [
+        "",
+        f"## 最难的 {top} 个测试",
+        "",
+        "| # | 测试 | 分组 | 通过/运行 | 失败率 | 区分度 | 标记 |",
+        "|---|------|------|-----------|--------|--------|------|",
+    ]
+    for i, t in enumerate(report["ranked_tests"][:top], 1):
+        disc = "-" if t["discrimination"] is None else f"{t['discrimination']:.2f}"
+        rate = "-" if t["failure_rate"] is None else f"{t['failure_rate']:.0%}"
+        lines.append(
+            f"| {i} | {t['test']} | {t['group']} | {t['passed']}/{t['run']} | "
+            f"{rate} | {disc} | {', '.join(t['flags']) or ''} |"
+        )
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cohort test-matrix analytics for hidden test suites")
+    parser.add_argument("--cohort-root", required=True, help="Directory containing <student>/test-results/*.xml")
+    parser.add_argument("--groups", default="test_groups.json", help="Test groups configuration file")
+    parser.add_argument("--junit-subdir", default="test-results", help="JUnit directory inside each student dir")
+    parser.add_argument("--title", default=None, help="Assignment title used in the report (default: cohort dir name)")
+    parser.add_argument("--top", type=int, default=30, help="Number of tests in the hardest-tests table")
+    parser.add_argument("--out", default="analytics.json", help="Output JSON file")
+    parser.add_argument("--report", default="hardest_tests.md", help="Output markdown report")
+    args = parser.parse_args()
+
+    groups_config = load_groups_config(args.groups)
+
+    start = time.perf_counter()
+    students, test_ids, test_groups, passed, present = load_cohort_matrix(
+        args.cohort_root, groups_config, args.junit_subdir
+    )
+    loaded = time.perf_counter()
+    stats = analyze_matrix(test_groups, passed, present, groups_config)
+    analyzed = time.perf_counter()
+
+    print(f"📊 {len(students)} students × {len(test_ids)} tests")
+    print(f"   load {loaded - start:.2f}s, analyze {analyzed - loaded:.3f}s")
+
+    report = build_report(students, test_ids, stats)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    title = args.title or os.path.basename(os.path.abspath(args.cohort_root))
+    write_hardest_tests(report, args.report, title, args.top)
+    print(f"Analytics written to {args.out}, {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,6 +12,8 @@ import sys
 import re
 from datetime import datetime
 
+from llm_ledger import ledger_metadata
+
 
 def extract_student_id():
     """从环境变量或仓库名中提取学生 ID"""
@@ -333,6 +335,16 @@ def create_objective_metadata(objective_file='objective_grade.json'):
         return {}
 
 
+def attach_llm_ledger(metadata):
+    """把本次运行的 LLM 调用台账（llm_ledger.jsonl）附加到 metadata 中"""
+    ledger = ledger_metadata(student_id=metadata.get("student_id"))
+    if ledger:
+        for call in ledger["calls"]:
+            call.setdefault("assignment", metadata.get("assignment"))
+        metadata["llm_ledger"] = ledger
+    return metadata
+
+
 def main():
     """主函数"""
     # 检查命令行参数或环境变量
@@ -373,6 +385,9 @@ def main():
             print(f"Error: {grade_file} not found", file=sys.stderr)
             metadata = {}
     
+    if metadata:
+        attach_llm_ledger(metadata)
+    
     # 输出到 stdout
     print(json.dumps(metadata, ensure_ascii=False, indent=2))
 
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+JUnit 解析结果的内容哈希缓存
+
+以 JUnit XML 文件内容（及分组配置）的 SHA-256 为 key，把解析 + 计分后的紧凑结果
+存成 <cache_dir>/<key[:2]>/<key>.json。学生只改了 REPORT.md 再次推送时，
+XML 内容不变即可直接命中，跳过解析和计分。
+
+缓存需显式开启（--cache-dir 或 AUTOGRADE_CACHE_DIR）：CI 容器用完即弃，默认写到
+家目录只会白白多写文件；自托管 runner 或批量评测时指定一个持久目录才有意义。
+
+按文件 mtime 做 LRU：命中时刷新 mtime。写入时累加缓存总大小（首次写入时扫描一次目录），
+超过上限才重新扫描目录，从最旧的开始删除到上限的 EVICT_TO 比例，每次写入的均摊代价与
+条目数无关。多个进程共用缓存目录时各自计数，总大小可能短暂超过上限。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 淘汰时删到上限的这个比例，避免缓存满后每次写入都重新扫描目录
+EVICT_TO = 0.8
+
+
+def default_cache_dir():
+    """$AUTOGRADE_CACHE_DIR，未设置时为 None（不使用缓存）"""
+    return os.getenv("AUTOGRADE_CACHE_DIR") or None
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """流式计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def config_sha256(config):
+    """计算配置（dict）的规范化 SHA-256"""
+    canonical = json.dumps(config, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cache_key(namespace, xml_files, config=None):
+    """
+    由命名空间、各 XML 内容哈希（与文件名、顺序无关）和配置哈希生成缓存 key
+
+    namespace 用于区分不同脚本 / 计分逻辑版本，计分逻辑变化时应更新
+    """
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    for file_hash in sorted(file_sha256(p) for p in xml_files):
+        digest.update(file_hash.encode("ascii"))
+    if config is not None:
+        digest.update(config_sha256(config).encode("ascii"))
+    return digest.hexdigest()
+
+
+class JUnitCache:
+    """基于目录的 LRU 缓存"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size = None  # 缓存总大小，首次写入时由 evict() 扫描得到
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """命中返回缓存的 dict，否则返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # 刷新 LRU 时间
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Warning: ignoring unreadable cache entry {path}: {e}", file=sys.stderr)
+            return None
+
+    def put(self, key, value):
+        """原子写入缓存条目，并按大小上限淘汰"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            new_size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+            if self._size is None:
+                self.evict()
+            else:
+                self._size += new_size - old_size
+                if self._size > self.max_bytes:
+                    self.evict()
+        except Exception as e:
+            print(f"Warning: failed to write cache entry {path}: {e}", file=sys.stderr)
+
+    def evict(self):
+        """扫描缓存目录；总大小超过 max_bytes 时按 mtime 从旧到新删除到 max_bytes * EVICT_TO"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+        self._size = total
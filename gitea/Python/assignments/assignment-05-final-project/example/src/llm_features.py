@@ -21,7 +21,7 @@ class LLMFeatures:
         
         self.client = OpenAI(
             api_key=api_key,
-            base_url="https://api.deepseek.com"
+            base_url=os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
         )
         self.model = "deepseek-chat"
     
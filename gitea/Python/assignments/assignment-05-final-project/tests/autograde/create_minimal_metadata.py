@@ -13,6 +13,8 @@ import sys
 import re
 from datetime import datetime
 
+from llm_ledger import ledger_metadata
+
 
 def extract_student_id():
     """从环境变量或仓库名中提取学生 ID"""
@@ -261,6 +263,16 @@ def create_final_metadata(final_grade_file='final_grade.json', run_results_file=
         return {}
 
 
+def attach_llm_ledger(metadata):
+    """把本次运行的 LLM 调用台账（llm_ledger.jsonl）附加到 metadata 中"""
+    ledger = ledger_metadata(student_id=metadata.get("student_id"))
+    if ledger:
+        for call in ledger["calls"]:
+            call.setdefault("assignment", metadata.get("assignment"))
+        metadata["llm_ledger"] = ledger
+    return metadata
+
+
 def main():
     """主函数"""
     grade_type = os.getenv("GRADE_TYPE", "final").lower()
@@ -272,6 +284,9 @@ def main():
         print(f"Error: {grade_file} not found", file=sys.stderr)
         metadata = {}
     
+    if metadata:
+        attach_llm_ledger(metadata)
+    
     print(json.dumps(metadata, ensure_ascii=False, indent=2))
 
 
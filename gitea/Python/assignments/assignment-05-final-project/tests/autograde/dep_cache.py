@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+学生项目依赖的缓存：按 requirements.txt 复用预先装好的虚拟环境
+
+缓存目录结构：
+    wheels/               共享的 wheelhouse，所有项目下载 / 构建的 wheel
+    venvs/<key>/          按依赖键建好的虚拟环境，.autograde-ready 标记已装好
+    venvs/<key>.digest    装好时环境内容的 sha256（见 tree_digest）
+    venvs/<key>.lock      建环境时持有的独占锁，多个评测进程共用缓存时只有一个在安装
+    venvs/<key>.use       使用环境期间持有的共享锁；淘汰时非阻塞地取独占锁，取不到说明
+                          有进程正在使用（或正在安装），跳过。淘汰时连同 .digest / .lock / .use 删除
+
+依赖键为规范化后的 requirements（去掉注释和空行、包名按 PEP 503 规范化、排序去重，
+-r 引用的文件展开，-c 约束文件的内容同样规范化后计入）加上 Python 实现、版本和平台的
+sha256；空格、注释或行序不同的 requirements 命中同一个环境，引用的文件内容不同则不命中。
+
+同一个环境由依赖相同的所有学生共用，学生代码不能改动它：装好后去掉环境的写权限，
+每次使用前核对内容摘要，不一致（被写入或植入模块）时删除重建。以 root 运行的命令不受
+写权限限制，摘要核对保证改动不会带到下一次评测；run_project.py 在环境中运行命令时
+设置 PYTHONDONTWRITEBYTECODE，避免正常运行产生的 .pyc 改变摘要。
+
+未命中时先用 pip wheel 把依赖放进 wheelhouse，再从 wheelhouse 离线安装到新环境；
+wheel 步骤失败（如某个包只有源码且构建失败）时直接 pip install。虚拟环境使用
+--system-site-packages，评测机已安装的包仍然可见，与直接装进评测机 Python 时一致。
+
+淘汰按最近使用时间（LRU）：虚拟环境超过 max_venvs 个、wheelhouse 超过 max_wheel_mb 时
+删除最久未使用的。每次命中都会更新标记文件和所用 wheel 的修改时间。
+
+timeout 是 ensure() 的总期限：等待其他进程安装、建环境、pip wheel 和 pip install 共用，
+各步骤只能使用剩余的时间。
+
+缓存只有放在持久目录中才有意义：workflow 的容器每次都是新的，只有设置了
+$AUTOGRADE_DEP_CACHE（runner 挂载的持久卷）或传入 --dep-cache 时 run_project.py 才使用缓存，
+否则仍直接把依赖装进当前 Python。
+"""
+
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，不加锁
+    fcntl = None
+
+DEFAULT_MAX_VENVS = 8
+DEFAULT_MAX_WHEEL_MB = 2048
+DEFAULT_TIMEOUT = 120
+READY_MARKER = ".autograde-ready"
+LOCK_POLL_INTERVAL = 0.2
+
+_NAME_RE = re.compile(r"^([A-Za-z0-9][A-Za-z0-9._-]*)(.*)$")
+
+
+def normalize_name(name: str) -> str:
+    """PEP 503 包名规范化"""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def normalize_requirements(path: Path, seen=frozenset()) -> list:
+    """
+    读取 requirements 文件，返回规范化、排序去重后的行
+
+    -r / --requirement 引用的文件展开；-c / --constraint 约束文件的行加上 "-c " 前缀后计入。
+    seen 为引用链上的文件，只用于避免循环引用
+    """
+    path = Path(path).resolve()
+    if path in seen or not path.exists():
+        return []
+    seen = seen | {path}
+    lines = set()
+    for raw in path.read_text(encoding="utf-8", errors="replace").splitlines():
+        line = raw.split(" #", 1)[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        include = re.match(r"^(--requirement|--constraint|-r|-c)[\s=]*(.+)$", line)
+        if include:
+            nested = normalize_requirements(path.parent / include.group(2).strip(), seen)
+            if include.group(1) in ("-c", "--constraint"):
+                nested = [f"-c {c}" for c in nested]
+            lines.update(nested)
+            continue
+        match = _NAME_RE.match(line)
+        if match and not line.startswith("-"):
+            line = normalize_name(match.group(1)) + re.sub(r"\s+", "", match.group(2))
+        lines.add(line)
+    return sorted(lines)
+
+
+def python_tag() -> str:
+    """Python 实现、版本和平台，例如 cpython-3.11-linux-x86_64"""
+    return "-".join([
+        platform.python_implementation().lower(),
+        f"{sys.version_info.major}.{sys.version_info.minor}",
+        sys.platform,
+        platform.machine().lower(),
+    ])
+
+
+def requirements_key(requirements: list) -> str:
+    payload = json.dumps([python_tag(), requirements], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:20]
+
+
+def venv_python(venv: Path) -> Path:
+    return venv / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+
+
+def venv_bin(venv: Path) -> Path:
+    return venv / ("Scripts" if os.name == "nt" else "bin")
+
+
+def tree_digest(root: Path) -> str:
+    """目录树的 sha256：相对路径、符号链接目标和文件内容，不含根目录下的 READY_MARKER"""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(dirnames + filenames):
+            full = os.path.join(dirpath, name)
+            rel = os.path.relpath(full, root)
+            if rel == READY_MARKER:
+                continue
+            if os.path.islink(full):
+                digest.update(f"L {rel} -> {os.readlink(full)}\n".encode("utf-8", "surrogateescape"))
+            elif os.path.isdir(full):
+                digest.update(f"D {rel}\n".encode("utf-8", "surrogateescape"))
+            else:
+                digest.update(f"F {rel}\n".encode("utf-8", "surrogateescape"))
+                with open(full, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+    return digest.hexdigest()
+
+
+def set_writable(root: Path, writable: bool):
+    """给目录树加上或去掉写权限（符号链接不处理）"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        for path in [dirpath] + [os.path.join(dirpath, name) for name in dirnames + filenames]:
+            if os.path.islink(path):
+                continue
+            mode = os.stat(path).st_mode
+            os.chmod(path, mode | 0o200 if writable else mode & ~0o222)
+
+
+def remove_tree(root: Path):
+    """删除目录树，先恢复写权限"""
+    if os.path.isdir(root) and not os.path.islink(root):
+        set_writable(root, True)
+    shutil.rmtree(root, ignore_errors=True)
+
+
+def default_cache_dir():
+    """$AUTOGRADE_DEP_CACHE，未设置时为 None（不使用缓存）"""
+    return os.getenv("AUTOGRADE_DEP_CACHE") or None
+
+
+class _FileLock:
+    """
+    文件锁（fcntl.flock），shared 为共享锁；没有 fcntl 时不加锁
+
+    blocking 为 False 时只尝试一次；deadline（time.monotonic() 时刻）给出时轮询到期限为止。
+    锁文件可能在等待期间被 evict() 删除，取得锁后确认路径仍指向同一个文件，否则重新打开
+    """
+
+    def __init__(self, path: Path, blocking=True, shared=False, deadline=None):
+        self.path = path
+        self.blocking = blocking
+        self.shared = shared
+        self.deadline = deadline
+        self.handle = None
+
+    def acquire(self) -> bool:
+        self.handle = open(self.path, "a")
+        if fcntl is None:
+            return True
+        mode = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        while True:
+            try:
+                if self.blocking and self.deadline is None:
+                    fcntl.flock(self.handle, mode)
+                else:
+                    fcntl.flock(self.handle, mode | fcntl.LOCK_NB)
+                if self._current():
+                    return True
+                self.handle.close()
+                self.handle = open(self.path, "a")
+                continue
+            except OSError:
+                if not self.blocking or self.deadline is None or time.monotonic() >= self.deadline:
+                    self.release()
+                    return False
+                time.sleep(LOCK_POLL_INTERVAL)
+
+    def _current(self) -> bool:
+        """持有的文件是否仍是 path 指向的文件"""
+        try:
+            return os.stat(self.path).st_ino == os.fstat(self.handle.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def release(self):
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise TimeoutError(f"等待文件锁超时: {self.path}")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class DependencyCache:
+    """
+    按依赖键缓存虚拟环境，ensure() 返回可用的环境及安装信息
+
+    ensure() 返回的环境在 release() 之前一直持有共享锁，其他进程不会把它淘汰
+    """
+
+    def __init__(self, cache_dir, max_venvs=DEFAULT_MAX_VENVS,
+                 max_wheel_mb=DEFAULT_MAX_WHEEL_MB, timeout=DEFAULT_TIMEOUT):
+        self.cache_dir = Path(cache_dir).expanduser().resolve()
+        self.wheels = self.cache_dir / "wheels"
+        self.venvs = self.cache_dir / "venvs"
+        self.max_venvs = max_venvs
+        self.max_wheel_mb = max_wheel_mb
+        self.timeout = timeout
+        self._in_use = []
+
+    def ensure(self, requirements_path: Path) -> dict:
+        """
+        取得 requirements 对应的虚拟环境，未命中时安装；等待和安装合计不超过 timeout 秒
+
+        Returns:
+            {"requirements_hash", "python", "cache_hit", "venv", "install_seconds", "error"}；
+            安装失败时 venv 为 None，error 记录原因
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        requirements = normalize_requirements(requirements_path)
+        key = requirements_key(requirements)
+        info = {
+            "requirements_hash": key, "python": python_tag(),
+            "cache_hit": False, "venv": None, "install_seconds": 0.0, "error": None,
+        }
+        self.wheels.mkdir(parents=True, exist_ok=True)
+        self.venvs.mkdir(parents=True, exist_ok=True)
+        venv = self.venvs / key
+        # 先取使用锁（共享）再取安装锁（独占）：持有使用锁期间 evict() 不会删除该环境
+        use_lock = _FileLock(self.venvs / f"{key}.use", shared=True, deadline=deadline)
+        if not use_lock.acquire():
+            info["error"] = "依赖安装超时：等待缓存环境的锁"
+        else:
+            try:
+                with _FileLock(self.venvs / f"{key}.lock", deadline=deadline):
+                    if (venv / READY_MARKER).exists() and self._intact(key):
+                        info["cache_hit"] = True
+                    else:
+                        info["error"] = self._build(venv, requirements_path, requirements, deadline)
+                    if info["error"] is None:
+                        info["venv"] = str(venv)
+                        self._touch(venv)
+            except TimeoutError:
+                info["error"] = "依赖安装超时：等待其他评测进程安装同一环境"
+            if info["venv"]:
+                self._in_use.append(use_lock)
+            else:
+                use_lock.release()
+        info["install_seconds"] = round(time.monotonic() - start, 2)
+        self.evict(keep=key)
+        return info
+
+    def release(self):
+        """释放 ensure() 返回的环境的共享锁，之后环境可以被淘汰"""
+        for lock in self._in_use:
+            lock.release()
+        self._in_use = []
+
+    def _intact(self, key: str) -> bool:
+        """环境内容与装好时的摘要一致；不一致说明被改动过，需要重建"""
+        digest_path = self.venvs / f"{key}.digest"
+        expected = digest_path.read_text(encoding="utf-8").strip() if digest_path.exists() else None
+        if expected and tree_digest(self.venvs / key) == expected:
+            return True
+        print(f"Warning: cached environment {key} was modified, rebuilding", file=sys.stderr)
+        return False
+
+    def _run(self, args, cwd, deadline) -> subprocess.CompletedProcess:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise RuntimeError(f"依赖安装超时（{self.timeout}s）")
+        try:
+            return subprocess.run(args, cwd=cwd, timeout=remaining, capture_output=True, text=True)
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"依赖安装超时（{self.timeout}s）")
+
+    def _build(self, venv: Path, requirements_path: Path, requirements: list, deadline: float):
+        """在 venv 建环境并安装依赖，成功返回 None，失败返回原因并删除半成品；装好的环境只读"""
+        remove_tree(venv)
+        cwd = Path(requirements_path).parent
+        req = str(Path(requirements_path).resolve())
+        try:
+            proc = self._run([sys.executable, "-m", "venv", "--system-site-packages", str(venv)], cwd, deadline)
+            if proc.returncode != 0:
+                raise RuntimeError(f"创建虚拟环境失败: {proc.stderr.strip()[-300:]}")
+            python = str(venv_python(venv))
+            if requirements:
+                proc = self._run([python, "-m", "pip", "wheel", "-q", "-r", req,
+                                  "--wheel-dir", str(self.wheels), "--find-links", str(self.wheels)], cwd, deadline)
+                if proc.returncode == 0:
+                    proc = self._run([python, "-m", "pip", "install", "-q", "--no-index",
+                                      "--find-links", str(self.wheels), "-r", req], cwd, deadline)
+                if proc.returncode != 0:
+                    proc = self._run([python, "-m", "pip", "install", "-q", "-r", req], cwd, deadline)
+                if proc.returncode != 0:
+                    raise RuntimeError(f"依赖安装失败: {proc.stderr.strip()[-300:]}")
+            (venv / READY_MARKER).write_text(
+                json.dumps({"python": python_tag(), "requirements": requirements}, ensure_ascii=False, indent=2),
+                encoding="utf-8",
+            )
+            (self.venvs / f"{venv.name}.digest").write_text(tree_digest(venv), encoding="utf-8")
+            set_writable(venv, False)
+            return None
+        except Exception as e:
+            remove_tree(venv)
+            return str(e) if isinstance(e, RuntimeError) else f"依赖安装失败: {e}"
+
+    def _touch(self, venv: Path):
+        """更新环境及其所用 wheel 的最近使用时间"""
+        os.utime(venv / READY_MARKER)
+        installed = {
+            normalize_name(d.name[:-len(".dist-info")].rsplit("-", 1)[0])
+            for d in venv.glob("lib*/**/site-packages/*.dist-info")
+        }
+        for wheel in self.wheels.glob("*.whl"):
+            if normalize_name(wheel.name.split("-", 1)[0]) in installed:
+                os.utime(wheel)
+
+    def evict(self, keep: str = None):
+        """按最近使用时间淘汰多余的虚拟环境和超出容量的 wheel；正在被使用或安装的环境跳过"""
+        ready = sorted(
+            (marker.stat().st_mtime, marker.parent) for marker in self.venvs.glob(f"*/{READY_MARKER}")
+        )
+        for _, venv in ready[:max(len(ready) - self.max_venvs, 0)]:
+            if venv.name == keep:
+                continue
+            lock = _FileLock(self.venvs / f"{venv.name}.use", blocking=False)
+            if lock.acquire():
+                try:
+                    remove_tree(venv)
+                    # 持有 .use 独占锁时没有进程持有 .lock（安装前先取 .use）；等待中的进程取得锁后
+                    # 发现文件已被删除会重新打开
+                    for suffix in (".digest", ".lock", ".use"):
+                        (self.venvs / f"{venv.name}{suffix}").unlink(missing_ok=True)
+                finally:
+                    lock.release()
+
+        wheels = sorted((w.stat().st_mtime, w) for w in self.wheels.glob("*.whl"))
+        total = sum(w.stat().st_size for _, w in wheels)
+        limit = self.max_wheel_mb * 1024 * 1024
+        for _, wheel in wheels:
+            if total <= limit:
+                break
+            total -= wheel.stat().st_size
+            wheel.unlink(missing_ok=True)
@@ -2,20 +2,73 @@
 """
 期末项目 LLM 评估脚本
 根据 run_results.json 和 rubric 进行评分
+
+--config 给出的路由配置（tests/llm/routing.yaml）启用 llm_routing 时先用便宜模型评分，不确定时再用强模型
+（见 llm_routing）；--llm-record DIR 录制 LLM 调用，--llm-replay DIR 只从录制中回放（见 llm_replay）
+
+超过 --chunk-threshold tokens 的文档先按标题分块、并行按评分项摘录证据，文档维度的评分调用
+只看到证据汇总（见 chunked_grading）；各块的摘录按内容缓存，修改一节只重新处理这一节
+
+学生材料（文档、源代码、命令输出、生成文件）按各维度的 token 预算打包，超出时按优先级截断，
+评分结果的 prompt_budget 记录被截断的部分（见 prompt_budget）；源代码以 AST 摘要的形式提供
+（概要 + 重点函数完整源码，见 source_digest）
+
+--dimension all 只读取一次 run_results.json，三个维度并发评估，分别写入 --out-dir 下的
+doc_grade.json、func_grade.json、code_grade.json
+
+每个维度只读取 run_results 的一部分（见 dimension_slice）；切片、量表、prompt 模板和模型配置都
+未变化时直接复用响应缓存文件中保存的上次评分，不调用 LLM（--refresh 强制重评，--no-cache 关闭）。
+跨次运行复用要求 --cache-path / $LLM_CACHE_PATH 指向持久目录：workflow 的 python:3.11 容器每次
+都是新的，默认的 ~/.cache 随容器丢弃，只有在评分机上运行或给 runner 挂载持久卷时才会命中
 """
 
 import json
 import argparse
-import requests
+import hashlib
 import os
+import re
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 
+from chunked_grading import DEFAULT_CHUNK_THRESHOLD, DEFAULT_CHUNK_TOKENS, condense_answer
+from llm_cache import LLMCache
+from llm_client import CircuitOpenError, LLMCallError, LLMClient, ReplayMissError
+from llm_ledger import LLMLedger
+from llm_replay import LLMReplay
+from llm_resilience import DEFAULT_HEDGE_AFTER, CircuitBreaker
+from llm_routing import RoutingPolicy, load_routing
+from prompt_budget import PromptBudget, estimate_tokens
+from rubric import compile_rubric, load_rubric
+from source_digest import format_bodies, format_file_summary, format_outline, get_digest
+from template_screen import DEFAULT_THRESHOLD, load_template, screen
+
 load_dotenv()
 
+# 各维度及 --dimension all 时的输出文件名
+DIMENSION_OUTPUTS = {
+    "documentation": "doc_grade.json",
+    "functionality": "func_grade.json",
+    "code_quality": "code_grade.json",
+}
+
+# 各维度 prompt 的总 token 预算（含评分说明和量表），可用 --prompt-budget 覆盖
+PROMPT_BUDGETS = {
+    "documentation": 24000,
+    "functionality": 16000,
+    "code_quality": 24000,
+}
+
+
+# 这些标记表示评分没有真正完成，不作为可复用的评分缓存
+UNCACHEABLE_FLAGS = {"llm_error", "llm_deferred", "llm_replay_miss"}
+
 
 # ============== Prompt 模板 ==============
+# 布局：评分说明、判断标准、量表、输出格式在前，学生材料统一放在末尾。
+# 同一维度所有学生的 prompt 共享字节一致的前缀，可命中服务商的上下文（前缀）缓存。
+# 占位符 <<<NAME>>> 由 fill_prompt 一次性替换，学生内容中的同名标记不会被二次替换。
 
 DOCUMENTATION_PROMPT = """你是严格且一致的助教，正在评估学生期末项目的文档质量。
 
@@ -81,25 +134,6 @@ DOCUMENTATION_PROMPT = """你是严格且一致的助教，正在评估学生期
    - 看标题是否是具体项目名，而非"项目名称"
    - 看功能列表是否具体，而非"功能 1：描述"
 
-## 学生提交的文档
-
-### README.md
-<<<README_CONTENT>>>
-
-### REPORT.md (反思报告)
-<<<REPORT_CONTENT>>>
-
-### CHANGELOG.md (版本记录)
-<<<CHANGELOG_CONTENT>>>
-
-## 实际代码和运行情况（用于交叉验证）
-
-### 源代码文件列表
-<<<SOURCE_FILES>>>
-
-### 命令运行结果摘要
-<<<RUN_SUMMARY>>>
-
 ## 一致性检查（重要！）
 
 **文档内容必须与实际代码/运行结果一致**。请对比验证：
@@ -137,6 +171,25 @@ DOCUMENTATION_PROMPT = """你是严格且一致的助教，正在评估学生期
   "flags": [],
   "confidence": number(0-1)
 }
+
+## 学生提交的文档
+
+### README.md
+<<<README_CONTENT>>>
+
+### REPORT.md (反思报告)
+<<<REPORT_CONTENT>>>
+
+### CHANGELOG.md (版本记录)
+<<<CHANGELOG_CONTENT>>>
+
+## 实际代码和运行情况（用于交叉验证）
+
+### 源代码文件列表
+<<<SOURCE_FILES>>>
+
+### 命令运行结果摘要
+<<<RUN_SUMMARY>>>
 """
 
 FUNCTIONALITY_PROMPT = """你是严格且一致的助教，正在评估学生期末项目的功能表现。
@@ -162,22 +215,7 @@ FUNCTIONALITY_PROMPT = """你是严格且一致的助教，正在评估学生期
 - 有输出但是模板提示语 = 未实现功能 = 0 分
 - 只有 --help 输出没有实际功能演示 = 未实现功能 = 0 分
 
-## 项目信息
-- 项目名称：{project_name}
-- 项目描述：{project_description}
-
-**首先判断**：如果项目名称是"你的项目名称"或描述是"一句话描述项目功能"，说明学生未修改模板，所有功能评分应为 0 分。
-
-## 命令运行结果
-
-### 主功能演示
-{demo_results}
-
-### 错误处理演示
-{error_results}
-
-## 生成的文件
-{generated_files}
+**首先判断**：如果项目名称（见下方项目信息）是"你的项目名称"或描述是"一句话描述项目功能"，说明学生未修改模板，所有功能评分应为 0 分。
 
 ## 各评分项的判断标准
 
@@ -289,15 +327,32 @@ FUNCTIONALITY_PROMPT = """你是严格且一致的助教，正在评估学生期
 - 只输出 JSON，不输出任何解释
 
 ## 输出格式（严格JSON）
-{{
+{
   "total": number,
   "criteria": [
-    {{"id": "评分项id", "score": 整数, "reason": "简短评语，引用具体输出内容作为依据"}},
+    {"id": "评分项id", "score": 整数, "reason": "简短评语，引用具体输出内容作为依据"},
     ...
   ],
   "flags": [],
   "confidence": number(0-1)
-}}
+}
+
+## 学生提交的材料
+
+### 项目信息
+- 项目名称：<<<PROJECT_NAME>>>
+- 项目描述：<<<PROJECT_DESCRIPTION>>>
+
+### 命令运行结果
+
+#### 主功能演示
+<<<DEMO_RESULTS>>>
+
+#### 错误处理演示
+<<<ERROR_RESULTS>>>
+
+### 生成的文件
+<<<GENERATED_FILES>>>
 """
 
 CODE_QUALITY_PROMPT = """你是严格且一致的助教，正在评估学生期末项目的代码质量。
@@ -321,13 +376,6 @@ CODE_QUALITY_PROMPT = """你是严格且一致的助教，正在评估学生期
 - 模板代码未修改 = 未实现 = 0 分
 - 没有 LLM 调用代码 = 不满足必选要求 = 结构最高 1 分
 
-## 源代码文件
-
-{source_code}
-
-## 安全检查结果
-{security_issues}
-
 ## 各评分项的判断标准
 
 ### 1. 代码结构 (code_structure) - 最高 2 分
@@ -391,123 +439,170 @@ CODE_QUALITY_PROMPT = """你是严格且一致的助教，正在评估学生期
 - **严格根据代码的实际业务逻辑评分**
 - 模板代码、框架代码、没有功能实现的代码 = 0 分
 - 只有真正实现了功能的代码才能评价其结构和可读性
+- 概要中未附源码的函数同样是学生的代码，结合签名、说明和复杂度判断，不要当作缺失
 - 每项只能给出 scoring_guide 中定义的整数分值
 - 只输出 JSON，不输出任何解释
 
 ## 输出格式（严格JSON）
-{{
+{
   "total": number,
   "criteria": [
-    {{"id": "评分项id", "score": 整数, "reason": "简短评语，引用具体代码特征作为依据"}},
+    {"id": "评分项id", "score": 整数, "reason": "简短评语，引用具体代码特征作为依据"},
     ...
   ],
   "flags": [],
   "confidence": number(0-1)
-}}
+}
+
+## 学生提交的材料
+
+### 源代码概要（AST 解析：签名、行号、圈复杂度、LLM/文件读写调用）
+
+<<<SOURCE_OUTLINE>>>
+
+### 重点函数完整源码（按 LLM 调用、文件读写、复杂度挑选，其余函数只见概要）
+
+<<<SOURCE_BODIES>>>
+
+### 安全检查结果
+<<<SECURITY_ISSUES>>>
 """
 
 
-def call_llm(prompt: str, api_url: str, api_key: str, model: str) -> dict:
-    """调用 LLM API"""
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "model": model,
-        "temperature": 0,
-        "messages": [{"role": "user", "content": prompt}],
-        "response_format": {"type": "json_object"},
+PROMPT_TEMPLATES = {
+    "documentation": DOCUMENTATION_PROMPT,
+    "functionality": FUNCTIONALITY_PROMPT,
+    "code_quality": CODE_QUALITY_PROMPT,
+}
+
+_PLACEHOLDER_RE = re.compile(r"<<<([A-Z_]+)>>>")
+
+
+def fill_prompt(template: str, **values) -> str:
+    """单次扫描替换 <<<NAME>>> 占位符（键名小写），未提供的占位符原样保留"""
+    return _PLACEHOLDER_RE.sub(lambda m: values.get(m.group(1).lower(), m.group(0)), template)
+
+
+def compact_json(value) -> str:
+    """紧凑 JSON（无缩进和多余空格），用于量表和生成文件列表"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def material_budget(template: str, prompt_budget: int, **fixed) -> PromptBudget:
+    """扣除模板和不截断部分（量表等）后，剩余预算用于学生材料"""
+    fixed_tokens = estimate_tokens(fill_prompt(template, **fixed))
+    return PromptBudget(max(prompt_budget - fixed_tokens, 0))
+
+
+def attach_budget_report(grade: dict, prompt: str, prompt_budget: int, budget: PromptBudget) -> dict:
+    """记录 prompt 预算和被截断的材料，有截断时打印"""
+    grade["prompt_budget"] = {
+        "budget": prompt_budget,
+        "prompt_tokens": estimate_tokens(prompt),
+        "trimmed": budget.trimmed,
     }
-    
-    try:
-        response = requests.post(api_url, headers=headers, json=data, timeout=(10, 120))
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        return json.loads(content)
-    except Exception as e:
+    if budget.trimmed:
+        trimmed = "，".join(f"{t['section']} ({t['tokens']}→{t['kept_tokens']})" for t in budget.trimmed)
+        print(f"✂️ 材料超出 prompt 预算 {prompt_budget} tokens，已截断: {trimmed}")
+    return grade
+
+
+def failed_grade(e: Exception) -> dict:
+    """
+    LLM 调用异常对应的 0 分结果：失败标记 llm_error，熔断标记 llm_deferred + need_review，
+    回放未命中标记 llm_replay_miss + need_review
+    """
+    attempts = 0
+    if isinstance(e, ReplayMissError):
+        print(f"⚠️ 回放目录中没有本次调用的录制: {e}", file=sys.stderr)
+        grade = {
+            "total": 0,
+            "criteria": [],
+            "flags": ["llm_replay_miss", "need_review"],
+            "confidence": 0
+        }
+    elif isinstance(e, CircuitOpenError):
+        print(f"⚠️ LLM 服务连续失败，已熔断，本维度推迟评分: {e}", file=sys.stderr)
+        grade = {
+            "total": 0,
+            "criteria": [],
+            "flags": ["llm_deferred", "need_review"],
+            "confidence": 0
+        }
+        attempts = e.attempts
+    else:
         print(f"⚠️ LLM 调用失败: {e}", file=sys.stderr)
-        return {
+        grade = {
             "total": 0,
             "criteria": [],
             "flags": ["llm_error"],
             "confidence": 0
         }
+        attempts = e.attempts if isinstance(e, LLMCallError) else 0
+    grade["llm_attempts"] = attempts
+    return grade
 
 
-def format_command_results(results: list, category: str) -> str:
-    """格式化命令运行结果"""
-    filtered = [r for r in results if r.get("category") == category]
-    
-    if not filtered:
-        return "无"
-    
+def call_llm(prompt: str, client: LLMClient, model: str, cache: LLMCache = None, tags: dict = None,
+             routing: RoutingPolicy = None, rubric=None) -> dict:
+    """
+    调用 LLM API，失败时按 failed_grade 返回 0 分结果；结果中记录请求尝试次数，tags 写入调用台账。
+    提供 routing 时 model 为便宜模型，按 rubric 判断是否需要用强模型重评
+    """
+    def call(model_name):
+        result, info = client.chat_json(model_name, prompt, cache=cache, tags=tags)
+        result["llm_attempts"] = info["attempts"]
+        if info["usage"]:
+            result["llm_usage"] = info["usage"]
+        return result
+
+    try:
+        grade = call(model)
+        if routing is not None:
+            grade = routing.route(grade, rubric, call)
+    except Exception as e:
+        return failed_grade(e)
+    grade.setdefault("llm_attempts", 0)
+    return grade
+
+
+def output_key(index: int, result: dict, stream: str) -> str:
+    """命令输出在预算分配中的名称（index 为 command_results 中的下标）"""
+    return f"#{index + 1} {result.get('command', '')} {stream}"
+
+
+def format_command_results(results: list, category: str, outputs: dict = None) -> str:
+    """格式化命令运行结果；outputs 为按预算截断后的输出（键见 output_key），未提供时用原文"""
+    outputs = outputs or {}
     lines = []
-    for r in filtered:
+    for i, r in enumerate(results):
+        if r.get("category") != category:
+            continue
+        stdout = outputs.get(output_key(i, r, "stdout"), r.get("stdout"))
+        stderr = outputs.get(output_key(i, r, "stderr"), r.get("stderr"))
         lines.append(f"命令: {r['command']}")
         lines.append(f"描述: {r['description']}")
         lines.append(f"退出码: {r['exit_code']}")
         if r.get("timeout"):
             lines.append("状态: 超时")
-        lines.append(f"标准输出:\n{r['stdout'][:2000] if r['stdout'] else '(空)'}")
-        if r['stderr']:
-            lines.append(f"标准错误:\n{r['stderr'][:1000]}")
+        lines.append(f"标准输出:\n{stdout if stdout else '(空)'}")
+        if stderr:
+            lines.append(f"标准错误:\n{stderr}")
         lines.append("-" * 40)
     
-    return "\n".join(lines)
+    return "\n".join(lines) if lines else "无"
 
 
-def format_source_code(code_files: dict) -> str:
-    """格式化源代码"""
-    if not code_files:
-        return "无源代码文件"
-    
-    lines = []
-    for path, content in code_files.items():
-        lines.append(f"=== {path} ===")
-        lines.append(content[:8000])
-        lines.append("")
-    
-    return "\n".join(lines)
-
-
-def format_source_files_summary(code_files: dict) -> str:
-    """格式化源代码文件摘要（用于文档一致性检查）"""
-    if not code_files:
-        return "无源代码文件"
-    
-    lines = []
-    for path, content in code_files.items():
-        lines.append(f"### {path}")
-        
-        # 检测 LLM 相关代码
-        has_llm = any(kw in content.lower() for kw in [
-            "openai", "deepseek", "api_key", "llm", "chat", "completion",
-            "gpt", "claude", "anthropic"
-        ])
-        if has_llm:
-            lines.append("  - ✅ 包含 LLM/API 相关代码")
-        
-        # 检测文件操作
-        has_file_ops = any(kw in content for kw in [
-            "open(", "read(", "write(", "json.load", "json.dump",
-            "csv.", "pandas", "with open"
-        ])
-        if has_file_ops:
-            lines.append("  - ✅ 包含文件读写操作")
-        
-        # 提取函数名
-        import re
-        functions = re.findall(r'def\s+(\w+)\s*\(', content)
-        if functions:
-            lines.append(f"  - 函数: {', '.join(functions[:10])}")
-        
-        # 提取类名
-        classes = re.findall(r'class\s+(\w+)\s*[:\(]', content)
-        if classes:
-            lines.append(f"  - 类: {', '.join(classes[:5])}")
-    
-    return "\n".join(lines)
+def format_generated_files(files: list, packed: dict = None) -> str:
+    """生成文件列表（紧凑 JSON）；packed 为按预算截断后的文件内容，键为文件路径"""
+    packed = packed or {}
+    entries = []
+    for f in files:
+        entry = dict(f)
+        if "content" in entry:
+            entry["content"] = packed.get(entry.get("path"), entry["content"])
+        entries.append(entry)
+    return compact_json(entries)
 
 
 def format_run_summary(command_results: list) -> str:
@@ -542,63 +637,189 @@ def format_run_summary(command_results: list) -> str:
     return "\n".join(lines)
 
 
-def evaluate_documentation(run_results: dict, rubric: dict, llm_config: dict) -> dict:
-    """评估文档"""
+DOC_FILES = ("README.md", "REPORT.md", "CHANGELOG.md")
+
+
+def load_doc_templates(template_dir: str) -> dict:
+    """读取模板目录中的 README.md / REPORT.md / CHANGELOG.md，缺失的文件跳过"""
+    if not template_dir:
+        return {}
+    templates = {}
+    for name in DOC_FILES:
+        text = load_template(os.path.join(template_dir, name))
+        if text is not None:
+            templates[name] = text
+    return templates
+
+
+def prescreen_documentation(structure: dict, templates: dict, threshold: float = DEFAULT_THRESHOLD) -> dict:
+    """
+    文档模板预筛：三份文档均未提交或与模板几乎相同时 path 为 template_match
+
+    有文档没有对应模板时无法判断，视为已修改（走 LLM）
+    """
+    similarity = {}
+    unchanged = True
+    for name in DOC_FILES:
+        content = structure.get(name, {}).get("content")
+        if not structure.get(name, {}).get("exists") or not content:
+            similarity[name] = None
+            continue
+        result = screen(content, templates.get(name), threshold)
+        similarity[name] = result["similarity"] if result else None
+        if not result or result["path"] != "template_match":
+            unchanged = False
+    return {
+        "path": "template_match" if unchanged else "llm",
+        "similarity": similarity,
+        "threshold": threshold,
+    }
+
+
+def condense_documents(docs: dict, rubric: dict, llm_config: dict,
+                       chunk_threshold: int = DEFAULT_CHUNK_THRESHOLD, chunk_tokens: int = DEFAULT_CHUNK_TOKENS) -> dict:
+    """
+    超长文档先分块摘录证据（map 步骤），原地替换 docs 中的内容，返回各文档的分块统计。
+    任一块摘录失败时异常向上抛出，文档维度按 LLM 调用失败处理（与 llm_grade.py 一致），
+    不退回截断原文，避免只看到开头的评分悄悄混进结果
+    """
+    stats = {}
+    if not chunk_threshold:
+        return stats
+    client, model, cache = llm_config["client"], llm_config["model"], llm_config.get("cache")
+    tags = {**(llm_config.get("tags") or {}), "stage": "map"}
+    rubric_text = compact_json(rubric)
+    for name, content in docs.items():
+        if estimate_tokens(content) <= chunk_threshold:
+            continue
+        docs[name], stats[name] = condense_answer(
+            content, f"期末项目文档 {name}", rubric_text,
+            lambda prompt, heading: client.chat_json(model, prompt, cache=cache, tags=tags),
+            chunk_tokens,
+        )
+        print(f"🧩 {name} 约 {stats[name]['answer_tokens']} tokens，分 {stats[name]['chunks']} 节摘录证据（{stats[name]['cached']} 节复用缓存）")
+    return stats
+
+
+def evaluate_documentation(run_results: dict, rubric: dict, llm_config: dict,
+                           templates: dict = None, threshold: float = DEFAULT_THRESHOLD,
+                           prompt_budget: int = None, chunk_threshold: int = DEFAULT_CHUNK_THRESHOLD,
+                           chunk_tokens: int = DEFAULT_CHUNK_TOKENS) -> dict:
+    """评估文档；提供 templates 时先做模板预筛，未修改的文档不调用 LLM"""
     structure = run_results.get("structure_check", {})
     
-    readme = structure.get("README.md", {}).get("content", "未提交")
-    report = structure.get("REPORT.md", {}).get("content", "未提交")
-    changelog = structure.get("CHANGELOG.md", {}).get("content", "未提交")
+    prescreen = prescreen_documentation(structure, templates, threshold) if templates else None
+    if prescreen and prescreen["path"] == "template_match":
+        print(f"📄 文档未提交或与模板几乎相同 {prescreen['similarity']}，跳过 LLM 调用")
+        return {
+            "total": 0,
+            "criteria": [
+                {"id": c["id"], "score": 0, "reason": "文档未提交或与模板几乎相同"}
+                for c in rubric.get("criteria", [])
+            ],
+            "flags": ["need_review", "template_unchanged"],
+            "confidence": 0,
+            "llm_attempts": 0,
+            "prescreen": prescreen,
+        }
+    
+    docs = {name: structure.get(name, {}).get("content", "未提交") for name in DOC_FILES}
+    try:
+        chunked = condense_documents(docs, rubric, llm_config, chunk_threshold, chunk_tokens)
+    except Exception as e:
+        print("⚠️ 文档分块摘录失败", file=sys.stderr)
+        return failed_grade(e)
     
     # 获取源代码文件摘要和运行结果摘要（用于一致性检查）
-    source_files_summary = format_source_files_summary(run_results.get("source_code", {}))
+    source_files_summary = format_file_summary(get_digest(run_results))
     run_summary = format_run_summary(run_results.get("command_results", []))
     
-    prompt = DOCUMENTATION_PROMPT.replace(
-        "<<<README_CONTENT>>>", readme
-    ).replace(
-        "<<<REPORT_CONTENT>>>", report
-    ).replace(
-        "<<<CHANGELOG_CONTENT>>>", changelog
-    ).replace(
-        "<<<SOURCE_FILES>>>", source_files_summary
-    ).replace(
-        "<<<RUN_SUMMARY>>>", run_summary
-    ).replace(
-        "<<<RUBRIC>>>", json.dumps(rubric, ensure_ascii=False, indent=2)
+    # 报告和 README 优先，其次是 CHANGELOG 和运行摘要，源文件摘要最后
+    prompt_budget = prompt_budget or PROMPT_BUDGETS["documentation"]
+    rubric_json = compact_json(rubric)
+    budget = material_budget(DOCUMENTATION_PROMPT, prompt_budget, rubric=rubric_json)
+    budget.add("REPORT.md", docs["REPORT.md"], priority=0)
+    budget.add("README.md", docs["README.md"], priority=0)
+    budget.add("CHANGELOG.md", docs["CHANGELOG.md"], priority=1)
+    budget.add("运行摘要", run_summary, priority=1)
+    budget.add("源文件摘要", source_files_summary, priority=2)
+    packed = budget.pack()
+    
+    prompt = fill_prompt(
+        DOCUMENTATION_PROMPT,
+        rubric=rubric_json,
+        readme_content=packed["README.md"],
+        report_content=packed["REPORT.md"],
+        changelog_content=packed["CHANGELOG.md"],
+        source_files=packed["源文件摘要"],
+        run_summary=packed["运行摘要"],
     )
     
-    return call_llm(prompt, **llm_config)
+    grade = attach_budget_report(call_llm(prompt, **llm_config), prompt, prompt_budget, budget)
+    if chunked:
+        grade["chunked"] = chunked
+    if prescreen:
+        grade["prescreen"] = prescreen
+    return grade
 
 
-def evaluate_functionality(run_results: dict, rubric: dict, llm_config: dict) -> dict:
+def evaluate_functionality(run_results: dict, rubric: dict, llm_config: dict, prompt_budget: int = None) -> dict:
     """评估功能"""
     manifest = run_results.get("manifest", {})
     project = manifest.get("project", {})
+    command_results = run_results.get("command_results", [])
+    generated_files = run_results.get("generated_files", [])
     
-    prompt = FUNCTIONALITY_PROMPT.format(
-        project_name=project.get("name", "未知"),
-        project_description=project.get("description", ""),
-        demo_results=format_command_results(run_results.get("command_results", []), "demo"),
-        error_results=format_command_results(run_results.get("command_results", []), "error_handling"),
-        generated_files=json.dumps(run_results.get("generated_files", []), ensure_ascii=False, indent=2)
-    ).replace(
-        "<<<RUBRIC>>>", json.dumps(rubric, ensure_ascii=False, indent=2)
+    fixed = {
+        "rubric": compact_json(rubric),
+        "project_name": str(project.get("name", "未知")),
+        "project_description": str(project.get("description", "")),
+    }
+    # 命令输出优先于生成文件内容；stdout 保留首尾，stderr 保留结尾（Traceback 在最后）
+    prompt_budget = prompt_budget or PROMPT_BUDGETS["functionality"]
+    budget = material_budget(FUNCTIONALITY_PROMPT, prompt_budget, **fixed)
+    for i, r in enumerate(command_results):
+        if r.get("category") in ("demo", "error_handling"):
+            budget.add(output_key(i, r, "stdout"), r.get("stdout"), priority=0, keep="head_tail")
+            budget.add(output_key(i, r, "stderr"), r.get("stderr"), priority=0, keep="tail")
+    for f in generated_files:
+        if "content" in f:
+            budget.add(f.get("path"), f["content"], priority=1)
+    packed = budget.pack()
+    
+    prompt = fill_prompt(
+        FUNCTIONALITY_PROMPT,
+        demo_results=format_command_results(command_results, "demo", packed),
+        error_results=format_command_results(command_results, "error_handling", packed),
+        generated_files=format_generated_files(generated_files, packed),
+        **fixed,
     )
     
-    return call_llm(prompt, **llm_config)
+    return attach_budget_report(call_llm(prompt, **llm_config), prompt, prompt_budget, budget)
 
 
-def evaluate_code_quality(run_results: dict, rubric: dict, llm_config: dict) -> dict:
+def evaluate_code_quality(run_results: dict, rubric: dict, llm_config: dict, prompt_budget: int = None) -> dict:
     """评估代码质量"""
-    prompt = CODE_QUALITY_PROMPT.format(
-        source_code=format_source_code(run_results.get("source_code", {})),
-        security_issues=json.dumps(run_results.get("security_issues", []), ensure_ascii=False)
-    ).replace(
-        "<<<RUBRIC>>>", json.dumps(rubric, ensure_ascii=False, indent=2)
+    digest = get_digest(run_results)
+    fixed = {
+        "rubric": compact_json(rubric),
+        "security_issues": compact_json(run_results.get("security_issues", [])),
+    }
+    prompt_budget = prompt_budget or PROMPT_BUDGETS["code_quality"]
+    budget = material_budget(CODE_QUALITY_PROMPT, prompt_budget, **fixed)
+    # 概要优先；重点函数已按信号强度降序排列，超出预算时从末尾截断
+    budget.add("源代码概要", format_outline(digest), priority=0)
+    budget.add("重点函数", format_bodies(digest), priority=1)
+    packed = budget.pack()
+    
+    prompt = fill_prompt(
+        CODE_QUALITY_PROMPT,
+        source_outline=packed["源代码概要"],
+        source_bodies=packed["重点函数"],
+        **fixed,
     )
     
-    return call_llm(prompt, **llm_config)
+    return attach_budget_report(call_llm(prompt, **llm_config), prompt, prompt_budget, budget)
 
 
 def check_llm_in_code(source_code: dict) -> bool:
@@ -627,10 +848,13 @@ def check_llm_in_code(source_code: dict) -> bool:
     return False
 
 
-def post_process_grade(grade: dict, rubric: dict, dimension: str = None, run_results: dict = None) -> dict:
-    """后处理评分结果，确保分数在有效范围内，并应用硬性限制"""
+def post_process_grade(grade: dict, rubric, dimension: str = None, run_results: dict = None) -> dict:
+    """
+    后处理评分结果：先应用硬性限制，再把每项分数截断到 [0, max_score] 并重算总分，
+    最后检查边界带。rubric 可以是 Rubric 或量表 dict
+    """
+    rubric = compile_rubric(rubric)
     criteria = grade.get("criteria", [])
-    rubric_criteria = {c["id"]: c for c in rubric.get("criteria", [])}
     
     # 构建 criteria 的字典以便快速查找
     criteria_dict = {c.get("id"): c for c in criteria}
@@ -666,18 +890,13 @@ def post_process_grade(grade: dict, rubric: dict, dimension: str = None, run_res
                         c["score"] = 1
                         c["reason"] = c.get("reason", "") + " [因缺少 LLM 调用代码，分数被限制为 1]"
     
-    # ============ 原有的分数范围检查 ============
+    # ============ 分数范围检查 ============
     total = 0
     for c in criteria:
-        cid = c.get("id", "")
         score = int(c.get("score", 0))
-        
-        # 确保分数不超过最大值
-        if cid in rubric_criteria:
-            max_score = rubric_criteria[cid].get("max_score", score)
-            score = min(score, max_score)
-            score = max(score, 0)
-        
+        criterion = rubric.by_id.get(c.get("id", ""))
+        if criterion is not None and criterion.max_score is not None:
+            score = max(0, min(score, criterion.max_score))
         c["score"] = score
         total += score
     
@@ -685,82 +904,278 @@ def post_process_grade(grade: dict, rubric: dict, dimension: str = None, run_res
     grade["criteria"] = criteria
     
     # 检查是否需要人工复核
-    lo, hi = rubric.get("borderline_band", [None, None])
-    if lo is not None and hi is not None:
-        if lo <= total <= hi:
-            flags = set(grade.get("flags", []))
-            flags.add("need_review")
-            grade["flags"] = list(flags)
+    if rubric.is_borderline(total):
+        flags = set(grade.get("flags", []))
+        flags.add("need_review")
+        grade["flags"] = list(flags)
     
     return grade
 
 
+# 功能维度 prompt 用到的命令结果字段；duration 等每次运行都会变化的字段不进入切片
+PROMPT_COMMAND_FIELDS = ("command", "description", "category", "exit_code", "timeout", "stdout", "stderr")
+
+
+def dimension_slice(dimension: str, run_results: dict) -> dict:
+    """
+    维度读取的 run_results 切片：文档维度读文档和两份摘要，功能维度读命令结果和生成文件，
+    代码质量维度读源代码摘要（硬性限制另读源代码）和安全检查结果。切片不变时该维度的 prompt
+    和硬性限制也不变；切片只保留 prompt 用到的字段，耗时等易变字段不影响复用
+    """
+    if dimension == "documentation":
+        structure = run_results.get("structure_check", {})
+        return {
+            "docs": {name: structure.get(name) for name in DOC_FILES},
+            "source_files": format_file_summary(get_digest(run_results)),
+            "run_summary": format_run_summary(run_results.get("command_results", [])),
+        }
+    if dimension == "functionality":
+        project = (run_results.get("manifest") or {}).get("project", {})
+        return {
+            "project": {"name": project.get("name"), "description": project.get("description")},
+            "command_results": [
+                {field: r.get(field) for field in PROMPT_COMMAND_FIELDS}
+                for r in run_results.get("command_results", [])
+                if r.get("category") in ("demo", "error_handling")
+            ],
+            "generated_files": run_results.get("generated_files", []),
+        }
+    digest = get_digest(run_results)
+    return {
+        "source_code": run_results.get("source_code", {}),
+        "source_outline": format_outline(digest),
+        "source_bodies": format_bodies(digest),
+        "security_issues": run_results.get("security_issues", []),
+    }
+
+
+def prompt_settings(dimension: str, args, templates: dict) -> dict:
+    """维度 prompt 用到的参数：prompt 预算（未指定时为该维度的默认值），文档维度另有预筛和分块参数"""
+    settings = {"prompt_budget": args.prompt_budget or PROMPT_BUDGETS[dimension]}
+    if dimension == "documentation":
+        settings.update(
+            templates=templates,
+            template_threshold=args.template_threshold,
+            chunk_threshold=args.chunk_threshold,
+            chunk_tokens=args.chunk_tokens,
+        )
+    return settings
+
+
+def slice_key(dimension: str, run_results: dict, compiled_rubric, llm_config: dict, args, templates: dict) -> str:
+    """评分复用的键：维度切片 + 量表 + prompt 模板 + 模型与路由 + 该维度的 prompt 参数（见 prompt_settings）"""
+    routing = llm_config.get("routing")
+    payload = json.dumps([
+        "grade", dimension, dimension_slice(dimension, run_results), compiled_rubric.data,
+        PROMPT_TEMPLATES[dimension], llm_config["model"], vars(routing) if routing else None,
+        prompt_settings(dimension, args, templates),
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def evaluate_dimension(dimension: str, run_results: dict, compiled_rubric, llm_config: dict, args,
+                       grade_cache: LLMCache = None) -> dict:
+    """
+    评估一个维度并应用硬性分数限制；llm_config 中的 tags 和 rubric 须为该维度的。
+    提供 grade_cache 时该维度的输入切片未变化则直接复用上次的评分（见 dimension_slice），
+    LLM 调用失败、熔断或回放未命中的评分不缓存
+    """
+    rubric = compiled_rubric.data
+    templates = load_doc_templates(args.template_dir) if dimension == "documentation" else {}
+    key = None
+    if grade_cache is not None:
+        key = slice_key(dimension, run_results, compiled_rubric, llm_config, args, templates)
+        cached = grade_cache.get(key)
+        if cached is not None:
+            print(f"♻️ {dimension} 的输入未变化，复用上次的评分")
+            cached["input_slice"] = {"hash": key, "reused": True}
+            return cached
+    
+    if dimension == "documentation":
+        grade = evaluate_documentation(
+            run_results, rubric, llm_config, templates, args.template_threshold, args.prompt_budget,
+            args.chunk_threshold, args.chunk_tokens,
+        )
+    elif dimension == "functionality":
+        grade = evaluate_functionality(run_results, rubric, llm_config, args.prompt_budget)
+    else:
+        grade = evaluate_code_quality(run_results, rubric, llm_config, args.prompt_budget)
+    
+    # 后处理（应用硬性分数限制）
+    grade = post_process_grade(grade, compiled_rubric, dimension=dimension, run_results=run_results)
+    if key is not None:
+        grade["input_slice"] = {"hash": key, "reused": False}
+        if not set(grade.get("flags", [])) & UNCACHEABLE_FLAGS:
+            grade_cache.put(key, f"grade:{dimension}", grade)
+    return grade
+
+
+def grade_summary_lines(dimension: str, grade: dict, rubric: dict, extra_lines: list = None) -> list:
+    """一个维度的 Markdown 摘要；extra_lines 插在标记之后（缓存、回放统计）"""
+    lines = [
+        f"# {dimension} 评分",
+        f"- **总分**: {grade.get('total', 0)} / {rubric.get('max_score', 0)}",
+        f"- **置信度**: {grade.get('confidence', 0):.2f}",
+        f"- **标记**: {', '.join(grade.get('flags', [])) or '无'}",
+    ]
+    lines += extra_lines or []
+    if grade.get("input_slice", {}).get("reused"):
+        lines.append("- **复用评分**: 本维度的输入未变化，沿用上次的评分")
+    routing = grade.get("routing")
+    if routing and routing.get("escalated"):
+        primary = routing.get("primary")
+        detail = f"{primary['model']} {primary.get('total', 0)} 分 → {routing['model']}" if primary else f"{routing['strong_model']} 调用失败"
+        lines.append(f"- **模型升级**: {detail}（{', '.join(routing['reasons'])}）")
+    for name, stats in grade.get("chunked", {}).items():
+        lines.append(f"- **分块评分**: {name} 约 {stats['answer_tokens']} tokens，分 {stats['chunks']} 节摘录证据（{stats['cached']} 节复用缓存）")
+    trimmed = grade.get("prompt_budget", {}).get("trimmed")
+    if trimmed:
+        lines.append(f"- **材料截断**: {', '.join(t['section'] for t in trimmed)}（prompt 预算 {grade['prompt_budget']['budget']} tokens）")
+    usage = grade.get("llm_usage")
+    if usage:
+        lines.append(
+            f"- **Token**: 输入 {usage['prompt_tokens']}（上下文缓存命中 {usage['cache_hit_tokens']}），"
+            f"输出 {usage['completion_tokens']}"
+        )
+    lines += ["", "## 分项评分"]
+    for c in grade.get("criteria", []):
+        lines.append(f"- **{c.get('id', '')}**: {c.get('score', 0)} 分")
+        if c.get("reason"):
+            lines.append(f"  - {c.get('reason', '')}")
+    return lines
+
+
 def main():
     parser = argparse.ArgumentParser(description="期末项目 LLM 评估")
     parser.add_argument("--run-results", required=True, help="run_project.py 的输出 JSON")
-    parser.add_argument("--rubric", required=True, help="Rubric JSON 文件")
+    parser.add_argument("--rubric", help="Rubric JSON 文件（单个维度）")
     parser.add_argument("--dimension", required=True, 
-                       choices=["documentation", "functionality", "code_quality"],
-                       help="评估维度")
-    parser.add_argument("--out", default="grade.json", help="输出 JSON 文件")
+                       choices=[*DIMENSION_OUTPUTS, "all"],
+                       help="评估维度；all 表示三个维度并发评估")
+    parser.add_argument("--out", default="grade.json", help="输出 JSON 文件（单个维度）")
+    parser.add_argument("--rubric-dir", help="--dimension all 时的量表目录，含 rubric_<维度>.json")
+    parser.add_argument("--out-dir", default=".", help="--dimension all 时的输出目录（doc_grade.json / func_grade.json / code_grade.json）")
     parser.add_argument("--summary", help="输出摘要 Markdown 文件")
     parser.add_argument("--model", default=os.getenv("LLM_MODEL", "deepseek-chat"))
     parser.add_argument("--api-url", default=os.getenv("LLM_API_URL", "https://api.deepseek.com/chat/completions"))
     parser.add_argument("--api-key", default=os.getenv("LLM_API_KEY", ""))
+    parser.add_argument("--template-dir", help="作业模板目录（README.md/REPORT.md/CHANGELOG.md），用于文档预筛")
+    parser.add_argument("--template-threshold", type=float, default=DEFAULT_THRESHOLD, help="与模板的 shingle Jaccard 相似度不低于该值视为未修改")
+    parser.add_argument("--max-attempts", type=int, default=4, help="每次 LLM 调用的最大请求次数（429/5xx/超时会重试）")
+    parser.add_argument("--deadline", type=float, default=240, help="每次 LLM 调用的总时长预算（秒，含重试）")
+    parser.add_argument("--cache-path", default=None, help="LLM 响应缓存（默认 $LLM_CACHE_PATH 或 ~/.cache/autograde/llm_cache.sqlite3）")
+    parser.add_argument("--no-cache", action="store_true", help="不读写 LLM 响应缓存")
+    parser.add_argument("--refresh", action="store_true", help="忽略已缓存的响应并重新评分")
+    parser.add_argument("--hedge-after", type=float, default=DEFAULT_HEDGE_AFTER, help="观测到足够耗时样本前，请求超过该秒数即发出对冲请求（之后用 p90），0 表示不对冲")
+    parser.add_argument("--breaker-threshold", type=float, default=0.5, help="请求失败率达到该值时熔断并推迟剩余调用，0 表示不熔断")
+    parser.add_argument("--student-id", default=os.getenv("STUDENT_ID"), help="写入 LLM 调用台账的学生 ID（默认 $STUDENT_ID）")
+    parser.add_argument("--ledger", default=None, help="LLM 调用台账 JSONL（默认 $LLM_LEDGER_PATH 或 .autograde/llm_ledger.jsonl）")
+    parser.add_argument("--no-ledger", action="store_true", help="不记录 LLM 调用台账")
+    parser.add_argument("--config", default=os.getenv("LLM_ROUTING_CONFIG"), help="路由配置（tests/llm/routing.yaml，或含 grading.llm_routing 的作业 config.yaml），启用便宜模型优先的分级路由（默认 $LLM_ROUTING_CONFIG）")
+    parser.add_argument("--prompt-budget", type=int, default=0, help="prompt 总 token 预算（估计值），超出时按优先级截断学生材料；0 表示使用各维度默认值")
+    parser.add_argument("--chunk-threshold", type=int, default=DEFAULT_CHUNK_THRESHOLD, help="文档估计超过该 token 数时分块摘录证据后评分，0 表示不分块")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_CHUNK_TOKENS, help="长文档每块的估计 token 上限")
+    parser.add_argument("--llm-record", metavar="DIR", help="把每次 LLM 请求和响应按 prompt 哈希录制到 DIR")
+    parser.add_argument("--llm-replay", metavar="DIR", help="只从 DIR 回放 LLM 响应（不联网、不读写响应缓存），报告未命中的调用")
     args = parser.parse_args()
     
-    if not args.api_key:
+    if args.dimension == "all" and not args.rubric_dir:
+        parser.error("--dimension all 需要 --rubric-dir")
+    if args.dimension != "all" and not args.rubric:
+        parser.error("单个维度需要 --rubric")
+    if args.llm_record and args.llm_replay:
+        parser.error("--llm-record 和 --llm-replay 不能同时使用")
+    replay = None
+    if args.llm_replay:
+        replay = LLMReplay(args.llm_replay, "replay")
+    elif args.llm_record:
+        replay = LLMReplay(args.llm_record, "record")
+    
+    if not args.api_key and not args.llm_replay:
         print("⚠️ LLM_API_KEY 未设置，评分可能失败", file=sys.stderr)
     
-    # 加载数据
+    # 加载数据（all 模式下三个维度共用）
     with open(args.run_results, "r", encoding="utf-8") as f:
         run_results = json.load(f)
+    # 源代码摘要通常已由 run_project.py 写入；旧版 run_results 在这里生成一次，各维度共用
+    get_digest(run_results)
     
-    with open(args.rubric, "r", encoding="utf-8") as f:
-        rubric = json.load(f)
+    if args.dimension == "all":
+        dimensions = list(DIMENSION_OUTPUTS)
+        rubric_paths = {d: os.path.join(args.rubric_dir, f"rubric_{d}.json") for d in dimensions}
+        out_paths = {d: os.path.join(args.out_dir, name) for d, name in DIMENSION_OUTPUTS.items()}
+        os.makedirs(args.out_dir, exist_ok=True)
+    else:
+        dimensions = [args.dimension]
+        rubric_paths = {args.dimension: args.rubric}
+        out_paths = {args.dimension: args.out}
+    compiled_rubrics = {d: load_rubric(rubric_paths[d]) for d in dimensions}
     
-    llm_config = {
-        "api_url": args.api_url,
-        "api_key": args.api_key,
-        "model": args.model
-    }
+    cache = None if args.no_cache or args.llm_replay else LLMCache(args.cache_path, refresh=args.refresh)
+    # 评分复用与响应缓存存放在同一个文件中，命中计数分开统计
+    grade_cache = None if cache is None else LLMCache(args.cache_path, refresh=args.refresh)
+    client = LLMClient(
+        args.api_url, args.api_key,
+        max_attempts=args.max_attempts, deadline=args.deadline, timeout=(10, 120),
+        ledger=None if args.no_ledger else LLMLedger(args.ledger, {"assignment": os.getenv("ASSIGNMENT_ID")}),
+        hedge_after=args.hedge_after, breaker=CircuitBreaker(args.breaker_threshold), replay=replay,
+    )
+    routing = load_routing(args.config, args.model)
+    model = args.model
+    if routing is not None:
+        model = routing.cheap_model
+        print(f"🔀 模型路由: 先用 {model}，不确定时升级到 {routing.strong_model}")
     
-    # 执行评估
-    print(f"🔍 评估 {args.dimension}...")
+    # 各维度共享客户端、缓存和路由，tags 和量表各自独立
+    llm_configs = {
+        d: {
+            "client": client,
+            "model": model,
+            "cache": cache,
+            "tags": {"dimension": d, "student_id": args.student_id},
+            "routing": routing,
+            "rubric": compiled_rubrics[d],
+        }
+        for d in dimensions
+    }
     
-    if args.dimension == "documentation":
-        grade = evaluate_documentation(run_results, rubric, llm_config)
-    elif args.dimension == "functionality":
-        grade = evaluate_functionality(run_results, rubric, llm_config)
+    # 执行评估：多个维度时并发调用，总耗时约为最慢的一次调用
+    print(f"🔍 评估 {', '.join(dimensions)}...")
+    if len(dimensions) == 1:
+        grades = {args.dimension: evaluate_dimension(args.dimension, run_results, compiled_rubrics[args.dimension], llm_configs[args.dimension], args, grade_cache)}
     else:
-        grade = evaluate_code_quality(run_results, rubric, llm_config)
-    
-    # 后处理（应用硬性分数限制）
-    grade = post_process_grade(grade, rubric, dimension=args.dimension, run_results=run_results)
+        with ThreadPoolExecutor(max_workers=len(dimensions)) as pool:
+            futures = {
+                d: pool.submit(evaluate_dimension, d, run_results, compiled_rubrics[d], llm_configs[d], args, grade_cache)
+                for d in dimensions
+            }
+            grades = {d: future.result() for d, future in futures.items()}
     
     # 保存结果
-    with open(args.out, "w", encoding="utf-8") as f:
-        json.dump(grade, f, ensure_ascii=False, indent=2)
+    for d in dimensions:
+        with open(out_paths[d], "w", encoding="utf-8") as f:
+            json.dump(grades[d], f, ensure_ascii=False, indent=2)
+        print(f"✅ {d} 评分完成: {grades[d].get('total', 0)}/{compiled_rubrics[d].data.get('max_score', 0)} → {out_paths[d]}")
     
-    print(f"✅ 评分完成: {grade.get('total', 0)}/{rubric.get('max_score', 0)}")
+    usage = client.usage_summary()
+    if usage:
+        print(f"📊 LLM 用量: {usage}")
+    if replay is not None:
+        replay.report()
     
     # 生成摘要
     if args.summary:
-        lines = [
-            f"# {args.dimension} 评分",
-            f"- **总分**: {grade.get('total', 0)} / {rubric.get('max_score', 0)}",
-            f"- **置信度**: {grade.get('confidence', 0):.2f}",
-            f"- **标记**: {', '.join(grade.get('flags', [])) or '无'}",
-            "",
-            "## 分项评分",
+        extra_lines = []
+        if cache is not None:
+            extra_lines.append(f"- **LLM 缓存**: 命中 {cache.hits}，未命中 {cache.misses}")
+        if replay is not None and replay.replaying:
+            extra_lines.append(f"- **LLM 回放**: 命中 {replay.hits}，未命中 {len(replay.misses)}")
+        sections = [
+            "\n".join(grade_summary_lines(d, grades[d], compiled_rubrics[d].data, extra_lines if i == 0 else None))
+            for i, d in enumerate(dimensions)
         ]
-        for c in grade.get("criteria", []):
-            lines.append(f"- **{c.get('id', '')}**: {c.get('score', 0)} 分")
-            if c.get("reason"):
-                lines.append(f"  - {c.get('reason', '')}")
-        
         with open(args.summary, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+            f.write("\n\n".join(sections))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+LLM 调用的录制 / 回放（用于可复现的基准测试和 prompt 修改的回归测试）
+
+录制（--llm-record DIR）：每次调用照常进行（本地缓存命中也算），请求和解析后的响应
+写入 DIR/<key>.json，key 与 LLMCache 相同，为 (model, temperature, prompt) 的 SHA-256。
+回放（--llm-replay DIR）：只从 DIR 读取响应，不发出任何网络请求，也不读写响应缓存；
+找不到录制的调用抛出 ReplayMissError，评分结果标记 llm_replay_miss + need_review，
+结束时打印未命中的调用。
+
+录制文件是普通 JSON，可以提交到仓库或在多次运行之间复用：
+    python llm_grade.py --manifest jobs.jsonl --llm-record tapes/
+    python llm_grade.py --manifest jobs.jsonl --llm-replay tapes/
+"""
+
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+from llm_cache import LLMCache
+
+
+class LLMReplay:
+    """
+    录制 / 回放目录，可被多个评分线程共享
+
+    mode 为 "record" 或 "replay"
+    """
+
+    def __init__(self, path, mode):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"unknown replay mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.recorded = 0
+        self.misses = []
+        self._lock = threading.Lock()
+        if mode == "record":
+            os.makedirs(path, exist_ok=True)
+        elif not os.path.isdir(path):
+            print(f"Warning: LLM replay directory {path} does not exist, every call will miss", file=sys.stderr)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    make_key = staticmethod(LLMCache.make_key)
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(self, key, tags=None):
+        """回放：返回录制的 (response, usage)，未命中返回 None 并记入 misses"""
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            response = entry["response"]
+        except (OSError, ValueError, KeyError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Warning: unreadable LLM recording {self._file(key)}: {e}", file=sys.stderr)
+            with self._lock:
+                self.misses.append({"key": key, **{k: v for k, v in (tags or {}).items() if v is not None}})
+            return None
+        with self._lock:
+            self.hits += 1
+        return response, entry.get("usage")
+
+    def put(self, key, request, response, usage=None, tags=None):
+        """录制：写入一次调用（先写临时文件再替换，并发写同一个 key 时不会留下半个文件）"""
+        entry = {
+            "key": key,
+            "recorded_at": datetime.now().isoformat(timespec="seconds"),
+            "tags": {k: v for k, v in (tags or {}).items() if v is not None},
+            "request": request,
+            "response": response,
+            "usage": usage,
+        }
+        path = self._file(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: failed to record LLM call to {path}: {e}", file=sys.stderr)
+            return
+        with self._lock:
+            self.recorded += 1
+
+    def summary(self):
+        """一行文字描述"""
+        if self.replaying:
+            return f"{self.hits} replayed, {len(self.misses)} misses ({self.path})"
+        return f"{self.recorded} calls recorded to {self.path}"
+
+    def report(self):
+        """打印统计和未命中的调用，返回未命中数"""
+        print(f"LLM replay: {self.summary()}")
+        for miss in self.misses:
+            detail = ", ".join(f"{k}={v}" for k, v in miss.items() if k != "key")
+            print(f"  miss {miss['key'][:16]}" + (f" ({detail})" if detail else ""), file=sys.stderr)
+        return len(self.misses)
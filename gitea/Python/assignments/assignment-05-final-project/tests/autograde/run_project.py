@@ -2,18 +2,35 @@
 """
 期末项目自动运行器
 根据 manifest.yaml 运行学生项目，捕获所有输出供 LLM 评估
+
+命令的并行执行（--jobs > 1）：
+- demo 命令默认 stateful（会改变项目状态），按 manifest 顺序在项目目录中依次运行
+- error_handling 命令和标了 stateful: false 的 demo 命令不改变状态，各自在项目目录的
+  copy-on-write 克隆中并发运行；克隆取自它前面最近一个 stateful 命令结束时的状态，
+  看到的项目状态与依次运行时相同
+- after: <id 或 id 列表> 指定命令依赖的命令（引用其他命令的 id 字段，只能引用前面的命令）；
+  无状态命令给出 after 时只等待这些命令，克隆取自其中最后一个 stateful 命令结束时的状态
+  （after: [] 表示直接在初始状态上运行）
+- 克隆中生成的文件不会被收集，需要评分的输出文件应由 stateful 命令生成
+command_results 始终按 manifest 顺序排列。--jobs 1 时全部命令在项目目录中依次运行
 """
 
 import yaml
+import shutil
 import subprocess
 import os
 import json
 import sys
 import argparse
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from datetime import datetime
 from dotenv import load_dotenv, find_dotenv
 
+from dep_cache import DEFAULT_MAX_VENVS, DEFAULT_TIMEOUT, DependencyCache, default_cache_dir, venv_bin
+from source_digest import build_digest
+
 # 预先加载 .env 并兼容旧变量名
 dotenv_path = find_dotenv()
 if dotenv_path:
@@ -27,19 +44,70 @@ if not os.getenv("DEEPSEEK_API_KEY"):
         os.environ["DEEPSEEK_API_KEY"] = llm_key
 
 
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，克隆时普通复制
+    fcntl = None
+
+# Linux 的 FICLONE ioctl：在 btrfs / xfs 等文件系统上做 copy-on-write 克隆
+FICLONE = 0x40049409
+
+# 克隆工作区时跳过的目录，以及改为符号链接共享的目录（体积大且运行时只读）
+CLONE_SKIP_DIRS = {".git", "__pycache__"}
+CLONE_LINK_DIRS = {"venv", ".venv", "node_modules"}
+
+
+def _clone_file(src, dst):
+    """尽量用 copy-on-write 克隆文件，文件系统不支持时普通复制"""
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except OSError:
+            pass
+    return shutil.copy2(src, dst)
+
+
+def clone_workspace(src: Path, dst: Path):
+    """把项目目录克隆到 dst（copy-on-write 或复制），虚拟环境等大目录用符号链接共享"""
+    def ignore(directory, names):
+        skipped = CLONE_SKIP_DIRS | (CLONE_LINK_DIRS if Path(directory) == src else set())
+        return [name for name in names if name in skipped]
+    
+    shutil.copytree(src, dst, symlinks=True, ignore=ignore, copy_function=_clone_file)
+    for name in CLONE_LINK_DIRS:
+        if (src / name).is_dir():
+            os.symlink(src / name, dst / name, target_is_directory=True)
+
+
+# 每个文档内容的长度上限；超长文档由 llm_evaluate.py 分块摘录证据后评分，不在这里截断结尾。
+# 上限之内仍有界的部分：200000 字符最多约 200000 tokens（全为汉字时），按默认 --chunk-tokens 2000
+# 约 100 次 map 调用（4 路并发，按块内容缓存）；文档维度的评分调用只看证据汇总，仍受
+# PROMPT_BUDGETS["documentation"] 限制，超出时按预算截断；run_results.json 每个文档最多增加约 600KB
+DOC_MAX_CHARS = 200000
+
+
 class ProjectRunner:
     """项目运行器"""
     
-    def __init__(self, project_dir: str, timeout: int = 60):
+    def __init__(self, project_dir: str, timeout: int = 60, jobs: int = 4, dep_cache: DependencyCache = None):
         """
         初始化运行器
         
         Args:
             project_dir: 项目目录
             timeout: 命令超时时间（秒）
+            jobs: 同时运行的命令数，1 表示依次运行
+            dep_cache: 依赖缓存，为 None 时把依赖直接装进当前 Python；缓存与直接安装共用
+                       dep_cache.timeout（默认 DEFAULT_TIMEOUT）秒的总期限
         """
         self.project_dir = Path(project_dir).resolve()
         self.timeout = timeout
+        self.jobs = max(1, jobs)
+        self.dep_cache = dep_cache
+        self.venv = None
         self.results = {
             "project_dir": str(self.project_dir),
             "timestamp": datetime.now().isoformat(),
@@ -49,6 +117,8 @@ class ProjectRunner:
             "generated_files": [],
             "security_issues": [],
             "source_code": {},
+            "source_digest": None,
+            "environment": None,
             "errors": []
         }
     
@@ -98,7 +168,7 @@ class ProjectRunner:
             if path.exists() and f.endswith(".md"):
                 try:
                     content = path.read_text(encoding="utf-8")
-                    structure[f]["content"] = content[:15000]  # 限制长度
+                    structure[f]["content"] = content[:DOC_MAX_CHARS]  # 限制长度
                 except Exception as e:
                     structure[f]["content"] = f"读取失败: {e}"
         
@@ -119,15 +189,35 @@ class ProjectRunner:
         req_path = self.project_dir / "requirements.txt"
         if req_path.exists():
             print("📦 安装项目依赖...")
-            try:
-                subprocess.run(
-                    [sys.executable, "-m", "pip", "install", "-r", str(req_path), "-q"],
-                    cwd=self.project_dir,
-                    timeout=120,
-                    capture_output=True
+            environment = {"cache_hit": False, "venv": None, "install_seconds": 0.0}
+            if self.dep_cache is not None:
+                environment = self.dep_cache.ensure(req_path)
+                if environment["venv"]:
+                    self.venv = Path(environment["venv"])
+                    state = "命中缓存" if environment["cache_hit"] else "已安装并缓存"
+                    print(f"   {state}: {self.venv} ({environment['install_seconds']:.1f}s)")
+                else:
+                    print(f"   ⚠️ 缓存环境不可用，直接安装到当前 Python: {environment['error']}")
+            # 缓存环境不可用时直接安装，只使用总期限中剩余的时间
+            install_timeout = self.dep_cache.timeout if self.dep_cache is not None else DEFAULT_TIMEOUT
+            remaining = install_timeout - environment["install_seconds"]
+            if self.venv is None and remaining <= 0:
+                self.results["errors"].append(f"依赖安装失败: 超过 {install_timeout}s")
+            elif self.venv is None:
+                start_time = datetime.now()
+                try:
+                    subprocess.run(
+                        [sys.executable, "-m", "pip", "install", "-r", str(req_path), "-q"],
+                        cwd=self.project_dir,
+                        timeout=remaining,
+                        capture_output=True
+                    )
+                except Exception as e:
+                    self.results["errors"].append(f"依赖安装失败: {e}")
+                environment["install_seconds"] = round(
+                    environment["install_seconds"] + (datetime.now() - start_time).total_seconds(), 2
                 )
-            except Exception as e:
-                self.results["errors"].append(f"依赖安装失败: {e}")
+            self.results["environment"] = environment
         
         # 检查环境变量
         env_vars = manifest.get("env_vars", [])
@@ -139,7 +229,7 @@ class ProjectRunner:
         if missing_vars:
             self.results["errors"].append(f"缺少环境变量: {', '.join(missing_vars)}")
     
-    def run_command(self, cmd: str, description: str, category: str) -> dict:
+    def run_command(self, cmd: str, description: str, category: str, cwd: Path = None) -> dict:
         """
         运行单个命令
         
@@ -147,10 +237,13 @@ class ProjectRunner:
             cmd: 命令字符串
             description: 命令描述
             category: 命令类别（demo/error_handling）
+            cwd: 运行目录，默认为项目目录；在克隆的工作区中运行时，输出中的工作区路径
+                 替换为项目目录，与在项目目录中运行时一致
         
         Returns:
             运行结果
         """
+        cwd = cwd or self.project_dir
         result = {
             "command": cmd,
             "description": description,
@@ -162,67 +255,180 @@ class ProjectRunner:
             "duration": 0
         }
         
-        print(f"  ▶ {description}: {cmd}")
+        # 并发运行时各命令的输出不交错：结束后一次性打印
+        log = [f"  ▶ {description}: {cmd}"]
         
         start_time = datetime.now()
+        env = {**os.environ, "PYTHONIOENCODING": "utf-8", "PYTHONPATH": str(cwd)}
+        if self.venv is not None:
+            # 在缓存的虚拟环境中运行：命令里的 python / streamlit 等解析到环境的 bin 目录
+            # 不写 .pyc：环境是共用的只读缓存，内容改变会被当作篡改而重建（见 dep_cache）
+            env["VIRTUAL_ENV"] = str(self.venv)
+            env["PYTHONDONTWRITEBYTECODE"] = "1"
+            env["PATH"] = str(venv_bin(self.venv)) + os.pathsep + env.get("PATH", "")
         try:
             proc = subprocess.run(
                 cmd,
                 shell=True,
-                cwd=self.project_dir,
+                cwd=cwd,
                 capture_output=True,
                 text=True,
                 timeout=self.timeout,
-                env={**os.environ, "PYTHONIOENCODING": "utf-8", "PYTHONPATH": str(self.project_dir)}
+                env=env
             )
-            result["stdout"] = proc.stdout[:10000]  # 限制长度
-            result["stderr"] = proc.stderr[:5000]
+            stdout, stderr = proc.stdout, proc.stderr
+            if cwd != self.project_dir:
+                stdout = stdout.replace(str(cwd), str(self.project_dir))
+                stderr = stderr.replace(str(cwd), str(self.project_dir))
+            result["stdout"] = stdout[:10000]  # 限制长度
+            result["stderr"] = stderr[:5000]
             result["exit_code"] = proc.returncode
         except subprocess.TimeoutExpired:
             result["timeout"] = True
             result["stderr"] = f"命令超时 ({self.timeout}s)"
-            print(f"    ⏱️ 超时")
+            log.append(f"    ⏱️ 超时")
         except Exception as e:
             result["stderr"] = str(e)
             result["exit_code"] = -1
-            print(f"    ❌ 错误: {e}")
+            log.append(f"    ❌ 错误: {e}")
         
         result["duration"] = (datetime.now() - start_time).total_seconds()
         
         if result["exit_code"] == 0:
-            print(f"    ✅ 成功 ({result['duration']:.1f}s)")
+            log.append(f"    ✅ 成功 ({result['duration']:.1f}s)")
         elif not result["timeout"]:
-            print(f"    ⚠️ 退出码: {result['exit_code']}")
+            log.append(f"    ⚠️ 退出码: {result['exit_code']}")
+        print("\n".join(log), flush=True)
         
         return result
     
-    def run_all_commands(self, manifest: dict):
-        """运行所有 manifest 中定义的命令"""
-        commands = manifest.get("commands", {})
+    def plan_commands(self, manifest: dict) -> list:
+        """
+        按 manifest 顺序列出 demo 和 error_handling 命令，解析 stateful / after 提示
         
-        # 运行 demo 命令
-        demo_commands = commands.get("demo", [])
-        if demo_commands:
-            print("\n📺 运行功能演示命令...")
-            for cmd_info in demo_commands:
-                result = self.run_command(
-                    cmd_info.get("command", ""),
-                    cmd_info.get("description", ""),
-                    "demo"
-                )
-                self.results["command_results"].append(result)
-        
-        # 运行 error_handling 命令
-        error_commands = commands.get("error_handling", [])
-        if error_commands:
-            print("\n🛡️ 运行错误处理测试...")
-            for cmd_info in error_commands:
-                result = self.run_command(
-                    cmd_info.get("command", ""),
-                    cmd_info.get("description", ""),
-                    "error_handling"
-                )
-                self.results["command_results"].append(result)
+        Returns:
+            [{"command", "description", "category", "stateful", "after", "snapshot"}]，
+            after 为依赖命令的下标，snapshot 为无状态命令克隆时所取状态对应的 stateful 命令下标
+            （None 表示初始状态）
+        """
+        commands = manifest.get("commands", {})
+        plan, ids = [], {}
+        for category, stateful_default in (("demo", True), ("error_handling", False)):
+            for cmd_info in commands.get(category, []) or []:
+                spec = {
+                    "command": cmd_info.get("command", ""),
+                    "description": cmd_info.get("description", ""),
+                    "category": category,
+                    "stateful": bool(cmd_info.get("stateful", stateful_default)),
+                    "after": None,
+                }
+                after = cmd_info.get("after")
+                if after is not None:
+                    refs = [after] if isinstance(after, str) else after
+                    missing = [str(ref) for ref in refs if str(ref) not in ids]
+                    if missing:
+                        # 引用有误时忽略 after，按默认方式（前面最近的 stateful 命令之后）运行
+                        self.results["errors"].append(
+                            f"命令 {spec['description'] or spec['command']} 的 after 引用了前面不存在的 id: "
+                            + ", ".join(missing)
+                        )
+                    else:
+                        spec["after"] = [ids[str(ref)] for ref in refs]
+                if cmd_info.get("id"):
+                    ids[str(cmd_info["id"])] = len(plan)
+                plan.append(spec)
+        
+        last_stateful = None
+        for i, spec in enumerate(plan):
+            if spec["stateful"]:
+                spec["snapshot"] = None
+                last_stateful = i
+            elif spec["after"] is None:
+                spec["snapshot"] = last_stateful
+            else:
+                stateful_deps = [j for j in spec["after"] if plan[j]["stateful"]]
+                spec["snapshot"] = max(stateful_deps) if stateful_deps else None
+            spec["after"] = spec["after"] or []
+        return plan
+    
+    def run_all_commands(self, manifest: dict):
+        """运行所有 manifest 中定义的命令，结果按 manifest 顺序写入 command_results"""
+        plan = self.plan_commands(manifest)
+        if not plan:
+            return
+        start_time = datetime.now()
+        if self.jobs == 1 or not any(not spec["stateful"] for spec in plan):
+            print("\n📺 依次运行 manifest 命令...")
+            results = [self.run_command(s["command"], s["description"], s["category"]) for s in plan]
+        else:
+            print(f"\n📺 运行 manifest 命令（最多 {self.jobs} 个同时运行，无状态命令在克隆的工作区中运行）...")
+            results = self.run_commands_parallel(plan)
+        self.results["command_results"].extend(results)
+        print(f"   命令总耗时 {(datetime.now() - start_time).total_seconds():.1f}s")
+    
+    def run_commands_parallel(self, plan: list) -> list:
+        """
+        按依赖关系并发运行命令：stateful 命令依次在项目目录中运行，每个 stateful 命令结束后
+        （以及开始前）为需要该状态的无状态命令保存一份快照，无状态命令在快照的克隆中运行
+        """
+        workdir = Path(tempfile.mkdtemp(prefix="autograde-ws-"))
+        needed = {spec["snapshot"] for spec in plan if not spec["stateful"]}
+        snapshots = {}
+        
+        def take_snapshot(point):
+            if point in needed:
+                snapshots[point] = workdir / f"snapshot-{'initial' if point is None else point}"
+                clone_workspace(self.project_dir, snapshots[point])
+        
+        def run(i):
+            spec = plan[i]
+            if spec["stateful"]:
+                result = self.run_command(spec["command"], spec["description"], spec["category"])
+                take_snapshot(i)
+                return result
+            workspace = workdir / f"cmd-{i}"
+            try:
+                clone_workspace(snapshots[spec["snapshot"]], workspace)
+                return self.run_command(spec["command"], spec["description"], spec["category"], cwd=workspace)
+            finally:
+                shutil.rmtree(workspace, ignore_errors=True)
+        
+        def ready(i, done):
+            spec = plan[i]
+            if not all(j in done for j in spec["after"]):
+                return False
+            if spec["stateful"]:
+                return all(j in done for j in range(i) if plan[j]["stateful"])
+            return spec["snapshot"] is None or spec["snapshot"] in done
+        
+        results = [None] * len(plan)
+        try:
+            take_snapshot(None)
+            done, pending, running = set(), list(range(len(plan))), {}
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                while pending or running:
+                    for i in [i for i in pending if ready(i, done)]:
+                        if len(running) >= self.jobs:
+                            break
+                        pending.remove(i)
+                        running[pool.submit(run, i)] = i
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        i = running.pop(future)
+                        done.add(i)
+                        try:
+                            results[i] = future.result()
+                        except Exception as e:
+                            spec = plan[i]
+                            print(f"  ❌ {spec['description']}: 无法准备工作区: {e}")
+                            results[i] = {
+                                "command": spec["command"], "description": spec["description"],
+                                "category": spec["category"], "stdout": "", "stderr": f"无法准备工作区: {e}",
+                                "exit_code": -1, "timeout": False, "duration": 0,
+                            }
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return results
     
     def collect_generated_files(self):
         """收集生成的文件"""
@@ -303,6 +509,8 @@ class ProjectRunner:
                     pass
         
         self.results["source_code"] = code_files
+        # AST 摘要只生成一次，llm_evaluate.py 的各维度直接复用
+        self.results["source_digest"] = build_digest(code_files)
     
     def run(self) -> dict:
         """执行完整的运行流程"""
@@ -327,8 +535,12 @@ class ProjectRunner:
         # 3. 设置环境
         self.setup_environment(manifest)
         
-        # 4. 运行命令
-        self.run_all_commands(manifest)
+        # 4. 运行命令；命令结束前一直持有缓存环境的共享锁，其他评测进程不会把它淘汰
+        try:
+            self.run_all_commands(manifest)
+        finally:
+            if self.dep_cache is not None:
+                self.dep_cache.release()
         
         # 5. 收集生成文件
         print("\n📦 收集生成文件...")
@@ -346,7 +558,7 @@ class ProjectRunner:
         # 7. 读取源代码
         print("\n📝 读取源代码...")
         self.read_source_code()
-        print(f"   读取了 {len(self.results['source_code'])} 个文件")
+        print(f"   读取了 {len(self.results['source_code'])} 个文件，选出 {len(self.results['source_digest']['bodies'])} 个重点函数")
         
         print("\n" + "=" * 50)
         print("✅ 项目运行完成")
@@ -359,9 +571,17 @@ def main():
     parser.add_argument("project_dir", help="学生项目目录")
     parser.add_argument("--out", default="run_results.json", help="输出 JSON 文件")
     parser.add_argument("--timeout", type=int, default=60, help="命令超时时间（秒）")
+    parser.add_argument("--jobs", type=int, default=4, help="同时运行的命令数（无状态命令在克隆的工作区中并发运行），1 表示依次运行")
+    parser.add_argument("--dep-cache", default=default_cache_dir(),
+                        help="依赖缓存目录，应为持久目录（默认 $AUTOGRADE_DEP_CACHE）；未设置时不使用缓存，直接安装依赖")
+    parser.add_argument("--dep-cache-venvs", type=int, default=DEFAULT_MAX_VENVS, help="缓存中最多保留的虚拟环境数")
+    parser.add_argument("--no-dep-cache", action="store_true", help="不使用依赖缓存，把依赖直接装进当前 Python")
     args = parser.parse_args()
     
-    runner = ProjectRunner(args.project_dir, args.timeout)
+    dep_cache = None
+    if args.dep_cache and not args.no_dep_cache:
+        dep_cache = DependencyCache(args.dep_cache, max_venvs=args.dep_cache_venvs)
+    runner = ProjectRunner(args.project_dir, args.timeout, args.jobs, dep_cache)
     results = runner.run()
     
     with open(args.out, "w", encoding="utf-8") as f:
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+学生源代码的 AST 摘要
+
+每个文件用 ast 解析一次，得到：
+- 概要：模块说明、导入列表、类和函数签名、每个函数的圈复杂度、LLM 调用和文件读写调用的位置
+- 重点函数：按信号强度（LLM 调用、文件读写、复杂度）排序，在 body_tokens 预算内附上完整函数体；
+  函数以外的模块级代码（脚本式写法）作为 <module> 参与排序
+
+run_project.py 把摘要写入 run_results.json 的 source_digest，llm_evaluate.py 的各维度直接复用；
+source_hash 与 source_code 不一致（或旧版 run_results 没有摘要）时重新生成。
+无法解析的文件（语法错误）保留原文，由 prompt 预算截断。
+"""
+
+import ast
+import hashlib
+import json
+
+from prompt_budget import estimate_tokens
+
+DIGEST_VERSION = 1
+DEFAULT_BODY_TOKENS = 12000
+
+# 调用名（小写）包含这些片段时视为 LLM 调用
+LLM_CALL_HINTS = (
+    "chat.completions", "completions.create", "messages.create", "generate_content",
+    "openai", "deepseek", "anthropic", "llm",
+)
+# requests / httpx 的请求，所在函数中出现这些字样时视为 LLM 调用
+HTTP_CALLS = {"requests.post", "requests.get", "requests.request", "httpx.post", "httpx.get", "session.post", "client.post"}
+LLM_TEXT_HINTS = ("chat/completions", "api.deepseek.com", "api.openai.com", "api_key", "messages")
+
+FILE_IO_CALLS = {
+    "open", "json.load", "json.dump", "pickle.load", "pickle.dump", "yaml.safe_load", "yaml.load",
+    "yaml.dump", "yaml.safe_dump", "csv.reader", "csv.writer", "csv.DictReader", "csv.DictWriter",
+    "shutil.copy", "shutil.move", "os.remove", "os.makedirs",
+}
+FILE_IO_METHODS = {
+    "read_text", "write_text", "read_bytes", "write_bytes", "savefig", "to_csv", "to_json",
+    "to_excel", "to_parquet", "read_csv", "read_json", "read_excel", "unlink", "mkdir",
+}
+
+# 这些节点各增加一个判定分支
+_BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.ExceptHandler, ast.IfExp, ast.Assert)
+_SCOPE_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+
+def source_hash(code_files: dict) -> str:
+    """source_code 的内容哈希，用于判断缓存的摘要是否过期"""
+    data = json.dumps(code_files, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _walk_scope(node):
+    """遍历 node 的子孙节点，不进入嵌套的函数、类和 lambda（它们单独统计）"""
+    stack = list(ast.iter_child_nodes(node))
+    while stack:
+        child = stack.pop()
+        yield child
+        if not isinstance(child, _SCOPE_NODES):
+            stack.extend(ast.iter_child_nodes(child))
+
+
+def complexity(node) -> int:
+    """McCabe 圈复杂度：1 + 判定分支数（布尔运算每多一个操作数加 1）"""
+    score = 1
+    for child in _walk_scope(node):
+        if isinstance(child, _BRANCH_NODES):
+            score += 1
+        elif isinstance(child, ast.BoolOp):
+            score += len(child.values) - 1
+        elif isinstance(child, ast.comprehension):
+            score += 1 + len(child.ifs)
+        elif hasattr(ast, "match_case") and isinstance(child, ast.match_case):
+            score += 1
+    return score
+
+
+def _call_name(call) -> str:
+    """调用目标的点分名称，如 client.chat.completions.create；无法表示时为空串"""
+    parts = []
+    func = call.func
+    while isinstance(func, ast.Attribute):
+        parts.append(func.attr)
+        func = func.value
+    if isinstance(func, ast.Name):
+        parts.append(func.id)
+    elif isinstance(func, ast.Call):
+        # 链式调用：OpenAI(...).chat.completions.create
+        inner = _call_name(func)
+        if inner:
+            parts.append(inner + "()")
+    return ".".join(reversed(parts))
+
+
+def _is_llm_call(name: str, scope_text: str) -> bool:
+    lowered = name.lower()
+    if any(hint in lowered for hint in LLM_CALL_HINTS):
+        return True
+    return lowered in HTTP_CALLS and any(hint in scope_text for hint in LLM_TEXT_HINTS)
+
+
+def _is_file_io(name: str) -> bool:
+    return name in FILE_IO_CALLS or name.rsplit(".", 1)[-1] in FILE_IO_METHODS
+
+
+def call_sites(node, source: str) -> tuple:
+    """node 作用域内的 (LLM 调用, 文件读写调用)，各为 [{"line", "call"}]"""
+    if isinstance(node, ast.Module):
+        scope_text = source.lower()
+    else:
+        scope_text = (ast.get_source_segment(source, node) or source).lower()
+    llm_calls, file_io = [], []
+    for child in _walk_scope(node):
+        if not isinstance(child, ast.Call):
+            continue
+        name = _call_name(child)
+        if not name:
+            continue
+        if _is_llm_call(name, scope_text):
+            llm_calls.append({"line": child.lineno, "call": name})
+        elif _is_file_io(name):
+            file_io.append({"line": child.lineno, "call": name})
+    return llm_calls, file_io
+
+
+def _signature(node) -> str:
+    prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{prefix} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _first_line(docstring) -> str:
+    return docstring.strip().splitlines()[0][:200] if docstring and docstring.strip() else ""
+
+
+def _function_entry(node, qualname: str, source: str) -> dict:
+    llm_calls, file_io = call_sites(node, source)
+    return {
+        "qualname": qualname,
+        "signature": _signature(node),
+        "lineno": node.lineno,
+        "end_lineno": node.end_lineno,
+        "complexity": complexity(node),
+        "doc": _first_line(ast.get_docstring(node)),
+        "llm_calls": llm_calls,
+        "file_io": file_io,
+    }
+
+
+def _collect_functions(body, prefix: str, source: str, functions: list, classes: list, in_function=False):
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            qualname = prefix + node.name
+            entry = _function_entry(node, qualname, source)
+            if in_function:
+                entry["nested"] = True
+            functions.append(entry)
+            _collect_functions(node.body, qualname + ".", source, functions, classes, in_function=True)
+        elif isinstance(node, ast.ClassDef):
+            qualname = prefix + node.name
+            classes.append({
+                "qualname": qualname,
+                "bases": [ast.unparse(b) for b in node.bases],
+                "lineno": node.lineno,
+                "doc": _first_line(ast.get_docstring(node)),
+            })
+            _collect_functions(node.body, qualname + ".", source, functions, classes, in_function)
+
+
+def _imports(tree) -> list:
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            names.append("." * node.level + (node.module or ""))
+    return sorted(set(names))
+
+
+def _module_code(tree, source: str):
+    """函数和类定义以外的模块级语句（不含导入和模块说明），没有时返回 None"""
+    lines = source.splitlines()
+    body = tree.body
+    if body and isinstance(body[0], ast.Expr) and isinstance(getattr(body[0], "value", None), ast.Constant):
+        body = body[1:]
+    statements = [
+        node for node in body
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Import, ast.ImportFrom))
+    ]
+    if not statements:
+        return None
+    text = "\n".join("\n".join(lines[node.lineno - 1:node.end_lineno]) for node in statements)
+    module = ast.Module(body=statements, type_ignores=[])
+    llm_calls, file_io = call_sites(module, source)
+    return {
+        "qualname": "<module>",
+        "signature": "# 模块级代码",
+        "lineno": statements[0].lineno,
+        "end_lineno": statements[-1].end_lineno,
+        "complexity": complexity(module),
+        "doc": "",
+        "llm_calls": llm_calls,
+        "file_io": file_io,
+    }, text
+
+
+def digest_file(path: str, source: str) -> tuple:
+    """
+    解析一个文件，返回 (文件摘要, {qualname: 源码})；语法错误时文件摘要含 parse_error，源码为空
+    """
+    entry = {"path": path, "lines": source.count("\n") + 1}
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        entry["parse_error"] = f"{type(e).__name__}: {e}"
+        return entry, {}
+    functions, classes = [], []
+    _collect_functions(tree.body, "", source, functions, classes)
+    lines = source.splitlines()
+    bodies = {f["qualname"]: "\n".join(lines[f["lineno"] - 1:f["end_lineno"]]) for f in functions}
+    module = _module_code(tree, source)
+    if module:
+        functions.append(module[0])
+        bodies["<module>"] = module[1]
+    entry.update({
+        "doc": _first_line(ast.get_docstring(tree)),
+        "imports": _imports(tree),
+        "classes": classes,
+        "functions": functions,
+    })
+    return entry, bodies
+
+
+def signal_score(function: dict) -> int:
+    """函数的信号强度：LLM 调用 > 文件读写 > 复杂度；main 入口略微加权"""
+    score = 10 * len(function["llm_calls"]) + 3 * len(function["file_io"]) + function["complexity"]
+    if function["qualname"].rsplit(".", 1)[-1] in ("main", "<module>"):
+        score += 3
+    return score
+
+
+def build_digest(code_files: dict, body_tokens: int = DEFAULT_BODY_TOKENS) -> dict:
+    """
+    生成所有文件的摘要，并按信号强度在 body_tokens 预算内挑选完整函数体
+
+    返回可直接写入 JSON 的 dict：files 为各文件摘要，bodies 为挑中的函数体（按信号强度降序），
+    raw 为无法解析的文件原文
+    """
+    files, raw, candidates = [], {}, []
+    for path, source in code_files.items():
+        entry, bodies = digest_file(path, source)
+        files.append(entry)
+        if "parse_error" in entry:
+            raw[path] = source
+            continue
+        for function in entry["functions"]:
+            body = bodies[function["qualname"]]
+            # 嵌套函数已包含在外层函数体中，不单独入选
+            if function.get("nested"):
+                continue
+            candidates.append((signal_score(function), path, function, body))
+
+    selected, remaining = [], body_tokens
+    for score, path, function, body in sorted(candidates, key=lambda c: (-c[0], c[1], c[2]["lineno"])):
+        tokens = estimate_tokens(body)
+        if score <= 1 or tokens > remaining:
+            continue
+        selected.append({"path": path, "qualname": function["qualname"], "score": score, "source": body})
+        remaining -= tokens
+
+    return {
+        "version": DIGEST_VERSION,
+        "source_hash": source_hash(code_files),
+        "body_tokens": body_tokens,
+        "files": files,
+        "bodies": selected,
+        "raw": raw,
+    }
+
+
+def get_digest(run_results: dict) -> dict:
+    """run_results 中缓存的摘要；没有、版本不同或源代码已变化时重新生成并写回 run_results"""
+    code_files = run_results.get("source_code", {})
+    digest = run_results.get("source_digest")
+    if (
+        not isinstance(digest, dict)
+        or digest.get("version") != DIGEST_VERSION
+        or digest.get("source_hash") != source_hash(code_files)
+    ):
+        digest = build_digest(code_files)
+        run_results["source_digest"] = digest
+    return digest
+
+
+def _call_list(calls: list) -> str:
+    names = []
+    for call in calls:
+        if call["call"] not in names:
+            names.append(call["call"])
+    return ", ".join(names[:5])
+
+
+def format_outline(digest: dict) -> str:
+    """概要：每个文件的说明、导入、类和函数签名（带行号、复杂度、LLM/文件读写调用）"""
+    if not digest.get("files"):
+        return "无源代码文件"
+    lines = []
+    for entry in digest["files"]:
+        lines.append(f"=== {entry['path']}（{entry['lines']} 行）===")
+        if "parse_error" in entry:
+            lines.append(f"无法解析: {entry['parse_error']}")
+            lines.append("")
+            continue
+        if entry["doc"]:
+            lines.append(f"说明: {entry['doc']}")
+        if entry["imports"]:
+            lines.append(f"导入: {', '.join(entry['imports'])}")
+        items = [
+            (c["lineno"], c["qualname"], f"class {c['qualname'].rsplit('.', 1)[-1]}" + (f"({', '.join(c['bases'])})" if c["bases"] else ""), c)
+            for c in entry["classes"]
+        ]
+        items += [(f["lineno"], f["qualname"], f["signature"], f) for f in entry["functions"]]
+        for lineno, qualname, signature, item in sorted(items, key=lambda i: i[0]):
+            indent = "  " * qualname.count(".") if qualname != "<module>" else ""
+            notes = [f"L{lineno}"]
+            if "complexity" in item:
+                notes.append(f"复杂度 {item['complexity']}")
+                if item["llm_calls"]:
+                    notes.append(f"LLM 调用: {_call_list(item['llm_calls'])}")
+                if item["file_io"]:
+                    notes.append(f"文件读写: {_call_list(item['file_io'])}")
+            lines.append(f"{indent}{signature}  # {'，'.join(notes)}")
+            if item["doc"]:
+                lines.append(f"{indent}    \"{item['doc']}\"")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def format_bodies(digest: dict) -> str:
+    """重点函数的完整源码（按信号强度降序）和无法解析文件的原文"""
+    lines = []
+    for body in digest.get("bodies", []):
+        lines.append(f"=== {body['path']} :: {body['qualname']} ===")
+        lines.append(body["source"])
+        lines.append("")
+    for path, source in digest.get("raw", {}).items():
+        lines.append(f"=== {path}（无法解析，原文）===")
+        lines.append(source)
+        lines.append("")
+    return "\n".join(lines).rstrip() or "无"
+
+
+def format_file_summary(digest: dict) -> str:
+    """简短的文件摘要（用于文档一致性检查）：LLM/文件读写、函数和类"""
+    if not digest.get("files"):
+        return "无源代码文件"
+    lines = []
+    for entry in digest["files"]:
+        lines.append(f"### {entry['path']}")
+        if "parse_error" in entry:
+            lines.append(f"  - ⚠️ 无法解析: {entry['parse_error']}")
+            continue
+        functions = [f for f in entry["functions"] if f["qualname"] != "<module>"]
+        llm_calls = [c for f in entry["functions"] for c in f["llm_calls"]]
+        file_io = [c for f in entry["functions"] for c in f["file_io"]]
+        if llm_calls:
+            lines.append(f"  - ✅ 包含 LLM/API 调用: {_call_list(llm_calls)}")
+        if file_io:
+            lines.append(f"  - ✅ 包含文件读写操作: {_call_list(file_io)}")
+        if functions:
+            lines.append(f"  - 函数: {', '.join(f['qualname'] for f in functions[:10])}")
+        if entry["classes"]:
+            lines.append(f"  - 类: {', '.join(c['qualname'] for c in entry['classes'][:5])}")
+    return "\n".join(lines)